@@ -1,17 +1,22 @@
 # app.py
 # GUI：保留「開啟登入視窗」與 Cloudflare 等待；移除掃描，直接在每頁連續點擊符合條件的〔預定場地〕。
+# selenium / undetected_chromedriver（browser_cf、booking）改在視窗畫出後由背景執行緒載入，並預先修補 chromedriver。
+# 輪詢流程在 core.py（asyncio + driver 執行緒）；這裡只負責讀取畫面設定、啟動/停止與顯示日誌。
 
 import time
+_T_BOOT = time.perf_counter()
+
+import asyncio
+import os
 import threading
-from datetime import datetime, timedelta
 import tkinter as tk
 from tkinter import ttk, scrolledtext
 
-from browser_cf import BrowserManager, LOGIN_URL, wait_until_ready_with_cf, HOME_URL,ORDER_URL
-from booking import (
-    parse_dates, parse_time_hhmm, build_urls,
-    click_all_bookings_on_page
-)
+from core import BookingCore, RunConfig
+from slots import D2_BLOCKS, d2_label
+from logsink import LogSink
+
+LOG_FILE = os.path.join("logs", "run.jsonl")
 
 class App(tk.Tk):
     def __init__(self):
@@ -19,13 +24,18 @@ class App(tk.Tk):
         self.title("台北捷運場地半自動預約器（直接點擊版）")
         self.geometry("980x680")
 
-        self.browser = BrowserManager(profile_dir="uc_profile")
+        self.browser = None                  # 背景載入 browser_cf 後才建立（見 _prepare_core）
+        self._core_ready = threading.Event()
+        self.startup = {}                    # 冷啟動各段耗時（ms）
+        self.log_sink = LogSink(max_lines=2000)
         self.stop_flag = threading.Event()
         self.worker_thread = None
+        self.core = None                     # 執行中的 core.BookingCore
+        self._closing = None                 # 關閉中的背景執行緒（見 on_close）
 
         # 設定
         self.date_text = tk.StringVar()
-        self.d2_1 = tk.IntVar(); self.d2_2 = tk.IntVar(); self.d2_3 = tk.IntVar(); self.d2_4 = tk.IntVar()
+        self.d2_vars = {d2: tk.IntVar() for d2 in D2_BLOCKS}
         self.from_t = tk.StringVar(); self.to_t = tk.StringVar()
         self.court_a = tk.IntVar(); self.court_b = tk.IntVar(); self.court_c = tk.IntVar()
         self.start_mode = tk.StringVar(value="now")
@@ -35,8 +45,15 @@ class App(tk.Tk):
         self.cf_fail_retries = tk.StringVar(value="3")
         self.single_tab_mode = tk.IntVar(value=1)
         self.warmup_first   = tk.IntVar(value=1)
+        self.dialog_hook    = tk.IntVar(value=0)
+        self.lean_load      = tk.IntVar(value=0)
+        self.long_run       = tk.IntVar(value=0)
+        self.page_load      = tk.StringVar(value="eager")
+        self.record         = tk.IntVar(value=0)
+        self.log_to_file    = tk.IntVar(value=0)
 
         self._build_ui()
+        self.after_idle(self._on_window_shown)
 
     def _build_ui(self):
         pad = {'padx': 6, 'pady': 4}
@@ -51,12 +68,10 @@ class App(tk.Tk):
         ttk.Entry(row1, textvariable=self.date_text).pack(fill="x")
 
         row2 = ttk.Frame(self); row2.pack(fill="x", **pad)
-        ttk.Label(row2, text="選擇大時段（D2）：1=09-12、2=12-15、3=15-18、4=18-22").pack(anchor="w")
+        ttk.Label(row2, text="選擇大時段（D2）：" + "、".join(f"{d2}={d2_label(d2)}" for d2 in D2_BLOCKS)).pack(anchor="w")
         r2 = ttk.Frame(row2); r2.pack(anchor="w")
-        ttk.Checkbutton(r2, text="1 (09-12)", variable=self.d2_1).pack(side="left")
-        ttk.Checkbutton(r2, text="2 (12-15)", variable=self.d2_2).pack(side="left")
-        ttk.Checkbutton(r2, text="3 (15-18)", variable=self.d2_3).pack(side="left")
-        ttk.Checkbutton(r2, text="4 (18-22)", variable=self.d2_4).pack(side="left")
+        for d2, var in self.d2_vars.items():
+            ttk.Checkbutton(r2, text=f"{d2} ({d2_label(d2)})", variable=var).pack(side="left")
 
         row3 = ttk.Frame(self); row3.pack(fill="x", **pad)
         ttk.Label(row3, text="（可選）在大時段內再篩選 HH:MM 範圍（例如 19:00 → 21:00）").pack(anchor="w")
@@ -87,176 +102,186 @@ class App(tk.Tk):
         ttk.Entry(r5, width=4, textvariable=self.cf_fail_retries).pack(side="left", padx=(0,12))
         ttk.Checkbutton(r5, text="單分頁模式（避免多開）", variable=self.single_tab_mode).pack(side="left", padx=(12,0))
         ttk.Checkbutton(r5, text="先到首頁暖身", variable=self.warmup_first).pack(side="left")
+        ttk.Checkbutton(r5, text="頁內攔截對話框（整批點擊）", variable=self.dialog_hook).pack(side="left")
+        ttk.Checkbutton(r5, text="精簡載入（擋字型/照片/追蹤）", variable=self.lean_load).pack(side="left")
+        ttk.Checkbutton(r5, text="長時間模式（監控記憶體、回收分頁）", variable=self.long_run).pack(side="left")
+        ttk.Label(r5, text="載入策略").pack(side="left", padx=(8,0))
+        ttk.Combobox(r5, width=7, state="readonly", values=("normal", "eager", "none"),
+                     textvariable=self.page_load).pack(side="left")
 
         row6 = ttk.Frame(self); row6.pack(fill="x", **pad)
         ttk.Button(row6, text="開始", command=self.on_start).pack(side="left")
         ttk.Button(row6, text="停止", command=self.on_stop).pack(side="left", padx=8)
         ttk.Button(row6, text="關閉", command=self.on_close).pack(side="left")
+        ttk.Checkbutton(row6, text=f"寫入記錄檔（{LOG_FILE}）", variable=self.log_to_file).pack(side="left", padx=12)
+        ttk.Checkbutton(row6, text="錄製頁面（供 replay.py 重播）", variable=self.record).pack(side="left")
 
         self.logbox = scrolledtext.ScrolledText(self, height=22, wrap="word")
         self.logbox.pack(fill="both", expand=True, **pad)
+        self.log_sink.attach_tk(self, self.logbox)
         self._log("請先按『開啟登入視窗』→ 在 UC 瀏覽器登入；之後按『開始』。")
 
     # ---- Log ----
-    def _log(self, s: str):
-        ts = datetime.now().strftime("%H:%M:%S")
-        self.logbox.insert("end", f"[{ts}] {s}\n")
-        self.logbox.see("end")
-        self.update_idletasks()
+    def _log(self, s: str, **fields):
+        # 任何執行緒皆可呼叫：只放進佇列，由 Tk 執行緒批次寫入畫面（見 LogSink.attach_tk）
+        self.log_sink(s, **fields)
+    _log.structured = True
+
+    # ---- 啟動 ----
+    def _on_window_shown(self):
+        self.startup["window"] = (time.perf_counter() - _T_BOOT) * 1000
+        threading.Thread(target=self._prepare_core, daemon=True).start()
+
+    def _prepare_core(self):
+        """背景執行緒：載入 selenium/uc 相關模組、建立 BrowserManager、預先修補 chromedriver。"""
+        try:
+            t = time.perf_counter()
+            from browser_cf import BrowserManager
+            import booking  # noqa: F401  一併載入，按『開始』時不必再等
+            self.startup["import"] = (time.perf_counter() - t) * 1000
+            self.browser = BrowserManager(profile_dir="uc_profile")
+            self._log(f"⚙️ 視窗 {self.startup['window']:.0f} ms 顯示；瀏覽器模組載入 {self.startup['import']:.0f} ms，背景修補 chromedriver…")
+            if self.browser.prepare(log=self._log):
+                self._log(f"⚙️ chromedriver 已就緒（{self.browser.timings['patch']:.0f} ms）。")
+        except Exception as e:
+            self._log(f"⚠️ 背景載入瀏覽器模組失敗：{e}")
+        finally:
+            self._core_ready.set()
+
+    def _wait_core(self):
+        """等背景準備完成，回傳 BrowserManager。"""
+        if not self._core_ready.is_set():
+            self._log("⌛ 等待瀏覽器模組載入…")
+            self._core_ready.wait()
+        if self.browser is None:
+            raise RuntimeError("瀏覽器模組載入失敗，請檢查 selenium / undetected_chromedriver 安裝。")
+        return self.browser
+
+    def _startup_report(self) -> str:
+        t = dict(self.startup, **(self.browser.timings if self.browser else {}))
+        parts = [(k, label) for k, label in (("window", "視窗"), ("import", "匯入"), ("patch", "修補驅動"),
+                                             ("spawn", "Chrome 啟動"), ("first_nav", "首次導航")) if k in t]
+        return "⏱️ 冷啟動：" + "、".join(f"{label} {t[k]:.0f} ms" for k, label in parts)
+
+    def _first_launch_opts(self, browser):
+        """只在啟動瀏覽器時生效的設定（精簡載入的初始值、頁面載入策略）。"""
+        browser.lean_load = bool(self.lean_load.get())
+        browser.page_load_strategy = self.page_load.get()
 
     # ---- Buttons ----
     def on_open_login(self):
-        self.browser.launch(log=self._log, navigate_url=LOGIN_URL)
-        self._log("已開啟 UC 瀏覽器登入頁；請在該視窗完成登入/驗證。")
+        def _go():
+            try:
+                browser = self._wait_core()
+                from browser_cf import LOGIN_URL
+                first = browser.driver is None
+                browser.dialog_hook = bool(self.dialog_hook.get()) or browser.dialog_hook
+                if first: self._first_launch_opts(browser)
+                if first: self._log("🚀 啟動 UC 瀏覽器…")
+                browser.launch(log=self._log, navigate_url=LOGIN_URL)
+                if first: self._log(self._startup_report())
+                self._log("已開啟 UC 瀏覽器登入頁；請在該視窗完成登入/驗證。")
+            except Exception as e:
+                self._log(f"開啟瀏覽器失敗：{e}")
+        threading.Thread(target=_go, daemon=True).start()
 
     def on_open_orders(self):
         def _go():
-            drv = self.browser.launch(log=self._log, navigate_url=ORDER_URL)
-            self._log("前往『我的訂單』頁…")
-            # 簡單等一下 CF 自動驗證；失敗會自動回彈再試
-            wait_until_ready_with_cf(
-                drv, target_url=ORDER_URL, max_wait=120, max_fail_retries=2,
-                log=self._log, bounce_on_fail=True
-            )
+            try: browser = self._wait_core()
+            except Exception as e: self._log(str(e)); return
+            try:
+                from browser_cf import ORDER_URL, wait_until_ready_with_cf
+                if browser.driver is None: self._first_launch_opts(browser)
+                drv = browser.launch(log=self._log, navigate_url=ORDER_URL)
+                self._log("前往『我的訂單』頁…")
+                # 簡單等一下 CF 自動驗證；失敗會自動回彈再試
+                wait_until_ready_with_cf(
+                    drv, target_url=ORDER_URL, max_wait=120, max_fail_retries=2,
+                    log=self._log, bounce_on_fail=True
+                )
+            except Exception as e:
+                self._log(f"開啟訂單頁失敗：{e}")
         threading.Thread(target=_go, daemon=True).start()
-        
+
 
     def on_start(self):
+        if self._closing is not None:
+            return
         if self.worker_thread and self.worker_thread.is_alive():
             self._log("已有任務在跑，請先按【停止】。")
             return
         self.stop_flag.clear()
-        self.worker_thread = threading.Thread(target=self.worker, daemon=True)
+        if self.log_to_file.get():
+            self.log_sink.open_file(LOG_FILE)
+        try:
+            cfg = self._run_config()
+        except ValueError as e:
+            self._log(f"設定錯誤：{e}"); return
+        self.worker_thread = threading.Thread(target=self.worker, args=(cfg,), daemon=True)
         self.worker_thread.start()
 
+    def _run_config(self) -> RunConfig:
+        """在 Tk 執行緒讀取畫面上的設定（工作執行緒不碰 tk 變數）。"""
+        return RunConfig(
+            dates=[self.date_text.get()],
+            d2_list=[d2 for d2, var in self.d2_vars.items() if var.get()],
+            from_t=self.from_t.get(), to_t=self.to_t.get(),
+            courts="".join(c for c, var in (("A", self.court_a), ("B", self.court_b), ("C", self.court_c)) if var.get()),
+            interval=float(self.interval.get() or "0.5"),
+            max_wait_min=float(self.max_wait_min.get() or "8"),
+            cf_fail_retries=int(self.cf_fail_retries.get() or "3"),
+            single_tab=bool(self.single_tab_mode.get()),
+            warmup=bool(self.warmup_first.get()),
+            dialog_hook=bool(self.dialog_hook.get()),
+            start_at=self.start_time.get() if self.start_mode.get() == "at" else None,
+            lean_load=bool(self.lean_load.get()),
+            long_run=bool(self.long_run.get()),
+            record=bool(self.record.get()) or None,
+        )
+
     def on_stop(self):
         self.stop_flag.set()
+        if self.core is not None:
+            self.core.stop()
         self._log("已要求停止…")
 
     def on_close(self):
+        # 關閉瀏覽器、等 driver 執行緒閒置可能要數秒：交給背景執行緒，Tk 執行緒以 after() 輪詢，完成後才 destroy
+        if self._closing is not None:
+            return
         self.stop_flag.set()
+        self._log("關閉中…")
+        self._closing = threading.Thread(target=self._shutdown, daemon=True)
+        self._closing.start()
+        self._poll_close()
+
+    def _shutdown(self):
+        """背景執行緒：停止核心並關閉 Chrome。"""
+        try:
+            if self.core is not None:
+                self.core.close(quit_browser=True, timeout=3.0)
+            elif self.browser is not None:
+                self.browser.quit()
+        except Exception as e:
+            self._log(f"⚠️ 關閉瀏覽器失敗：{e}")
+
+    def _poll_close(self):
+        if self._closing.is_alive():
+            self.after(50, self._poll_close)
+            return
+        self.log_sink.pump(limit=10**6)   # 把剩下的紀錄寫進檔案
+        self.log_sink.close_file()
         self.destroy()
 
     # ---- Worker ----
-    def worker(self):
+    def worker(self, cfg: RunConfig):
+        """工作執行緒：等瀏覽器模組就緒後，在自己的 asyncio 事件迴圈上跑 core.BookingCore。"""
         try:
-            drv = self.browser.ensure_launched(log=self._log)
-
-            dates = parse_dates(self.date_text.get())
-            if not dates: self._log("請輸入至少一個日期。"); return
-            d2_list = []
-            if self.d2_1.get(): d2_list.append(1)
-            if self.d2_2.get(): d2_list.append(2)
-            if self.d2_3.get(): d2_list.append(3)
-            if self.d2_4.get(): d2_list.append(4)
-            if not d2_list: self._log("請至少勾選一個大時段（D2）。"); return
-
-            from_t = parse_time_hhmm(self.from_t.get()) if self.from_t.get().strip() else None
-            to_t   = parse_time_hhmm(self.to_t.get())   if self.to_t.get().strip()   else None
-            want_A, want_B, want_C = bool(self.court_a.get()), bool(self.court_b.get()), bool(self.court_c.get())
-            interval = float(self.interval.get() or "0.5")
-            max_wait_min = float(self.max_wait_min.get() or "8")
-            cf_fail_retries = int(self.cf_fail_retries.get() or "3")
-            single_tab = bool(self.single_tab_mode.get())
-            warmup = bool(self.warmup_first.get())
-
-            urls = build_urls(dates, d2_list)
-            self._log(f"目標頁面 {len(urls)} 個：")
-            for u in urls: self._log(f"  {u}")
-
-            # 定時啟動
-            if self.start_mode.get() == "at":
-                now = datetime.now()
-                try: hh, mm, ss = map(int, self.start_time.get().split(":"))
-                except Exception: self._log("指定時間格式錯誤，請用 HH:MM:SS"); return
-                start_dt = now.replace(hour=hh, minute=mm, second=ss, microsecond=0)
-                if start_dt <= now: start_dt += timedelta(days=1)
-                self._log(f"等待至 {start_dt:%Y-%m-%d %H:%M:%S} 開始…")
-                while not self.stop_flag.is_set() and datetime.now() < start_dt:
-                    time.sleep(0.2)
-
-            if single_tab:
-                # 可先暖身一次
-                if warmup:
-                    drv.get(HOME_URL)
-                    wait_until_ready_with_cf(drv, target_url=HOME_URL, max_wait=180, max_fail_retries=cf_fail_retries, log=self._log, bounce_on_fail=False)
-                    time.sleep(0.4)
-
-                deadline = datetime.now() + timedelta(minutes=max_wait_min)
-                round_id = 0
-                total_clicks = 0
-
-                while not self.stop_flag.is_set() and datetime.now() < deadline:
-                    round_id += 1
-                    self._log(f"=== 單分頁輪詢第 {round_id} 回合 ===")
-                    for url in urls:
-                        if self.stop_flag.is_set(): break
-                        drv.get(url)
-                        ok = wait_until_ready_with_cf(drv, target_url=url, max_wait=240, max_fail_retries=cf_fail_retries, log=self._log, bounce_on_fail=True)
-                        if not ok: 
-                            self._log("  此頁仍未就緒，跳過。")
-                            continue
-
-                        clicked = click_all_bookings_on_page(    drv, from_t, to_t, want_A, want_B, want_C,    log_fn=self._log, max_click=999, cf_fail_retries=cf_fail_retries)
-                        if clicked > 0:
-                            total_clicks += clicked
-                    time.sleep(interval)
-
-                self._log(f"完成。此次總點擊 {total_clicks} 筆。")
-
-            else:
-                # 多分頁（保守刷新）
-                tab_ready = {}; tab_last_check = {}
-                for idx, url in enumerate(urls):
-                    if self.stop_flag.is_set(): return
-                    if idx == 0: drv.get(url)
-                    else:
-                        drv.switch_to.new_window('tab')
-                        drv.get(url)
-                    ok = wait_until_ready_with_cf(drv, target_url=url, max_wait=240, max_fail_retries=cf_fail_retries, log=self._log, bounce_on_fail=True)
-                    h = drv.current_window_handle
-                    tab_ready[h] = ok; tab_last_check[h] = time.time()
-                    if not ok: self._log("此分頁等待驗證/載入逾時，稍後輪詢再試。")
-
-                deadline = datetime.now() + timedelta(minutes=max_wait_min)
-                round_id = 0
-                total_clicks = 0
-                stale_sec = 25
-
-                while not self.stop_flag.is_set() and datetime.now() < deadline:
-                    round_id += 1
-                    self._log(f"=== 多分頁輪詢第 {round_id} 回合 ===")
-                    for h in list(drv.window_handles):
-                        if self.stop_flag.is_set(): break
-                        try: drv.switch_to.window(h)
-                        except Exception: continue
-
-                        now_ts = time.time()
-                        if not tab_ready.get(h, False):
-                            ok = wait_until_ready_with_cf(drv, target_url=drv.current_url, max_wait=240, max_fail_retries=cf_fail_retries, log=self._log, bounce_on_fail=True)
-                            tab_ready[h] = ok; tab_last_check[h] = now_ts
-                            if not ok: self._log("  仍未通過驗證/載入，留待下輪。"); continue
-
-                        clicked = click_all_bookings_on_page(drv, from_t, to_t, want_A, want_B, want_C, log_fn=self._log, max_click=999)
-                        if clicked > 0:
-                            total_clicks += clicked
-                            tab_last_check[h] = now_ts
-                            continue
-
-                        if now_ts - tab_last_check.get(h, 0) > stale_sec:
-                            try: drv.refresh()
-                            except Exception: pass
-                            ok = wait_until_ready_with_cf(drv, target_url=drv.current_url, max_wait=240, max_fail_retries=cf_fail_retries, log=self._log, bounce_on_fail=True)
-                            tab_ready[h] = ok; tab_last_check[h] = time.time()
-
-                    time.sleep(interval)
-
-                self._log(f"完成。此次總點擊 {total_clicks} 筆。")
-
+            browser = self._wait_core()
         except Exception as e:
-            self._log(f"程式錯誤：{e}")
-        finally:
-            self._log("任務結束。")
+            self._log(f"程式錯誤：{e}"); return
+        self.core = BookingCore(browser, cfg, log=self.log_sink, stop_flag=self.stop_flag)
+        asyncio.run(self.core.run())
 
 if __name__ == "__main__":
     App().mainloop()
@@ -0,0 +1,61 @@
+# bench/bench_cf_probe.py
+# Cloudflare 狀態偵測微基準：舊版逐條 XPath（get_cf_state_xpath）vs 單次 JS 探測（probe_page）
+#
+#   python bench/bench_cf_probe.py                 # 使用 bench/pages/*.html
+#   python bench/bench_cf_probe.py -n 200 my.html  # 另外加入自己存下的頁面
+#
+# 以無頭 Chrome 開啟本機檔案（file://），每頁各呼叫 N 次，列出每次呼叫的中位數/平均毫秒與判斷結果。
+
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from browser_cf import get_cf_state_xpath, probe_page  # noqa: E402
+
+
+def _make_driver():
+    from selenium import webdriver
+    opts = webdriver.ChromeOptions()
+    opts.add_argument("--headless=new")
+    opts.add_argument("--disable-gpu")
+    return webdriver.Chrome(options=opts)
+
+def _time_calls(fn, n):
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Cloudflare 狀態偵測微基準")
+    ap.add_argument("pages", nargs="*", help="額外的存檔頁面（.html）")
+    ap.add_argument("-n", type=int, default=50, help="每頁每種實作呼叫次數")
+    args = ap.parse_args(argv)
+
+    pages = sorted(glob.glob(os.path.join(HERE, "pages", "*.html"))) + args.pages
+    drv = _make_driver()
+    try:
+        print(f"{'頁面':<16}{'XPath 結果':>10}{'中位 ms':>10}{'平均 ms':>10}  |{'探測結果':>10}{'中位 ms':>10}{'平均 ms':>10}{'加速':>8}")
+        for path in pages:
+            drv.get("file://" + os.path.abspath(path))
+            old_state = get_cf_state_xpath(drv)
+            new_state = probe_page(drv)["state"]
+            old = _time_calls(lambda: get_cf_state_xpath(drv), args.n)
+            new = _time_calls(lambda: probe_page(drv), args.n)
+            o_med, n_med = statistics.median(old), statistics.median(new)
+            flag = "" if old_state == new_state else "  ⚠️ 判斷不一致"
+            print(f"{os.path.basename(path):<16}{old_state:>10}{o_med:>10.2f}{statistics.mean(old):>10.2f}  |"
+                  f"{new_state:>10}{n_med:>10.2f}{statistics.mean(new):>10.2f}{o_med / n_med if n_med else 0:>7.1f}x{flag}")
+    finally:
+        drv.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# bench/bench_fake_driver.py
+# 不開瀏覽器的流程基準：跑 tests/test_flow.py 的各個情境（同樣的結果檢查），列出量到的數字
+# （流程開銷、每頁 WebDriver 往返次數、多分頁切換次數、停止延遲）。回歸檢查請用 python -m pytest -q。
+#
+#   python bench/bench_fake_driver.py              # 預設每次呼叫 0 ms 與 2 ms 延遲各跑一遍
+#   python bench/bench_fake_driver.py --latency 5 --pages 8
+
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from booking import CLICK_POLICY  # noqa: E402
+from tests.test_flow import (LATENCIES, PAGES, run_click, run_replay, run_round, run_stop,  # noqa: E402
+                             run_tabs, run_wait)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="不開瀏覽器的流程基準（FakeDriver）")
+    ap.add_argument("--latency", type=float, action="append", help="每次 WebDriver 呼叫延遲 ms（可重複）")
+    ap.add_argument("--pages", type=int, default=PAGES, help="每個情境的頁數")
+    args = ap.parse_args(argv)
+    CLICK_POLICY.outcome_timeout = 0.2      # 假站點擊後立即有結果；縮短「沒有對話框」時的等待
+    for lat in args.latency or LATENCIES:
+        print(f"每次呼叫延遲 {lat:g} ms：")
+        r = run_wait(lat)
+        print(f"  wait_until_ready_with_cf（60 ms 驗證頁）：{r['ms']:.1f} ms，往返 {r['round_trips']} 次")
+        for hook in (False, True):
+            r = run_click(lat, args.pages, hook)
+            mode = "整批（攔截器）" if hook else "逐顆"
+            print(f"  click_all_bookings_on_page {mode:<8}：{r['pages']} 頁，平均 {r['ms']:.1f} ms/頁，"
+                  f"往返 {r['round_trips']:.1f} 次/頁")
+        r = run_round(lat, args.pages)
+        print(f"  單分頁回合：{r['pages']} 頁 {r['ms']:.1f} ms（{r['ms'] / r['pages']:.1f} ms/頁），點擊 {r['clicks']} 次，"
+              f"往返 {r['round_trips']} 次（{r['round_trips'] / r['pages']:.1f} 次/頁）")
+        r = run_tabs(lat, args.pages)
+        print(f"  多分頁 {r['pages']} 頁約 1 秒：逐一切換 {r['switches']} 次 → 背景查詢 {r['switches_bg']} 次"
+              f"（省下 {r['avoided']} 次），點擊 {r['clicks']} 次")
+        for hook in (False, True):
+            r = run_replay(lat, hook)
+            print(f"  錄製→重播（{'整批' if hook else '逐顆'}）：{r['pages']} 頁（表格未變 {r['same']} 頁），"
+                  f"決策一致；重播 {r['click_ms'] / r['pages']:.2f} ms/頁、往返 {r['round_trips'] / r['pages']:.1f} 次/頁")
+        r = run_stop(lat)
+        print(f"  停止（驗證頁等待中）：停止→取消 {r['cancel_ms']:.1f} ms，停止→閒置 {r['idle_ms']:.1f} ms")
+    print("全部檢查通過。")
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,19 @@
 
 import re
 import time
-from typing import List
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 from dateutil import parser as dtparser
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.alert import Alert
-from browser_cf import wait_until_ready_with_cf  # 用來回彈等待 CF
+from selenium.common.exceptions import UnexpectedAlertPresentException
+from budget import Budget
+from browser_cf import SITE_ROOT, Driver, drain_dialogs, wait_until_ready_with_cf  # 用來回彈等待 CF
+from logsink import emit
+from recorder import capture_page, record, recording
+from slots import Slot, SlotFilter, court_letter, url_params
+from tracing import span, traced
 
 BASE_URL = (
-    "https://resortbooking.metro.taipei/MT02.aspx"
+    SITE_ROOT + "/MT02.aspx"
     "?module=net_booking&files=booking_place&StepFlag=2&PT=1&D={date}&D2={d2}"
 )
 
@@ -34,253 +38,521 @@ def parse_time_hhmm(x):
     if not (0 <= hh <= 23 and 0 <= mm <= 59): raise ValueError("時間超出 00:00~23:59")
     return f"{hh:02d}:{mm:02d}"
 
-def build_urls(dates, d2_list):
-    return [BASE_URL.format(date=d, d2=d2) for d in dates for d2 in d2_list]
+def build_urls(dates, d2_list, flt: Optional[SlotFilter] = None):
+    """日期、D2 去重（保留順序）；給 flt 時略過與其時間範圍不可能相交的大時段（見 slots.D2_BLOCKS）。"""
+    d2s = [d2 for d2 in dict.fromkeys(d2_list) if flt is None or flt.overlaps_d2(d2)]
+    return [BASE_URL.format(date=d, d2=d2) for d in dict.fromkeys(dates) for d2 in d2s]
 
 # --------- 表格解析 & 點擊 ---------
 
 
-# booking.py —— 直接點擊 PlaceBtn / place01.png 版
-
-
-TIME_RANGE_RE = re.compile(r'([01]?\d|2[0-3]):[0-5]\d\s*[~～]\s*([01]?\d|2[0-3]):[0-5]\d')
-START_TIME_RE = re.compile(r'([01]?\d|2[0-3]):[0-5]\d')
-
-def _txt(el):
+# ====== 一次往返的可預約格快照（取代逐顆 find_element 的 WebDriver 往返） ======
+# 頁內版的 slots.iter_slots() + SlotFilter.matches()：時間 rowspan 帶入、場地代號精確比對、分鐘整數比較，
+# 只把「可預約且符合篩選」的按鈕傳回。規則修改時需與 slots.py 一起改（tests/test_browser_js.py 會比對兩邊結果）。
+# 先以場地圖片的 onclick/src/name 算出表格指紋（FNV-1a）；與 arguments[3] 相同就直接回報 same，不掃描、不傳回元素。
+# 有變化時另外傳回全部可預約格 all（[時間, 場地, a, b]），供 Python 端列出新增/消失的格子。
+# closed：頁面文字含「未開放」（尚未開放預約），排程器不對這種頁面拉長重訪週期。
+_MATCH_JS = r"""
+const fromMin = arguments[0], toMin = arguments[1], courts = arguments[2] || '', prevFp = arguments[3] || null;
+const SEL = 'img[onclick*="Step3Action"], img[name="PlaceBtn"], img[src*="place0" i]';
+const timeRe = /([01]?\d|2[0-3]):([0-5]\d)/;
+const stepRe = /Step3Action\((\d+)\s*,\s*(\d+)\)/;
+const letterRe = /(?<![A-Za-z])([A-Z])(?![A-Za-z])/;
+const norm = (c) => (c.textContent || '').replace(/\s+/g, ' ').trim();
+const pageImgs = document.querySelectorAll(SEL);
+let h = 0x811c9dc5;
+for (const img of pageImgs) {
+  const s = (img.getAttribute('onclick') || '') + '|' + (img.getAttribute('src') || '') + '|' + (img.getAttribute('name') || '') + ';';
+  for (let i = 0; i < s.length; i++) { h ^= s.charCodeAt(i); h = Math.imul(h, 0x01000193) >>> 0; }
+}
+const fp = pageImgs.length + ':' + h.toString(16);
+const closed = (document.documentElement.textContent || '').includes('未開放');
+if (prevFp && fp === prevFp) return {url: location.href, fp: fp, same: true, closed: closed};
+const tables = new Set();
+for (const img of pageImgs) { const t = img.closest('table'); if (t) tables.add(t); }
+const out = [], all = [];
+let total = 0;
+for (const table of tables) {
+  let carry = null, carryLeft = 0;
+  for (const tr of table.rows) {
+    const cells = Array.from(tr.cells);
+    if (!cells.length) continue;
+    let t = null, tMin = null;
+    const m0 = timeRe.exec(norm(cells[0]));
+    if (m0) { t = carry = m0[0]; carryLeft = Math.max((cells[0].rowSpan || 1) - 1, 0); }
+    else if (carryLeft > 0) { t = carry; carryLeft--; }
+    const imgs = Array.from(tr.querySelectorAll(SEL)).filter((img) => {
+      if (img.closest('tr') !== tr) return false;
+      const oc = img.getAttribute('onclick') || '';
+      const src = (img.getAttribute('src') || '').toLowerCase();
+      return oc.includes('Step3Action') && (img.getAttribute('name') === 'PlaceBtn' || src.includes('place01'));
+    });
+    if (!imgs.length) continue;
+    total += imgs.length;
+    let court = '';
+    for (const c of cells) {
+      if (c.querySelector('img')) continue;
+      const s = norm(c);
+      if (s.includes('羽球') || letterRe.test(s)) { court = s; break; }
+    }
+    if (!court && cells.length >= 2) court = norm(cells[1]);
+    const ids = imgs.map((img) => stepRe.exec(img.getAttribute('onclick') || '') || [null, null, null]);
+    for (const m of ids) all.push([t, court, m[1], m[2]]);
+    if (t) { const mt = timeRe.exec(t); tMin = parseInt(mt[1], 10) * 60 + parseInt(mt[2], 10); }
+    if (tMin !== null && ((fromMin !== null && tMin < fromMin) || (toMin !== null && tMin > toMin))) continue;
+    if (courts) { const L = letterRe.exec(court); if (!L || !courts.includes(L[1])) continue; }
+    imgs.forEach((img, i) => out.push([img, t, court, ids[i][1], ids[i][2]]));
+  }
+}
+return {url: location.href, fp: fp, same: false, closed: closed, total: total, slots: out, all: all};
+"""
+
+class PageSnapshot(NamedTuple):
+    slots: List[Tuple[Slot, object]]   # 符合篩選的 (Slot, WebElement)
+    total: int                         # 全頁可預約數（same 時為 0，沿用上次）
+    fp: Optional[str]                  # 表格指紋
+    same: bool                         # 指紋與 prev_fp 相同，未掃描
+    bookable: List[Slot]               # 全頁可預約格（不論篩選）
+    closed: bool = False               # 頁面顯示尚未開放
+
+def snapshot_page(driver: Driver, flt: Optional[SlotFilter] = None, prev_fp: Optional[str] = None) -> PageSnapshot:
+    """
+    一次 execute_script 在頁內算指紋並套用篩選；只有符合 flt 的按鈕會傳回，WebElement 隨同一次回應帶回，點擊不需再定位。
+    prev_fp 與目前指紋相同時不掃描（same=True）。
+    """
+    flt = flt or SlotFilter()
     try:
-        return (el.text or '').strip()
+        snap = driver.execute_script(_MATCH_JS, *flt.js_args(), prev_fp) or {}
     except Exception:
-        return ''
+        return PageSnapshot([], 0, None, False, [])
+    return snapshot_from(snap)
 
-def _find_placebtn_imgs(driver):
-    # 只抓藍色可預約鈕（place01.png）或有 name=PlaceBtn，且 onclick 內含 Step3Action
-    xp = ("//img[contains(@onclick,'Step3Action') and ("
-          "@name='PlaceBtn' or contains(translate(@src,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'place01'))]")
-    return driver.find_elements(By.XPATH, xp)
+def snapshot_from(snap: dict) -> PageSnapshot:
+    """把 _MATCH_JS 的回傳值轉成 PageSnapshot（背景分頁經 devtools 取得時，元素欄位為 None）。"""
+    if snap.get("same"):
+        return PageSnapshot([], 0, snap.get("fp"), True, [], bool(snap.get("closed")))
+    date, d2 = url_params(snap.get("url"))
+    out = [(Slot(date, d2, t, court or "", a, b, True), el) for el, t, court, a, b in snap.get("slots") or []]
+    bookable = [Slot(date, d2, t, court or "", a, b, True) for t, court, a, b in snap.get("all") or []]
+    return PageSnapshot(out, int(snap.get("total") or 0), snap.get("fp"), False, bookable, bool(snap.get("closed")))
 
-def _find_start_time_from_row_or_above(row):
-    # 1) 先看本列第一格；2) 若沒時間（因 rowSpan 在上一列），往上找最近一列的第一格
-    try:
-        td1 = row.find_element(By.XPATH, "./td[1]")
-        m = START_TIME_RE.search(_txt(td1))
-        if m: return m.group(0)
-    except Exception:
-        pass
-    try:
-        prevs = row.find_elements(By.XPATH, "preceding-sibling::tr")
-        for pr in reversed(prevs[-6:]):         # 回看最多 6 列就夠了（A/B/C 組）
-            try:
-                td1 = pr.find_element(By.XPATH, "./td[1]")
-                m = START_TIME_RE.search(_txt(td1))
-                if m: return m.group(0)
-            except Exception:
-                continue
-    except Exception:
-        pass
-    return None
+def snapshot_bookable_slots(driver: Driver, flt: Optional[SlotFilter] = None) -> Tuple[List[Tuple[Slot, object]], int]:
+    """回傳 ([(Slot, WebElement)], 全頁可預約數)；見 snapshot_page。"""
+    snap = snapshot_page(driver, flt)
+    return snap.slots, snap.total
 
-def _find_court_from_row(row):
-    # 優先找包含「羽球」或 A/B/C 的格（且不是圖片的操作欄）
-    try:
-        cells = row.find_elements(By.XPATH, "./td")
-        for c in cells:
-            if c.find_elements(By.XPATH, ".//img"):   # 跳過操作欄
-                continue
-            t = _txt(c)
-            if ('羽球' in t) or any(x in t for x in ('A','B','C')):
-                return t
-        if len(cells) >= 2:
-            return _txt(cells[1])
-    except Exception:
-        pass
-    return ""
 
-def _handle_confirms(driver, sleep_s=0.05):
-    # 1) JS alert/confirm
-    try:
-        a = Alert(driver)
-        _ = a.text
-        a.accept()
-        time.sleep(sleep_s)
-        return True
-    except Exception:
-        pass
-    # 2) SweetAlert2（驗證失敗等）
-    try:
-        btns = driver.find_elements(By.CSS_SELECTOR, ".swal2-container .swal2-confirm")
-        if btns:
-            btns[0].click()
-            time.sleep(sleep_s)
-            return True
-    except Exception:
-        pass
-    return False
+class PageFingerprints:
+    """
+    每個頁面（單分頁用網址、多分頁用分頁 handle）上次快照的指紋與可預約格。
+    上次沒有符合的按鈕、這次指紋又相同 → 略過掃描；有變化時列出新增/消失的格子（開放時刻的訊號）。
+    """
+
+    def __init__(self):
+        self.pages: Dict[str, Tuple[str, int, int, Dict[Tuple, Slot]]] = {}   # key → (fp, total, matched, {(a,b): Slot})
+        self.scans = 0
+        self.skipped = 0
+
+    def prev_fp(self, key: Optional[str]) -> Optional[str]:
+        entry = self.pages.get(key) if key else None
+        return entry[0] if entry and entry[2] == 0 else None
+
+    def last_total(self, key: str) -> int:
+        entry = self.pages.get(key)
+        return entry[1] if entry else 0
+
+    def move(self, old: str, new: str) -> None:
+        """分頁回收後（handle 改變）沿用原本的指紋與可預約格。"""
+        if old in self.pages:
+            self.pages[new] = self.pages.pop(old)
+
+    def update(self, key: str, snap: PageSnapshot, matched: Optional[int] = None) -> Tuple[List[Slot], List[Slot]]:
+        """
+        記錄新快照，回傳 (新增, 消失) 的可預約格；第一次看到此頁回傳兩個空清單。
+        matched：還需要點的符合數（扣掉已點過的），預設為快照的符合數。
+        """
+        cur = {(s.time, s.court, s.a, s.b): s for s in snap.bookable}
+        old = self.pages.get(key)
+        self.pages[key] = (snap.fp, snap.total, len(snap.slots) if matched is None else matched, cur)
+        if old is None:
+            return [], []
+        return [s for k, s in cur.items() if k not in old[3]], [s for k, s in old[3].items() if k not in cur]
+
+PAGE_FPS = PageFingerprints()
+
+def record_snapshot(page_key: Optional[str], snap: PageSnapshot, matched: int, log_fn=None) -> None:
+    """把快照記進 PAGE_FPS，並列出與上次相比新增/消失的格子。"""
+    if not page_key or not snap.fp:
+        return
+    added, removed = PAGE_FPS.update(page_key, snap, matched=matched)
+    if added:
+        emit(log_fn, f"  🆕 +{len(added)} 格：{_slot_list(added)}", phase="diff", added=len(added))
+    if removed:
+        emit(log_fn, f"  ➖ -{len(removed)} 格：{_slot_list(removed)}", phase="diff", removed=len(removed))
+
+def _slot_list(slots: List[Slot], limit: int = 8) -> str:
+    txt = "、".join(f"{s.time or '?'} {court_letter(s.court) or s.court or '?'}" for s in slots[:limit])
+    return txt + (f" 等 {len(slots)} 格" if len(slots) > limit else "")
+
+
+# ====== 點擊後的條件等待（取代固定 sleep） ======
+class ClickPolicy:
+    """
+    點擊流程的時間上限（秒）。不再固定 sleep：條件一成立就往下走，只有條件遲遲不成立時才會等到上限。
+      outcome_timeout : 點擊後等待結果（confirm/alert、SweetAlert2、頁面跳轉）的上限
+      poll_s          : 等待結果時的探測間隔
+      human_delay     : 點擊前的人為延遲（舊版固定 0.12；預設 0 = 不等）
+      bounce_max_wait : 驗證失敗回彈後等待 Cloudflare 的上限
+    """
+
+    def __init__(self, outcome_timeout: float = 2.0, poll_s: float = 0.02,
+                 human_delay: float = 0.0, bounce_max_wait: float = 240):
+        self.outcome_timeout = outcome_timeout
+        self.poll_s = poll_s
+        self.human_delay = human_delay
+        self.bounce_max_wait = bounce_max_wait
+
+CLICK_POLICY = ClickPolicy()
+
+# 點擊前：捲到畫面中央並在 window 留下記號；記號消失 = 頁面已跳轉
+_PRE_CLICK_JS = "arguments[0].scrollIntoView({block:'center'}); window.__bkClickTok = arguments[1];"
+
+# 點擊後：一次往返檢查 SweetAlert2（有內容就讀字並按「確定」）與是否已跳轉
+_OUTCOME_JS = r"""
+const c = document.querySelector('.swal2-container:not([data-bk-seen])');
+if (c) {
+  const text = Array.from(c.querySelectorAll('.swal2-title, .swal2-html-container'))
+    .map((e) => (e.textContent || '').trim()).join(' ').trim();
+  if (text) {
+    c.setAttribute('data-bk-seen', '1');
+    const btn = c.querySelector('.swal2-confirm');
+    if (btn) btn.click();
+    return {dialog: 'swal', text: text, nav: false};
+  }
+}
+return {dialog: null, text: '', nav: window.__bkClickTok !== arguments[0]};
+"""
+
+def _classify_dialog(text: str) -> str:
+    """對話框文字 → 'cf_fail'（驗證失敗/請重新驗證）或 'ok'。"""
+    lower = (text or "").lower()
+    if ("驗證失敗" in text) or ("重新驗證" in text) or ("verification failed" in lower):
+        return 'cf_fail'
+    return 'ok'
 
 # ====== 取代原本的 handle_any_confirm_popup，改為能辨識「驗證失敗」 ======
-def _handle_confirm_and_detect_cf_fail(driver, timeout=3.0):
+@traced("confirm")
+def _handle_confirm_and_detect_cf_fail(driver, timeout=3.0, token=None, poll_s=None):
     """
+    點擊後依實際條件等待，最多 timeout 秒：
+      1) 原生 confirm/alert（onclick 同步跳出）→ 接受後繼續等伺服器回應
+      2) SweetAlert2 出現 → 讀字判斷並按「確定」
+      3) 頁面已跳轉（token 記號消失）→ 視為完成
     回傳:
-      'ok'       : 已接受一般 confirm/alert 或無阻礙
+      'ok'       : 出現伺服器回應的提示（SweetAlert2 或原生 alert；成功或一般失敗）
+      'nav'      : 點擊後頁面已跳轉（後續按鈕需重新定位）
       'cf_fail'  : 偵測到 SweetAlert/訊息包含「驗證失敗/請重新驗證」
+      'sent'     : 已接受 confirm，但逾時前沒看到伺服器回應
       'none'     : 沒看到任何可處理的對話框
     """
-    t0 = time.time()
+    poll_s = CLICK_POLICY.poll_s if poll_s is None else poll_s
+    deadline = time.perf_counter() + timeout
+    status = 'none'
 
-    # 1) JS alert/confirm
+    # 1) JS alert/confirm：onclick 內的 confirm 在 click 回傳時就已開啟
     try:
-        a = Alert(driver)
-        _ = a.text  # 讀一次避免 NoAlertPresent
+        a = driver.switch_to.alert   # 沒有對話框時拋 NoAlertPresentException（一次往返）
         a.accept()
-        return 'ok'
+        status = 'sent'
     except Exception:
         pass
 
-    # 2) SweetAlert2 之類的彈窗
-    try:
-        # 讀取標題或內容
-        title_elems = driver.find_elements(By.CSS_SELECTOR, ".swal2-title")
-        html_elems  = driver.find_elements(By.CSS_SELECTOR, ".swal2-html-container")
-        text_all = " ".join([e.text for e in title_elems + html_elems]).strip()
-
-        if text_all:
-            lower = text_all.lower()
-            if ("驗證失敗" in text_all) or ("重新驗證" in text_all) or ("verification failed" in lower):
-                # 點「確定」把彈窗關掉
-                btns = driver.find_elements(By.CSS_SELECTOR, ".swal2-container .swal2-confirm")
-                if btns: btns[0].click()
-                return 'cf_fail'
-
-        # 若只是一般提示，也把「確定」按掉
-        btns = driver.find_elements(By.CSS_SELECTOR, ".swal2-container .swal2-confirm")
-        if btns:
-            btns[0].click()
-            return 'ok'
-    except Exception:
-        pass
+    # 2) 等 SweetAlert2 / 跳轉（每輪一次往返）
+    while True:
+        try:
+            r = driver.execute_script(_OUTCOME_JS, token) or {}
+        except UnexpectedAlertPresentException as e:
+            # 伺服器回應改用原生 alert（已被 WebDriver 關閉），直接用其文字判斷
+            return _classify_dialog(getattr(e, "alert_text", "") or "")
+        except Exception:
+            r = {}
+        if r.get("dialog") == "swal":
+            return _classify_dialog(r.get("text") or "")
+        if r.get("nav") and token is not None:
+            return 'nav'
+        if time.perf_counter() >= deadline:
+            return status
+        time.sleep(poll_s)
+
 
-    return 'none'
+class SlotIndex:
+    """
+    場地身分索引：(日期, D2, a, b) → 點擊狀態，跨回合、跨分頁、跨回彈共用（每次執行 reset 一次）。
+      - 已點擊（clicked）或已確認成功（confirmed）的場地不再點，dup_avoided 記錄省下的重複點擊
+      - 只有確定的結果（伺服器回應的對話框、頁面跳轉）才記錄；逾時沒有回應（none/sent/unresolved）的場地
+        不記錄，按鈕若仍可點，下一回合會再點（訂到的場地按鈕會消失，不會重複訂）
+      - 回彈/跳轉後以 locate() 一次快照重建「身分 → 按鈕」，各場地直接查表取回，不再逐顆 XPath 掃全頁
+    onclick 解析不到 Step3Action(a,b) 時，改以 (日期, D2, 時間, 場地) 當身分。
+    """
+
+    def __init__(self):
+        self.state: Dict[Tuple, str] = {}
+        self.dup_avoided = 0
+
+    @staticmethod
+    def key(slot: Slot) -> Tuple:
+        if slot.a and slot.b:
+            return (slot.date, slot.d2, slot.a, slot.b)
+        return (slot.date, slot.d2, slot.time, court_letter(slot.court) or slot.court)
+
+    def reset(self) -> None:
+        self.state.clear()
+        self.dup_avoided = 0
+
+    def mark(self, slot: Slot, status: str) -> None:
+        if self.state.get(self.key(slot)) != 'confirmed':
+            self.state[self.key(slot)] = status
+
+    def pending(self, targets: List[Tuple[Slot, object]]) -> List[Tuple[Slot, object]]:
+        """濾掉已點過的場地（計入 dup_avoided）。"""
+        out = [(s, el) for s, el in targets if self.key(s) not in self.state]
+        self.dup_avoided += len(targets) - len(out)
+        return out
+
+    def unclicked(self, slots: List[Slot]) -> List[Slot]:
+        """還沒點過的場地（只查詢，不計入 dup_avoided；背景分頁決定要不要切過去點擊用）。"""
+        return [s for s in slots if self.key(s) not in self.state]
+
+    def locate(self, driver: Driver) -> Dict[Tuple, object]:
+        """一次快照（不篩選）取回目前頁面所有可預約按鈕：身分 → WebElement。"""
+        return {self.key(s): el for s, el in snapshot_page(driver).slots}
+
+SLOT_INDEX = SlotIndex()
+
+def _bounce_wait(driver, policy: ClickPolicy, log_fn, budget: Budget) -> bool:
+    return wait_until_ready_with_cf(driver, target_url=driver.current_url,
+                                    max_wait=policy.bounce_max_wait, max_fail_retries=3,
+                                    log=(log_fn or print), bounce_on_fail=True, budget=budget)
+
+
+# ====== 頁內攔截器模式：一批點擊後一次取回對話框結果 ======
+def _click_batch_hooked(driver, targets, log_fn, cf_fail_retries, policy, t_ready, budget):
+    """
+    targets：[(Slot, WebElement)]，都要有 Step3Action id（a, b）。熱迴圈只做點擊（confirm/swal 由頁內攔截器處理），
+    一批點完後以 drain_dialogs() 一次取回結果；驗證失敗的場地回彈後重新定位，再點下一批。
+    回傳 (點擊數, 其中逾時未回應數, 各次點擊毫秒)。
+    """
+    clicked = unresolved = 0
+    click_ms: List[float] = []
+    first_click_logged = False
+    batch = targets
+    for attempt in range(cf_fail_retries + 1):
+        if not batch or budget.stopped: break
+        t_batch = time.perf_counter()
+        sent = {}
+        with span("click_batch", n=len(batch)):
+            for slot, img in batch:
+                try:
+                    driver.execute_script(_PRE_CLICK_JS, img, 0)
+                    if policy.human_delay > 0:
+                        time.sleep(policy.human_delay)
+                    img.click()
+                    if log_fn and not first_click_logged:
+                        first_click_logged = True
+                        ms = (time.perf_counter() - t_ready) * 1000
+                        emit(log_fn, f"  ⏱️ 頁面就緒→首次點擊 {ms:.0f} ms", phase="first_click", elapsed_ms=round(ms))
+                    sent[f"{slot.a},{slot.b}"] = slot
+                except Exception as e:
+                    if log_fn: log_fn(f"   ⚠️ 點擊失敗：{e}")
+
+        with span("drain", sent=len(sent)):
+            r = drain_dialogs(driver, wait_s=policy.outcome_timeout)
+        batch_ms = (time.perf_counter() - t_batch) * 1000
+        if sent:
+            click_ms.extend([batch_ms / len(sent)] * len(sent))   # 批次內平均分攤
+        failed, confirmed, outcome = set(), set(), {}
+        for d in r["dialogs"]:
+            record("dialog", dialog=d.get("kind"), text=d.get("text"), cls=d.get("cls"), slot=d.get("slot"))
+            if d.get("kind") == "confirm":
+                continue
+            outcome[d.get("slot")] = d.get("cls")
+            slot = sent.get(d.get("slot") or "")
+            if d.get("cls") == "cf_fail":
+                if slot: failed.add(slot)
+                elif log_fn: log_fn(f"   ⚠️ 驗證失敗（無法對應場地）：{d.get('text')}")
+            elif slot:
+                if d.get("cls") == "ok": confirmed.add(slot)
+                if log_fn: log_fn(f"   💬 {slot.time or '?'} {slot.court or '?'}：{d.get('text')}")
+        for sid, slot in sent.items():
+            record("click", slot=[slot.time, slot.court, slot.a, slot.b], status=outcome.get(sid, "none"),
+                   ms=round(batch_ms / len(sent), 1), attempt=attempt + 1, batch=True)
+            if slot in failed: continue
+            if sid in outcome:          # 有伺服器回應才記；逾時未回應的下一回合可重試
+                SLOT_INDEX.mark(slot, 'confirmed' if slot in confirmed else 'clicked')
+            else:
+                unresolved += 1
+            clicked += 1
+            if log_fn:
+                log_fn(f"  ✅ 點擊完成：時間『{slot.time or '?'}』 場地『{slot.court or '?'}』"
+                       + ("" if attempt == 0 else f"（重試{attempt}次）"))
+        emit(log_fn, f"  📦 批次 {len(sent)} 顆，對話框 {len(r['dialogs'])} 個，{batch_ms:.0f} ms"
+             + (f"，{len(r['unresolved'])} 顆逾時未回應" if r["unresolved"] else ""),
+             phase="click_batch", elapsed_ms=round(batch_ms))
+        if not failed:
+            break
+
+        if log_fn: log_fn(f"   ⏳ {len(failed)} 顆驗證失敗→回彈等待 Cloudflare 通過後重試…")
+        if not _bounce_wait(driver, policy, log_fn, budget):
+            if log_fn: log_fn(f"   ❌ 回彈後仍未通過（{budget.describe()}），放棄這些按鈕。")
+            break
+        batch = []
+        located = SLOT_INDEX.locate(driver)
+        for slot in failed:
+            img = located.get(SlotIndex.key(slot))
+            if img is None:
+                if log_fn: log_fn(f"   ❌ 回彈後找不到『{slot.time or '?'} {slot.court or '?'}』，放棄此按鈕。")
+                continue
+            batch.append((slot, img))
+    return clicked, unresolved, click_ms
 
 
 # ====== 取代原本的 click_all_bookings_on_page：加入 CF 失敗回彈重試 ======
-def click_all_bookings_on_page(driver, from_t, to_t, want_A, want_B, want_C,
-                               log_fn=None, max_click=999, cf_fail_retries=3):
+@traced("click_page")
+def click_all_bookings_on_page(driver: Driver, flt: SlotFilter, log_fn=None, max_click=999, cf_fail_retries=3,
+                               policy: Optional[ClickPolicy] = None, dialog_hook: bool = False,
+                               stats: Optional[dict] = None, page_key: Optional[str] = None,
+                               budget: Optional[Budget] = None):
     """
     直接在「操作」欄點擊藍色〔預定場地〕圖片；若點擊後出現「驗證失敗」，
     會自動回彈等待 Cloudflare 通過，再重新定位同一按鈕重試（最多 cf_fail_retries 次）。
+    flt 為每次執行編譯一次的 SlotFilter，在頁內求值，只有符合的按鈕會傳回 Python。
+    每次點擊只等實際條件（見 ClickPolicy），並記錄點擊→結果的毫秒數。
+    dialog_hook=True（BrowserManager 已掛頁內攔截器）時改為整批點擊、最後一次取回對話框結果。
+    stats 若給 dict，會填入本頁的 total / matched / clicked / unresolved / closed（排程器用）；
+    stats 的 clicked 只算伺服器有回應的點擊，逾時沒有結果的記在 unresolved（回傳值則兩者都算）。
+    page_key（網址或分頁 handle）會記住表格指紋：上次沒有符合的按鈕且表格沒變就略過掃描，有變化時記錄新增/消失的格子。
+    budget：此頁分到的時間預算；回彈等待從中扣時間，預算用完或按下停止就不再重試。
     """
-    # 只抓藍色可預約鈕（place01 / name=PlaceBtn）且 onclick 含 Step3Action
-    imgs = driver.find_elements(
-        By.XPATH,
-        "//img[contains(@onclick,'Step3Action') and "
-        "(@name='PlaceBtn' or contains(translate(@src,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'place01'))]"
-    )
-    if log_fn:
-        log_fn(f"  🔵 找到可預約按鈕 {len(imgs)} 顆，開始點擊…")
-
-    def _row_time(row):
-        # 取本列或上一列第一格的起始時間（處理 rowspan）
-        try:
-            td1 = row.find_element(By.XPATH, "./td[1]")
-            m = re.search(r'([01]?\d|2[0-3]):[0-5]\d', td1.text or '')
-            if m: return m.group(0)
-        except Exception:
-            pass
-        try:
-            prev = row.find_element(By.XPATH, "preceding-sibling::tr[1]")
-            td1  = prev.find_element(By.XPATH, "./td[1]")
-            m = re.search(r'([01]?\d|2[0-3]):[0-5]\d', td1.text or '')
-            if m: return m.group(0)
-        except Exception:
-            pass
-        return None
-
-    def _row_court(row):
-        try:
-            cells = row.find_elements(By.XPATH, "./td")
-            for c in cells:
-                if c.find_elements(By.XPATH, ".//img"):  # 跳過操作欄
-                    continue
-                t = (c.text or '').strip()
-                if ('羽球' in t) or any(x in t for x in ('A','B','C')):
-                    return t
-            if len(cells) >= 2:
-                return (cells[1].text or '').strip()
-        except Exception:
-            pass
-        return ""
-
-    clicked = 0
-
-    for img in imgs:
-        if clicked >= max_click: break
+    policy = policy or CLICK_POLICY
+    budget = budget or Budget()
+    t_ready = time.perf_counter()
+    with span("snapshot") as sp:
+        snap = snapshot_page(driver, flt, PAGE_FPS.prev_fp(page_key))
+        sp.set(total=snap.total, matched=len(snap.slots), same=snap.same)
+    ms = (time.perf_counter() - t_ready) * 1000
+    if recording():
+        if snap.same: record("page", key=page_key, same=True, fp=snap.fp)
+        else: capture_page(driver, page_key, fp=snap.fp, total=snap.total, matched=len(snap.slots))
+    if snap.same:
+        PAGE_FPS.skipped += 1
+        emit(log_fn, f"  💤 表格與上次相同，略過掃描（{ms:.0f} ms）", phase="snapshot", elapsed_ms=round(ms))
+        if stats is not None:
+            stats.update(total=PAGE_FPS.last_total(page_key), matched=0, clicked=0, unresolved=0, closed=snap.closed)
+        return 0
+    PAGE_FPS.scans += 1
+    slots, total = snap.slots, snap.total
+    fresh = SLOT_INDEX.pending(slots)           # 已點過的場地（本回合前、其他分頁、回彈前）不再點
+    record_snapshot(page_key, snap, len(fresh), log_fn)
+    targets = fresh[:max_click]
+    dup = len(slots) - len(fresh)
+    emit(log_fn, f"  🔵 可預約按鈕 {total} 顆，符合條件 {len(slots)} 顆"
+         + (f"（{dup} 顆已點過，略過）" if dup else "") + f"（快照 {ms:.0f} ms），開始點擊…",
+         phase="snapshot", elapsed_ms=round(ms), duplicate=dup)
+
+    if dialog_hook:
+        # 攔截器以 onclick 的 Step3Action(a,b) 對應結果；解析不到 id 的按鈕改走逐顆點擊，避免結果對錯場地
+        hooked = [(s, el) for s, el in targets if s.a and s.b]
+        clicked, unresolved, click_ms = _click_batch_hooked(driver, hooked, log_fn, cf_fail_retries, policy, t_ready, budget)
+        rest = [(s, el) for s, el in targets if not (s.a and s.b)]
+        if rest:
+            n, u, ms_rest = _click_one_by_one(driver, rest, log_fn, cf_fail_retries, policy, t_ready, budget)
+            clicked, unresolved, click_ms = clicked + n, unresolved + u, click_ms + ms_rest
+    else:
+        clicked, unresolved, click_ms = _click_one_by_one(driver, targets, log_fn, cf_fail_retries, policy, t_ready, budget)
+
+    if log_fn and click_ms:
+        log_fn(f"  ⏱️ 點擊 {len(click_ms)} 次：平均 {sum(click_ms)/len(click_ms):.0f} ms、最長 {max(click_ms):.0f} ms")
+    if log_fn and clicked == 0 and targets:
+        log_fn("  （沒有成功點擊任何項目，可能都被佔用或持續被驗證擋下）")
+    if stats is not None:
+        stats.update(total=total, matched=len(fresh), clicked=clicked - unresolved, unresolved=unresolved, closed=snap.closed)
+    return clicked
 
-        # 對應列資訊
-        try:
-            row = img.find_element(By.XPATH, "./ancestor::tr[1]")
-        except Exception:
-            row = None
-        t_text = _row_time(row) if row is not None else None
-        c_text = _row_court(row) if row is not None else ""
-
-        # 時間/場地篩選
-        time_ok = True
-        if (from_t or to_t) and t_text:
-            if from_t and t_text < from_t: time_ok = False
-            if to_t   and t_text > to_t:   time_ok = False
-        court_ok = True
-        if any([want_A, want_B, want_C]):
-            up = (c_text or "").upper()
-            court_ok = (want_A and 'A' in up) or (want_B and 'B' in up) or (want_C and 'C' in up)
-        if not (time_ok and court_ok):
-            continue
-
-        # 解析 onclick 參數，供重試時重新定位同一顆
-        oc = img.get_attribute("onclick") or ""
-        m  = re.search(r"Step3Action\((\d+)\s*,\s*(\d+)\)", oc)
-        sel_same = None
-        if m:
-            sel_same = f"//img[contains(@onclick,'Step3Action({m.group(1)},{m.group(2)})')]"
+def _click_one_by_one(driver, targets, log_fn, cf_fail_retries, policy, t_ready, budget):
+    """逐顆點擊：每顆點完即等待結果（見 _handle_confirm_and_detect_cf_fail），驗證失敗就回彈重試同一顆。"""
+    clicked = unresolved = 0
+    first_click_logged = False
+    click_ms: List[float] = []
+    page_moved = False      # 頁面已跳轉/回彈：後續按鈕需重新定位
+    located = None          # 跳轉/回彈後的 身分 → 按鈕（SLOT_INDEX.locate，一頁只取一次）
+
+    for slot, img in targets:
+        if budget.stopped: break
+        t_text = slot.time
+        c_text = slot.court
+
+        if page_moved:
+            if located is None:
+                located = SLOT_INDEX.locate(driver)
+            img = located.get(SlotIndex.key(slot))
+            if img is None:
+                if log_fn: log_fn(f"   ↪️ 頁面已更新，找不到『{t_text or '?'} {c_text or '?'}』，略過。")
+                continue
 
         # 進行點擊 + 必要時的回彈重試
         attempts = 0
         while attempts <= cf_fail_retries:
             attempts += 1
             try:
-                driver.execute_script("arguments[0].scrollIntoView({block:'center'});", img)
-                time.sleep(0.12)  # 給一點人為延遲
-                img.click()
-                time.sleep(0.10)
-
-                status = _handle_confirm_and_detect_cf_fail(driver, timeout=2.0)
+                token = int(time.time() * 1000)
+                driver.execute_script(_PRE_CLICK_JS, img, token)
+                if policy.human_delay > 0:
+                    time.sleep(policy.human_delay)
+                t_click = time.perf_counter()
+                with span("click", time=t_text, court=c_text):
+                    img.click()
+                if log_fn and not first_click_logged:
+                    first_click_logged = True
+                    emit(log_fn, f"  ⏱️ 頁面就緒→首次點擊 {(t_click-t_ready)*1000:.0f} ms",
+                         phase="first_click", elapsed_ms=round((t_click - t_ready) * 1000))
+
+                status = _handle_confirm_and_detect_cf_fail(driver, timeout=policy.outcome_timeout,
+                                                            token=token, poll_s=policy.poll_s)
+                ms = (time.perf_counter() - t_click) * 1000
+                click_ms.append(ms)
+                record("click", slot=[t_text, c_text, slot.a, slot.b], status=status, ms=round(ms, 1), attempt=attempts)
                 if status != 'cf_fail':
-                    # ok / none 都算完成一次點擊
+                    # ok / nav / sent / none 都算完成一次點擊；只有確定的結果才記進索引，其餘下一回合可重試
+                    if status in ('ok', 'nav'):
+                        SLOT_INDEX.mark(slot, 'clicked')
+                    else:
+                        unresolved += 1
                     clicked += 1
-                    if log_fn:
-                        log_fn(f"  ✅ 點擊完成：時間『{t_text or '?'}』 場地『{c_text or '?'}』"
-                               + ("" if attempts==1 else f"（重試{attempts-1}次）"))
+                    emit(log_fn, f"  ✅ 點擊完成：時間『{t_text or '?'}』 場地『{c_text or '?'}』（{ms:.0f} ms）"
+                         + ("" if attempts==1 else f"（重試{attempts-1}次）"), phase="click", elapsed_ms=round(ms))
+                    if status == 'nav':
+                        # 頁面已跳轉：最多再等 outcome_timeout 讓新頁面出現按鈕，後續按鈕依身分重新定位
+                        page_moved, located = True, None
+                        wait_until_ready_with_cf(driver, target_url=None, max_wait=policy.outcome_timeout,
+                                                 max_fail_retries=0, log=(log_fn or print), bounce_on_fail=False,
+                                                 budget=budget)
                     break
 
                 # ----- 走到這裡表示「驗證失敗」：回彈等待，再重找同一顆重新點 -----
                 if log_fn: log_fn("   ⏳ 驗證失敗→回彈等待 Cloudflare 通過後重試…")
-                ok = wait_until_ready_with_cf(driver, target_url=driver.current_url,
-                                              max_wait=240, max_fail_retries=3,
-                                              log=(log_fn or print), bounce_on_fail=True)
-                if not ok:
-                    if log_fn: log_fn("   ❌ 回彈後仍未通過，放棄此按鈕。")
+                page_moved, located = True, None
+                if not _bounce_wait(driver, policy, log_fn, budget):
+                    if log_fn: log_fn(f"   ❌ 回彈後仍未通過（{budget.describe()}），放棄此按鈕。")
                     break
 
-                # 重新定位同一顆
-                if sel_same:
-                    found = driver.find_elements(By.XPATH, sel_same)
-                    if not found:
-                        if log_fn: log_fn("   ❌ 回彈後找不到同一按鈕，放棄此按鈕。")
-                        break
-                    img = found[0]
+                # 依身分重新定位同一顆
+                located = SLOT_INDEX.locate(driver)
+                img = located.get(SlotIndex.key(slot))
+                if img is None:
+                    if log_fn: log_fn("   ❌ 回彈後找不到同一按鈕，放棄此按鈕。")
+                    break
                 # 迴圈會自動重試
             except Exception as e:
                 if log_fn: log_fn(f"   ⚠️ 點擊失敗：{e}")
                 break
-
-    if log_fn and clicked == 0:
-        log_fn("  （沒有成功點擊任何項目，可能都被佔用或持續被驗證擋下）")
-    return clicked
+    return clicked, unresolved, click_ms
@@ -1,9 +1,11 @@
 # browser_cf.py
 # 管理 UC 瀏覽器 + Cloudflare 自動驗證偵測/等待 + 輕量 stealth + 失敗回彈
 
+import math
 import os
+import threading
 import time
-from typing import Optional, Callable
+from typing import Any, Callable, List, Optional, Protocol
 # --- Py3.12 distutils shim（必須放在 import undetected_chromedriver 之前）---
 import sys, types, re
 try:
@@ -40,13 +42,42 @@ except ModuleNotFoundError:
 # --- End shim ---
 
 import undetected_chromedriver as uc
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
 
+from budget import Budget
+from logsink import emit
+from recorder import record
+from tracing import span, traced
+
 LogFn = Callable[[str], None]
 
-LOGIN_URL = "https://resortbooking.metro.taipei/MT02.aspx?module=login_page&files=login"
-HOME_URL  = "https://resortbooking.metro.taipei/MT02.aspx?module=net_booking&files=booking_place&PT=1"
-ORDER_URL = "https://resortbooking.metro.taipei/MT02.aspx?module=member&files=orderx_mt"
+class Driver(Protocol):
+    """
+    booking / browser_cf 實際用到的 WebDriver 操作（uc.Chrome 與 fake_driver.FakeDriver 都符合）；
+    每個方法/屬性都是一次 WebDriver 往返。
+    """
+    capabilities: dict  # 本機屬性（不需往返）：pageLoadStrategy 等
+    current_url: str
+    current_window_handle: str
+    window_handles: List[str]
+    switch_to: Any      # .alert（沒有對話框時拋例外）/ .window(handle) / .new_window('tab')
+
+    def get(self, url: str) -> None: ...
+    def refresh(self) -> None: ...
+    def execute_script(self, script: str, *args) -> Any: ...
+    def execute_async_script(self, script: str, *args) -> Any: ...
+    def execute_cdp_cmd(self, cmd: str, params: dict) -> Any: ...
+    def find_elements(self, by: str, value: str) -> list: ...
+    def close(self) -> None: ...
+    def quit(self) -> None: ...
+
+# 網站根網址；設定環境變數 BOOKING_SITE 可整個指向本機替身（python standin_server.py）
+SITE_ROOT = os.environ.get("BOOKING_SITE", "https://resortbooking.metro.taipei").rstrip("/")
+
+LOGIN_URL = f"{SITE_ROOT}/MT02.aspx?module=login_page&files=login"
+HOME_URL  = f"{SITE_ROOT}/MT02.aspx?module=net_booking&files=booking_place&PT=1"
+ORDER_URL = f"{SITE_ROOT}/MT02.aspx?module=member&files=orderx_mt"
 
 def _safe_exec_js(driver, js: str):
     try:
@@ -54,6 +85,31 @@ def _safe_exec_js(driver, js: str):
     except Exception:
         pass
 
+# ===== 頁面載入策略：normal（等所有子資源）/ eager（DOMContentLoaded）/ none（送出導航即返回）=====
+# 只能在啟動瀏覽器時指定（整個 session 固定）；可用 BOOKING_PAGE_LOAD 覆寫預設值。
+PAGE_LOAD_STRATEGIES = ("normal", "eager", "none")
+PAGE_LOAD_STRATEGY = os.environ.get("BOOKING_PAGE_LOAD", "eager")
+PAGE_LOAD_TIMEOUT_S = 60
+
+def page_load_strategy(driver) -> str:
+    return (getattr(driver, "capabilities", None) or {}).get("pageLoadStrategy") or "normal"
+
+def navigate(driver: Driver, url: Optional[str] = None) -> None:
+    """
+    導航到 url（None = 重新整理）後立即返回，是否就緒交給 wait_until_ready_with_cf 看表格/按鈕。
+    頁面載入逾時（還有子資源沒下載完）不算失敗；none 策略下 get() 可能早於新文件出現就返回，
+    先在舊文件標記 __bkLeaving，探測看到標記就當作尚未就緒，不會在舊頁面上點擊。
+    """
+    if page_load_strategy(driver) == "none":
+        _safe_exec_js(driver, "window.__bkLeaving = true;")
+    try:
+        if url is None:
+            driver.refresh()
+        else:
+            driver.get(url)
+    except TimeoutException:
+        pass
+
 def _inject_stealth(driver):
     js = r"""
     try {
@@ -82,17 +138,236 @@ def _inject_stealth(driver):
     """
     _safe_exec_js(driver, js)
 
+# ===== 頁內對話框攔截（可選）：每次導航前由 CDP 注入 =====
+# 原生 confirm/alert 直接接受；.swal2-container 出現時讀字並按「確定」。
+# 每個對話框的文字與分類（ok / cf_fail / error）寫入 sessionStorage 佇列（跨同源導航保留），
+# Python 端在一批點擊後以 drain_dialogs() 一次取回，不必在點擊熱迴圈裡逐顆處理。
+# confirm 會記下觸發的 Step3Action(a,b)，後續的結果對話框（alert/swal）依序對應回該場地。
+_DIALOG_HOOK_JS = r"""
+(function () {
+  if (window.__bkHook) return;
+  window.__bkHook = true;
+  const KEY = '__bkDialogs', PKEY = '__bkPending';
+  const load = (k) => { try { return JSON.parse(sessionStorage.getItem(k) || '[]'); } catch (e) { return []; } };
+  const save = (k, v) => { try { sessionStorage.setItem(k, JSON.stringify(v)); } catch (e) {} };
+  const classify = (t) => /驗證失敗|重新驗證|verification failed/i.test(t || '') ? 'cf_fail'
+                        : (/失敗|錯誤|已被預約|額滿|error/i.test(t || '') ? 'error' : 'ok');
+  const push = (kind, text) => {
+    const e = {kind: kind, text: String(text == null ? '' : text).trim(), cls: 'ok', slot: null, t: Date.now(), url: location.href};
+    e.cls = classify(e.text);
+    const pending = load(PKEY);
+    if (kind === 'confirm') { e.slot = window.__bkLastSlot || null; pending.push(e.slot); }
+    else { e.slot = pending.length ? pending.shift() : null; }
+    save(PKEY, pending);
+    const q = load(KEY); q.push(e); save(KEY, q);
+  };
+  document.addEventListener('click', (ev) => {
+    const img = ev.target && ev.target.closest ? ev.target.closest('img[onclick]') : null;
+    if (!img) return;
+    const m = /Step3Action\((\d+)\s*,\s*(\d+)\)/.exec(img.getAttribute('onclick') || '');
+    window.__bkLastSlot = m ? (m[1] + ',' + m[2]) : null;
+  }, true);
+  window.confirm = function (msg) { push('confirm', msg); return true; };
+  window.alert = function (msg) { push('alert', msg); };
+  const scan = () => {
+    for (const c of document.querySelectorAll('.swal2-container:not([data-bk-seen])')) {
+      const text = Array.from(c.querySelectorAll('.swal2-title, .swal2-html-container'))
+        .map((e) => (e.textContent || '').trim()).join(' ').trim();
+      if (!text) continue;
+      c.setAttribute('data-bk-seen', '1');
+      push('swal', text);
+      const b = c.querySelector('.swal2-confirm');
+      if (b) b.click();
+    }
+  };
+  new MutationObserver(scan).observe(document, {childList: true, subtree: true, characterData: true});
+})();
+"""
+
+# 取回並清空佇列；若仍有 confirm 在等伺服器回應，最多在頁內等 arguments[0] 毫秒（一次 async 往返）
+_DIALOG_DRAIN_JS = r"""
+const done = arguments[arguments.length - 1];
+const timeoutMs = arguments[0] || 0;
+const load = (k) => { try { return JSON.parse(sessionStorage.getItem(k) || '[]'); } catch (e) { return []; } };
+const t0 = performance.now();
+const tick = () => {
+  const pending = load('__bkPending');
+  if (pending.length === 0 || performance.now() - t0 >= timeoutMs) {
+    const q = load('__bkDialogs');
+    sessionStorage.removeItem('__bkDialogs');
+    sessionStorage.removeItem('__bkPending');
+    done({dialogs: q, unresolved: pending, hook: !!window.__bkHook});
+    return;
+  }
+  setTimeout(tick, 20);
+};
+tick();
+"""
+
+def install_dialog_hook(driver) -> bool:
+    """以 CDP Page.addScriptToEvaluateOnNewDocument 註冊（之後每次導航自動重新套用），並套用到目前頁面。"""
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": _DIALOG_HOOK_JS})
+    except Exception:
+        return False
+    _safe_exec_js(driver, _DIALOG_HOOK_JS)
+    return True
+
+def drain_dialogs(driver, wait_s: float = 0.0) -> dict:
+    """
+    一次取回頁內對話框佇列：
+      dialogs    : [{kind: confirm/alert/swal, text, cls: ok/cf_fail/error, slot: 'a,b' 或 None, t, url}]
+      unresolved : 等到 wait_s 仍未收到結果的 confirm（slot id 清單）
+      hook       : 目前頁面是否已掛上攔截器
+    """
+    try:
+        r = driver.execute_async_script(_DIALOG_DRAIN_JS, int(wait_s * 1000))
+        if r: return r
+    except Exception:
+        pass
+    return {"dialogs": [], "unresolved": [], "hook": False}
+
+
+# ===== 精簡載入（可選）：以 CDP Network.setBlockedURLs 擋掉預約流程用不到的資源 =====
+# 只擋字型、影音與第三方追蹤；保留 HTML、站內 JS/CSS（Step3Action、SweetAlert2）、所有圖片
+# （預定場地按鈕是圖片，副檔名不一定是 PNG，擋掉可能沒有尺寸而點不到）與 Cloudflare 驗證（challenges.cloudflare.com）。
+# CDP 設定只對下指令的那個分頁有效，多分頁模式新開/回收重開的分頁由 core 各自再套一次。
+LEAN_BLOCKED_URLS = [
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg",
+    "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+    "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*",
+    "*facebook.net*", "*facebook.com/tr*", "*hotjar.com*",
+]
+
+def set_lean_load(driver, on: bool) -> bool:
+    """開/關精簡載入（下一次導航起生效）；不支援 CDP 時回傳 False。"""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS if on else []})
+        return True
+    except Exception:
+        return False
+
+# 一次往返讀 Resource Timing：本頁（導航 + 子資源）傳輸位元組、資源數，
+# 以及導航起算「第一次看到表格」（__bkTableAt，由就緒探測記下）、DOMContentLoaded、load 的毫秒數（load 尚未觸發時為 null）。
+# 跨網域資源若沒有 Timing-Allow-Origin，transferSize 為 0（數字偏低但開關兩種模式的比較仍成立）。
+_PAGE_WEIGHT_JS = r"""
+const nav = performance.getEntriesByType('navigation')[0];
+const res = performance.getEntriesByType('resource');
+let bytes = nav ? (nav.transferSize || 0) : 0;
+for (const r of res) bytes += r.transferSize || 0;
+const t0 = nav ? nav.startTime : 0;
+return {bytes: bytes, resources: res.length,
+        table_ms: (window.__bkTableAt || performance.now()) - t0,
+        dcl_ms: nav && nav.domContentLoadedEventEnd > 0 ? nav.domContentLoadedEventEnd - t0 : null,
+        load_ms: nav && nav.loadEventEnd > 0 ? nav.loadEventEnd - t0 : null};
+"""
+
+class LoadStats:
+    """
+    每頁傳輸量/載入時間，依模式（lean / full）分開累計，方便開關精簡載入後比較；
+    另依載入策略累計「表格可點」與 load 的時間（load 在表格可點時還沒觸發的頁不計入 load 平均）。
+    """
+
+    def __init__(self):
+        self.by_mode = {}          # mode → [頁數, 位元組, load ms 合計, 有 load 的頁數]
+        self.by_strategy = {}      # strategy → [頁數, 表格可點 ms 合計, load ms 合計, 有 load 的頁數]
+
+    def add(self, mode: str, nbytes: int, load_ms: Optional[float], strategy: str = "normal",
+            table_ms: Optional[float] = None):
+        st = self.by_mode.setdefault(mode, [0, 0, 0.0, 0])
+        st[0] += 1; st[1] += nbytes
+        if load_ms is not None:
+            st[2] += load_ms; st[3] += 1
+        if table_ms is not None:
+            sg = self.by_strategy.setdefault(strategy, [0, 0.0, 0.0, 0])
+            sg[0] += 1; sg[1] += table_ms
+            if load_ms is not None:
+                sg[2] += load_ms; sg[3] += 1
+
+    def summary_lines(self) -> List[str]:
+        label = {"lean": "精簡載入", "full": "一般載入"}
+        out = [f"📦 {label.get(m, m)}：平均 {b / n / 1024:.0f} KB/頁"
+               + (f"、載入 {ms / k:.0f} ms/頁" if k else "") + f"（共 {n} 頁）"
+               for m, (n, b, ms, k) in sorted(self.by_mode.items()) if n]
+        out += [f"🚦 載入策略 {sg}：表格可點平均 {tms / n:.0f} ms"
+                + (f"、load 平均 {lms / k:.0f} ms" if k else "")
+                + (f"（{n - k}/{n} 頁表格可點時 load 尚未完成）" if k < n else f"（共 {n} 頁）")
+                for sg, (n, tms, lms, k) in sorted(self.by_strategy.items()) if n]
+        return out
+
+LOAD_STATS = LoadStats()
+
+def page_weight(driver: Driver, lean: bool = False, log: Optional[LogFn] = None) -> Optional[dict]:
+    """讀取目前頁面的傳輸量、表格可點與 load 時間並計入 LOAD_STATS；log 有給就記一行。"""
+    try:
+        w = driver.execute_script(_PAGE_WEIGHT_JS)
+    except Exception:
+        return None
+    if not w or w.get("table_ms") is None:
+        return None
+    mode = "lean" if lean else "full"
+    strategy = page_load_strategy(driver)
+    table_ms, load_ms = float(w["table_ms"]), w.get("load_ms")
+    LOAD_STATS.add(mode, int(w.get("bytes") or 0), load_ms, strategy, table_ms)
+    emit(log, f"  📦 本頁傳輸 {(w.get('bytes') or 0) / 1024:.0f} KB（{w.get('resources', 0)} 個資源）；"
+              f"表格可點 {table_ms:.0f} ms、"
+              + (f"load {load_ms:.0f} ms" if load_ms is not None else "load 尚未完成")
+              + f"（{strategy}、{'精簡' if lean else '一般'}載入）",
+         phase="weight", bytes=w.get("bytes"), table_ms=round(table_ms),
+         dcl_ms=None if w.get("dcl_ms") is None else round(w["dcl_ms"]),
+         load_ms=None if load_ms is None else round(load_ms), strategy=strategy, lean=lean)
+    return w
+
+
 class BrowserManager:
-    def __init__(self, profile_dir: str = "uc_profile"):
+    def __init__(self, profile_dir: str = "uc_profile", headless: Optional[bool] = None,
+                 dialog_hook: bool = False, lean_load: Optional[bool] = None,
+                 page_load_strategy: Optional[str] = None):
         self.profile_dir = profile_dir
+        # 未指定時看環境變數 BOOKING_HEADLESS=1（搭配本機替身做無頭測試）
+        self.headless = (os.environ.get("BOOKING_HEADLESS", "") == "1") if headless is None else headless
+        self.dialog_hook = dialog_hook
+        # 精簡載入：未指定時看環境變數 BOOKING_LEAN=1；執行中可用 set_lean_load() 切換
+        self.lean_load = (os.environ.get("BOOKING_LEAN", "") == "1") if lean_load is None else lean_load
+        # 頁面載入策略（見 PAGE_LOAD_STRATEGIES）：啟動時套用，之後整個 session 固定
+        self.page_load_strategy = page_load_strategy or PAGE_LOAD_STRATEGY
         self.driver = None
+        self.timings = {}          # 冷啟動各段耗時（ms）：patch / spawn / first_nav
+        self._patcher = None       # 保留參考：預先修補好的 chromedriver 由它管理
+        self._driver_path = None
+        self._devtools = None      # devtools.DevTools（背景分頁查詢）；None = 尚未連線
+        self._lock = threading.Lock()
+
+    def prepare(self, log: LogFn = print) -> Optional[str]:
+        """
+        預先下載/修補 chromedriver（可在背景執行緒呼叫），launch() 直接沿用修補好的執行檔，
+        不必在按下按鈕時才修補。失敗不影響 launch()（改回 uc 內建流程）。
+        """
+        with self._lock:
+            if self._driver_path or self.driver:
+                return self._driver_path
+            t = time.perf_counter()
+            try:
+                patcher = uc.Patcher()
+                patcher.auto()
+                self._patcher, self._driver_path = patcher, patcher.executable_path
+            except Exception as e:
+                log(f"⚠️ 預先修補 chromedriver 失敗（啟動時再試）：{e}")
+            self.timings["patch"] = (time.perf_counter() - t) * 1000
+            return self._driver_path
 
     def launch(self, log: LogFn = print, navigate_url: Optional[str] = None):
         """啟動 UC（如已啟動則重用）。第一次請在該視窗登入；Cookie 會保存在 profile_dir。"""
+        with self._lock:
+            return self._launch(log, navigate_url)
+
+    def _launch(self, log: LogFn, navigate_url: Optional[str]):
         if self.driver:
             if navigate_url:
                 try:
-                    self.driver.get(navigate_url)
+                    navigate(self.driver, navigate_url)
                 except Exception:
                     log("已開啟的瀏覽器導向失敗；請手動到登入頁。")
             return self.driver
@@ -102,26 +377,73 @@ class BrowserManager:
         opts.user_data_dir = os.path.abspath(self.profile_dir)
         opts.add_argument("--disable-blink-features=AutomationControlled")
         opts.add_argument("--start-maximized")
+        if self.page_load_strategy not in PAGE_LOAD_STRATEGIES:
+            log(f"⚠️ 不明的載入策略 {self.page_load_strategy!r}，改用 eager。")
+            self.page_load_strategy = "eager"
+        opts.page_load_strategy = self.page_load_strategy
 
-        drv = uc.Chrome(options=opts, headless=False)
+        t = time.perf_counter()
+        drv = uc.Chrome(options=opts, headless=self.headless, driver_executable_path=self._driver_path)
         drv.implicitly_wait(0.2)
-        drv.set_page_load_timeout(60)
+        drv.set_page_load_timeout(PAGE_LOAD_TIMEOUT_S)
         self.driver = drv
         _inject_stealth(drv)
+        if self.dialog_hook and not install_dialog_hook(drv):
+            log("⚠️ 無法註冊頁內對話框攔截器，改用逐次處理。")
+            self.dialog_hook = False
+        if self.lean_load and not set_lean_load(drv, True):
+            log("⚠️ 無法啟用精簡載入（CDP Network.setBlockedURLs），改為一般載入。")
+            self.lean_load = False
+        self.timings["spawn"] = (time.perf_counter() - t) * 1000
 
         if navigate_url:
+            t = time.perf_counter()
             try:
-                drv.get(navigate_url)
+                navigate(drv, navigate_url)
             except Exception:
                 log("啟動後導向登入頁失敗；請手動輸入登入網址。")
+            self.timings["first_nav"] = (time.perf_counter() - t) * 1000
         return drv
 
+    def enable_dialog_hook(self, log: LogFn = print) -> bool:
+        """在已啟動的瀏覽器上補掛頁內對話框攔截器（下一次導航起全面生效）。"""
+        if self.driver and not self.dialog_hook:
+            self.dialog_hook = install_dialog_hook(self.driver)
+            if not self.dialog_hook:
+                log("⚠️ 無法註冊頁內對話框攔截器，改用逐次處理。")
+        return self.dialog_hook
+
+    def set_lean_load(self, on: bool, log: LogFn = print) -> bool:
+        """在已啟動的瀏覽器上開/關精簡載入（此 session 的下一次導航起生效）；回傳目前是否為精簡載入。"""
+        if self.driver and on != self.lean_load:
+            if set_lean_load(self.driver, on):
+                self.lean_load = on
+                log(f"📦 精簡載入已{'開啟（擋字型/影音/追蹤）' if on else '關閉'}。")
+            elif on:
+                log("⚠️ 無法啟用精簡載入（CDP Network.setBlockedURLs），改為一般載入。")
+        elif not self.driver:
+            self.lean_load = on
+        return self.lean_load
+
+    def devtools(self, log: LogFn = print):
+        """不切換視窗查詢背景分頁用的 DevTools 連線（同一個 session 共用）；不支援時回傳 None。"""
+        if self.driver and self._devtools is None:
+            from devtools import DevTools
+            self._devtools = DevTools.attach(self.driver)
+            if self._devtools is None:
+                log("⚠️ 無法連上 Chrome remote debugging，多分頁改為逐一切換檢查。")
+                self._devtools = False
+        return self._devtools or None
+
     def ensure_launched(self, log: LogFn = print):
         if not self.driver:
             raise RuntimeError("尚未啟動瀏覽器。請先按『開啟登入視窗』並完成登入/驗證。")
         return self.driver
 
     def quit(self):
+        if self._devtools:
+            self._devtools.close()
+        self._devtools = None
         if self.driver:
             try: self.driver.quit()
             except Exception: pass
@@ -130,6 +452,102 @@ class BrowserManager:
 
 # ===== Cloudflare：三態 + 更嚴謹的「失敗」偵測 + 失敗回彈 =====
 
+# 一次往返、一次掃描：documentElement.textContent 只取一次字串，等同舊版 //*[contains(., ...)]（根節點字串值）
+_CF_PROBE_FN = r"""
+function __bkProbe() {
+  if (window.__bkLeaving) return {state: 'none', table: false, buttons: false};   // none 策略：舊文件還沒被換掉
+  const de = document.documentElement;
+  const text = de ? (de.textContent || '') : '';
+  const low = text.toLowerCase();
+  const has = (sel) => !!document.querySelector(sel);
+  let state = 'none';
+  if (text.includes('Error 1020') || text.includes('error code: 1020') || text.includes('Access denied') || text.includes('已封鎖')
+      || has('[class*="cf-error"], [id*="cf-error-details"]')) {
+    state = 'fail';
+  } else if (text.includes('Checking your browser') || text.includes('檢查您的瀏覽器') || text.includes('正在驗證') || text.includes('請稍候')
+      || has('#challenge-stage, [class*="cf-browser-verification"], [class*="challenge-form"], [class*="challenge-platform"]')
+      || has('iframe[src*="turnstile"]')) {
+    state = 'gate';
+  } else if (low.includes('cloudflare') && (text.includes('成功') || text.includes('驗證完成'))) {
+    state = 'success';
+  }
+  const table = has('table');
+  if (table && !window.__bkTableAt) window.__bkTableAt = performance.now();   // 第一次看到表格（page_weight 讀取）
+  return {state: state, table: table, buttons: has('table img[onclick]')};
+}
+"""
+_CF_PROBE_JS = _CF_PROBE_FN + "return __bkProbe();"
+
+# 事件驅動等待（execute_async_script）：頁內 MutationObserver 在按鈕出現或封鎖頁時立即回報，否則 timeout 後回報目前狀態。
+# gate/success 不算終態：gate 會自行跳轉（async 腳本隨之中斷，由 Python 端重新掛上），success 等按鈕出現再一起處理。
+_READY_WAIT_JS = _CF_PROBE_FN + r"""
+const done = arguments[arguments.length - 1];
+const timeoutMs = arguments[0];
+const t0 = performance.now();
+let finished = false, obs = null, timer = null;
+const finish = (r, how) => {
+  if (finished) return;
+  finished = true;
+  if (obs) obs.disconnect();
+  clearTimeout(timer);
+  r.how = how; r.waited_ms = performance.now() - t0;
+  done(r);
+};
+const test = (how) => {
+  const r = __bkProbe();
+  if (r.buttons || r.state === 'fail') { finish(r, how); return true; }
+  return false;
+};
+if (!test('immediate')) {
+  obs = new MutationObserver(() => test('event'));
+  obs.observe(document, {childList: true, subtree: true, characterData: true});
+  timer = setTimeout(() => finish(__bkProbe(), 'timeout'), timeoutMs);
+}
+"""
+
+# 就緒模式：'event'（預設，MutationObserver）或 'poll'（舊版 sleep 輪詢）；可用 BOOKING_READY_MODE 覆寫
+READY_MODE = os.environ.get("BOOKING_READY_MODE", "event")
+EVENT_SLICE_S = 3.0           # 每次 async 等待上限（需小於 WebDriver script timeout 30s）；也是停止旗標的最長生效延遲
+POLL_PERIOD_MS = {"gate": 1050.0, "none": 150.0}   # 舊版輪詢每輪間隔（_simulate_human 0.8s + 0.25s / 0.15s）
+
+def poll_saved_ms(fired_ms: float, period_ms: float) -> float:
+    """
+    頁內觀察器在進入等待後 fired_ms 觸發；舊版輪詢從進入時起每 period_ms 查一次，
+    要到下一個查詢點才會發現。回傳兩者的差（毫秒）。
+    """
+    return math.ceil(fired_ms / period_ms) * period_ms - fired_ms if fired_ms > 0 else 0.0
+
+class ReadyStats:
+    """事件模式就緒統計：每頁實測的觀察器觸發時刻，比舊版輪詢下一個查詢點早了多少。"""
+
+    def __init__(self):
+        self.pages = 0
+        self.saved_ms = 0.0
+
+    def add(self, saved_ms: float):
+        self.pages += 1
+        self.saved_ms += saved_ms
+
+    @property
+    def avg_ms(self) -> float:
+        return self.saved_ms / self.pages if self.pages else 0.0
+
+READY_STATS = ReadyStats()
+
+def probe_page(driver: Driver) -> dict:
+    """
+    單次 JS 探測（一次 WebDriver 往返）：
+      state   : 'gate' / 'success' / 'fail' / 'none'（同 get_cf_state）
+      table   : 頁面是否已有 <table>
+      buttons : 表格內是否已有 img[onclick]（可預約/已佔用鈕）
+    """
+    try:
+        r = driver.execute_script(_CF_PROBE_JS)
+        if r: return r
+    except Exception:
+        pass
+    return {"state": "none", "table": False, "buttons": False}
+
 def get_cf_state(driver) -> str:
     """
     回傳：
@@ -138,6 +556,10 @@ def get_cf_state(driver) -> str:
       'fail'    真正的封鎖/失敗頁（1020/Access denied 等）
       'none'    無相關提示
     """
+    return probe_page(driver)["state"]
+
+def get_cf_state_xpath(driver) -> str:
+    """舊版逐條 XPath 判斷（最多 7 次往返）；僅保留給 bench/bench_cf_probe.py 對照。"""
     try:
         # 真正的封鎖頁（更嚴謹，避免誤判）
         if driver.find_elements(By.XPATH, "//*[contains(., 'Error 1020') or contains(., 'error code: 1020') or contains(., 'Access denied') or contains(., '已封鎖')]"):
@@ -187,50 +609,87 @@ def dismiss_cf_banner(driver):
     """
     _safe_exec_js(driver, js)
 
-def _simulate_human(driver, secs=1.2):
-    """簡單的人為互動：移動滑鼠與滾動，降低 bot 味道。"""
+_HUMAN_JS = """
+(function(){
+  const dx = 8 + Math.floor(Math.random()*20);
+  const dy = 5 + Math.floor(Math.random()*16);
+  const e = new MouseEvent('mousemove', {clientX: dx, clientY: dy, bubbles:true});
+  document.body.dispatchEvent(e);
+  window.scrollBy(0, Math.floor(20+Math.random()*60));
+})();
+"""
+
+def _simulate_human(driver, secs=1.2, budget: Optional[Budget] = None):
+    """簡單的人為互動：移動滑鼠與滾動，降低 bot 味道。給 budget 時停止旗標一設就提前結束。"""
+    budget = budget or Budget()
     try:
-        js = """
-        (function(){
-          const dx = 8 + Math.floor(Math.random()*20);
-          const dy = 5 + Math.floor(Math.random()*16);
-          const e = new MouseEvent('mousemove', {clientX: dx, clientY: dy, bubbles:true});
-          document.body.dispatchEvent(e);
-          window.scrollBy(0, Math.floor(20+Math.random()*60));
-        })();
-        """
         t0 = time.time()
         while time.time()-t0 < secs:
-            _safe_exec_js(driver, js)
-            time.sleep(0.25)
+            _safe_exec_js(driver, _HUMAN_JS)
+            if not budget.sleep(0.25):
+                break
     except Exception:
         pass
 
-def warmup_home_then_back(driver, target_url: str, log: LogFn):
+def _wait_ready_event(driver, timeout_s: float) -> Optional[dict]:
+    """掛上頁內 MutationObserver 等待；頁面跳轉（document unloaded）等例外回傳 None。"""
+    try:
+        return driver.execute_async_script(_READY_WAIT_JS, int(timeout_s * 1000))
+    except Exception:
+        return None
+
+def warmup_home_then_back(driver, target_url: str, log: LogFn, budget: Optional[Budget] = None):
     """先走一次 HOME（或 LOGIN）暖身，再回到目標 URL。"""
     try:
         log("↪️ 先前往首頁暖身後再回到目標頁…")
-        driver.get(HOME_URL)
-        _simulate_human(driver, secs=1.0)
-        driver.get(target_url)
+        navigate(driver, HOME_URL)
+        _simulate_human(driver, secs=1.0, budget=budget)
+        if budget is not None and budget.expired:
+            return
+        navigate(driver, target_url)
     except Exception:
         pass
 
-def wait_until_ready_with_cf(driver, target_url: Optional[str]=None, max_wait: int = 240,
+@traced("wait_ready")
+def wait_until_ready_with_cf(driver: Driver, target_url: Optional[str]=None, max_wait: float = 240,
                              max_fail_retries: int = 3, log: LogFn = print,
-                             bounce_on_fail: bool = True) -> bool:
+                             bounce_on_fail: bool = True, mode: Optional[str] = None,
+                             budget: Optional[Budget] = None) -> bool:
     """
     自動等待 Cloudflare 完成驗證；顯示成功橫幅→隱藏；
     若偵測到真正失敗頁，最多重試 max_fail_retries 次（每次退避遞增），可選擇 bounce（去首頁或登入，再回來）。
-    True = 表格/按鈕可用；False = 逾時/多次失敗。
+    mode：'event' 以頁內 MutationObserver 即時回報；'poll' 為舊版 sleep 輪詢（預設見 READY_MODE）。
+    budget：呼叫端的時間預算（見 budget.py）；總等待（含回彈、退避）不超過 max_wait 與預算剩餘時間，
+    頁內等待無法從 Python 端打斷：停止旗標在這次等待返回時（最多 EVENT_SLICE_S 秒）生效；
+    要立即結束就關閉瀏覽器（BookingCore.close），卡住的 execute_async_script 會隨之失敗返回。
+    True = 表格/按鈕可用；False = 逾時/多次失敗/已停止。
     """
+    event = (mode or READY_MODE) == "event"
+    budget = (budget or Budget()).child(max_wait)     # 截止時刻只算一次：回彈重試不重新計時
     fail_retries = 0
-    t0 = time.time()
-    while time.time() - t0 < max_wait:
-        st = get_cf_state(driver)
+    t_enter = time.perf_counter()
+    t_human = -math.inf
+    last_state = "none"
+    while not budget.expired:
+        if event:
+            t_call = time.perf_counter()
+            probe = _wait_ready_event(driver, max(0.1, budget.cap(EVENT_SLICE_S)))
+            if probe is None:           # 導向中，稍候重新掛上
+                budget.sleep(0.05)
+                continue
+        else:
+            probe = probe_page(driver)
+        st = probe["state"]
         if st == "gate":
-            _simulate_human(driver, secs=0.8)
-            time.sleep(0.25)
+            last_state = "gate"
+            if event:
+                # 事件模式：每 EVENT_SLICE_S 秒做一次互動（驗證頁跳轉時等待片段會更短），不另外 sleep
+                if time.perf_counter() - t_human >= EVENT_SLICE_S:
+                    _safe_exec_js(driver, _HUMAN_JS)
+                    t_human = time.perf_counter()
+            else:
+                _simulate_human(driver, secs=0.8, budget=budget)
+                budget.sleep(0.25)
             continue
         elif st == "success":
             dismiss_cf_banner(driver)
@@ -239,26 +698,45 @@ def wait_until_ready_with_cf(driver, target_url: Optional[str]=None, max_wait: i
             if fail_retries < max_fail_retries:
                 fail_retries += 1
                 delay = min(2.0 * fail_retries, 8.0)
-                log(f"⚠️ Cloudflare 阻擋（疑似 1020/Access denied），第 {fail_retries}/{max_fail_retries} 次回彈處理…")
-                time.sleep(delay)
-                if bounce_on_fail and target_url:
-                    warmup_home_then_back(driver, target_url, log)
-                else:
-                    try: driver.refresh()
-                    except Exception: pass
-                t0 = time.time()
+                log(f"⚠️ Cloudflare 阻擋（疑似 1020/Access denied），第 {fail_retries}/{max_fail_retries} 次回彈處理"
+                    f"（{budget.describe()}）…")
+                with span("cf_bounce", attempt=fail_retries):
+                    if not budget.sleep(delay):
+                        break
+                    if bounce_on_fail and target_url:
+                        warmup_home_then_back(driver, target_url, log, budget)
+                    else:
+                        try: navigate(driver)
+                        except Exception: pass
+                last_state = "none"
                 continue
             else:
                 log("❌ 多次失敗仍被阻擋。")
+                record("ready", url=target_url, ok=False, state="fail", retries=fail_retries,
+                       ms=round((time.perf_counter() - t_enter) * 1000))
                 return False
 
-        # 檢查預定按鈕/表格
-        if driver.find_elements(By.XPATH, "//table//img[@onclick]"):
+        # 檢查預定按鈕/表格（已包含在同一次探測結果中）
+        if probe["buttons"]:
+            if event:
+                # 觸發時刻 = 這次等待的起點 + 頁內量到的 waited_ms；一進來就已就緒時兩種模式一樣快
+                fired = (t_call - t_enter) * 1000 + (probe.get("waited_ms") or 0.0)
+                saved = 0.0 if probe.get("how") == "immediate" else poll_saved_ms(fired, POLL_PERIOD_MS[last_state])
+                READY_STATS.add(saved)
+                ms = (time.perf_counter() - t_enter) * 1000
+                emit(log, f"  ⚡ 頁面就緒 {ms:.0f} ms"
+                     f"（事件觸發於 {fired:.0f} ms，較輪詢早 {saved:.0f} ms；平均 {READY_STATS.avg_ms:.0f} ms/頁，共 {READY_STATS.pages} 頁）",
+                     phase="ready", elapsed_ms=round(ms), fired_ms=round(fired), saved_ms=round(saved))
+            record("ready", url=target_url, ok=True, state=last_state, retries=fail_retries,
+                   ms=round((time.perf_counter() - t_enter) * 1000))
             return True
-        if driver.find_elements(By.XPATH, "//table"):
-            time.sleep(0.15)
-        else:
-            time.sleep(0.15)
+        if not event:
+            budget.sleep(0.15)
 
-    log("⌛ 等待 Cloudflare/頁面載入逾時。")
+    record("ready", url=target_url, ok=False, state=last_state, retries=fail_retries, stopped=budget.stopped,
+           ms=round((time.perf_counter() - t_enter) * 1000))
+    if budget.stopped:
+        log("⏹️ 已要求停止，不再等待頁面。")
+        return False
+    log(f"⌛ 等待 Cloudflare/頁面載入逾時（{(time.perf_counter() - t_enter):.0f} 秒）。")
     return False
@@ -0,0 +1,67 @@
+# budget.py
+# 一次執行的時間預算：截止時刻 + 停止旗標，由 App.worker 一路傳到 wait_until_ready_with_cf 與點擊回彈。
+# 每個等待、回彈、重試都從同一份預算扣時間；每頁只拿到「剩餘時間 ÷ 本回合還沒處理的頁數」（上限 PAGE_MAX_S），
+# 一頁卡住不會吃掉整個執行時間；sleep 與回彈退避中按【停止】立即生效（頁內事件等待見 browser_cf.EVENT_SLICE_S）。
+#
+#   run = Budget(8 * 60, stop=stop_flag)
+#   for i, url in enumerate(due):
+#       page = run.share(len(due) - i)
+#       wait_until_ready_with_cf(drv, url, budget=page); click_all_bookings_on_page(drv, flt, budget=page)
+#   run.sleep(interval)
+
+import math
+import threading
+import time
+from typing import Optional
+
+PAGE_MAX_S = 60.0      # 單頁（載入+等待+點擊+回彈）最多分到的秒數
+
+
+class Budget:
+    """
+    deadline : time.monotonic() 的截止時刻（inf = 不限時）
+    stop     : 停止旗標（threading.Event）；子預算共用同一個旗標
+    """
+
+    def __init__(self, seconds: Optional[float] = None, stop: Optional[threading.Event] = None,
+                 deadline: Optional[float] = None):
+        if deadline is None:
+            deadline = math.inf if seconds is None else time.monotonic() + max(0.0, seconds)
+        self.deadline = deadline
+        self.stop = stop or threading.Event()
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.stop.is_set() or time.monotonic() >= self.deadline
+
+    def cap(self, seconds: float) -> float:
+        """seconds 與剩餘時間取小者。"""
+        return min(seconds, self.remaining())
+
+    def sleep(self, seconds: float) -> bool:
+        """可被停止旗標打斷的 sleep（不超過剩餘時間）；回傳醒來時預算是否仍可用。"""
+        s = self.cap(seconds)
+        if s > 0:
+            self.stop.wait(s)
+        return not self.expired
+
+    def child(self, seconds: float) -> "Budget":
+        """從目前預算切出最多 seconds 秒的子預算（截止時刻不會晚於父預算）。"""
+        return Budget(stop=self.stop, deadline=min(self.deadline, time.monotonic() + max(0.0, seconds)))
+
+    def share(self, pages_left: int, cap: float = PAGE_MAX_S) -> "Budget":
+        """剩餘時間平均分給還沒處理的 pages_left 頁，每頁最多 cap 秒。"""
+        return self.child(min(cap, self.remaining() / max(1, pages_left)))
+
+    def describe(self) -> str:
+        if self.stopped:
+            return "已停止"
+        r = self.remaining()
+        return "不限時" if math.isinf(r) else f"剩 {r:.0f} 秒"
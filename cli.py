@@ -0,0 +1,187 @@
+# cli.py
+# 無 GUI 的執行入口：讀設定檔（TOML；.json 亦可）建立 core.RunConfig，沿用同一個 BrowserManager profile，
+# 在背景執行緒跑 core.BookingCore，主執行緒把 LogSink 的紀錄逐筆串流到 stdout（預設 JSON lines，--text 為純文字）。
+# Ctrl+C（SIGINT）/ SIGTERM 會呼叫 core.stop()，等進行中的瀏覽器呼叫返回後關閉 Chrome。
+#
+# 設定檔的每個值都依 core.RunConfig 的型別註記檢查，型別不對時指出是哪一個鍵（例如 interval = "2"、d2 = 4）。
+#
+#   python -m cli login                           # 第一次：開登入頁，登入/驗證完成後按 Enter（Cookie 存進 profile）
+#   python -m cli run config.toml                 # 依設定檔執行（範例見 config.example.toml）
+#   python -m cli run config.toml --text --log logs/run.jsonl
+
+import argparse
+import asyncio
+import json
+import signal
+import sys
+import threading
+from typing import List, Optional, Tuple, Union, get_args, get_origin, get_type_hints
+
+try:
+    import tomllib                 # Python 3.11+
+except ImportError:
+    try:
+        import tomli as tomllib    # 3.10 以前：pip install tomli
+    except ImportError:
+        tomllib = None
+
+from core import BookingCore, RunConfig
+from logsink import LogSink
+
+# [run] 的鍵 → RunConfig 參數（不在表中的鍵視為錯字，直接報錯）
+RUN_KEYS = {
+    "dates": "dates", "d2": "d2_list", "from": "from_t", "to": "to_t", "courts": "courts",
+    "interval": "interval", "max_wait_min": "max_wait_min", "cf_fail_retries": "cf_fail_retries",
+    "warmup": "warmup", "dialog_hook": "dialog_hook", "start_at": "start_at", "lean_load": "lean_load",
+    "long_run": "long_run", "heap_mb": "heap_mb", "dom_nodes": "dom_nodes", "rss_per_tab_mb": "rss_per_tab_mb",
+    "metrics_every_s": "metrics_every_s", "stale_sec": "stale_sec", "background_probe": "background_probe",
+    "record": "record",
+}
+# [browser] 的鍵 → BrowserManager 參數
+BROWSER_KEYS = {"profile_dir": "profile_dir", "headless": "headless", "page_load": "page_load_strategy"}
+# BrowserManager 參數的型別（browser_cf 匯入較慢，不為了讀型別註記而載入）
+BROWSER_TYPES = {"profile_dir": str, "headless": bool, "page_load_strategy": str}
+_TYPE_NAMES = {bool: "true/false", int: "整數", float: "數字", str: "字串"}
+MODES = {"single": True, "multi": False}
+
+
+def read_config(path: str) -> dict:
+    with open(path, "rb") as f:
+        raw = f.read()
+    if path.lower().endswith(".json"):
+        return json.loads(raw.decode("utf-8"))
+    if tomllib is None:
+        raise ValueError("需要 Python 3.11+ 或 pip install tomli 才能讀 TOML（也可改用 .json 設定檔）")
+    return tomllib.loads(raw.decode("utf-8"))
+
+def _type_ok(v, hint) -> bool:
+    """v 是否符合型別註記（bool 不當作數字；float 可接受整數）。"""
+    origin, args = get_origin(hint), get_args(hint)
+    if origin is Union:
+        return any(_type_ok(v, a) for a in args)
+    if hint is type(None):
+        return v is None
+    if origin is list:
+        return isinstance(v, list) and all(_type_ok(x, args[0]) for x in v)
+    if isinstance(v, bool):
+        return hint is bool
+    if hint is float:
+        return isinstance(v, (int, float))
+    return isinstance(v, hint)
+
+def _type_name(hint) -> str:
+    origin, args = get_origin(hint), get_args(hint)
+    if origin is Union:
+        return " 或 ".join(_type_name(a) for a in args if a is not type(None))
+    if origin is list:
+        return f"{_type_name(args[0])}陣列"
+    return _TYPE_NAMES.get(hint, getattr(hint, "__name__", str(hint)))
+
+def _type_errors(section: str, values: dict, keys: dict, types: dict) -> List[str]:
+    """values（設定檔的鍵）中型別不符 types（參數名 → 型別註記）的項目，格式「section.鍵 應為 …（目前 …）」。"""
+    return [f"{section}.{k} 應為{_type_name(types[keys[k]])}（目前 {v!r}）"
+            for k, v in values.items() if keys[k] in types and not _type_ok(v, types[keys[k]])]
+
+def parse_config(d: dict) -> Tuple[RunConfig, dict]:
+    """設定檔內容 → (RunConfig, BrowserManager 參數)；鍵名或型別不對時拋 ValueError。"""
+    run, browser = dict(d.get("run") or {}), dict(d.get("browser") or {})
+    unknown = [f"run.{k}" for k in run if k not in RUN_KEYS and k != "mode"]
+    unknown += [f"browser.{k}" for k in browser if k not in BROWSER_KEYS]
+    unknown += [k for k in d if k not in ("run", "browser")]
+    if unknown:
+        raise ValueError(f"不認得的設定：{', '.join(unknown)}")
+    mode = run.pop("mode", "single")
+    if mode not in MODES:
+        raise ValueError(f"run.mode 應為 single 或 multi（目前 {mode!r}）")
+    if isinstance(run.get("dates"), str):
+        run["dates"] = [run["dates"]]
+    if isinstance(run.get("courts"), list) and all(isinstance(c, str) for c in run["courts"]):
+        run["courts"] = "".join(run["courts"])
+    if "dates" not in run or "d2" not in run:
+        raise ValueError("run.dates 與 run.d2 為必填")
+    bad = _type_errors("run", run, RUN_KEYS, get_type_hints(RunConfig.__init__))
+    bad += _type_errors("browser", browser, BROWSER_KEYS, BROWSER_TYPES)
+    if bad:
+        raise ValueError("設定型別錯誤：" + "；".join(bad))
+    cfg = RunConfig(single_tab=MODES[mode], **{RUN_KEYS[k]: v for k, v in run.items()})
+    return cfg, {BROWSER_KEYS[k]: v for k, v in browser.items()}
+
+def _stream(sink: LogSink, as_text: bool) -> None:
+    def out(rec):
+        sys.stdout.write((rec.line() if as_text else rec.to_json()) + "\n")
+        sys.stdout.flush()
+    sink.add_listener(out)
+
+
+def cmd_run(args) -> int:
+    try:
+        cfg, bopts = parse_config(read_config(args.config))
+    except (OSError, ValueError) as e:
+        print(f"設定錯誤：{e}", file=sys.stderr)
+        return 2
+    sink = LogSink()
+    _stream(sink, args.text)
+    if args.log:
+        sink.open_file(args.log)
+    from browser_cf import BrowserManager
+    browser = BrowserManager(dialog_hook=cfg.dialog_hook, lean_load=cfg.lean_load, **bopts)
+    core = BookingCore(browser, cfg, log=sink, trace_dir=args.trace_dir or None)
+
+    def _work():
+        try:
+            browser.prepare(log=sink)
+            browser.launch(log=sink)
+            asyncio.run(core.run())
+        except Exception as e:
+            sink(f"程式錯誤：{e}")
+
+    th = threading.Thread(target=_work, name="core", daemon=True)
+    stopped = threading.Event()
+
+    def _stop(signum, frame):
+        if not stopped.is_set():
+            stopped.set()
+            sink("已要求停止…", phase="stop")
+            core.stop()
+    signal.signal(signal.SIGINT, _stop)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, _stop)
+
+    th.start()
+    while th.is_alive():
+        th.join(0.1)
+        sink.pump()
+    core.close(quit_browser=True, timeout=3.0)
+    sink.pump(limit=10**6)
+    sink.close_file()
+    return 130 if stopped.is_set() else 0
+
+def cmd_login(args) -> int:
+    from browser_cf import LOGIN_URL, BrowserManager
+    browser = BrowserManager(profile_dir=args.profile_dir, headless=False)
+    browser.launch(log=print, navigate_url=LOGIN_URL)
+    try:
+        input("請在瀏覽器完成登入/驗證，完成後按 Enter 關閉（Cookie 會保存在 profile）…")
+    except (EOFError, KeyboardInterrupt):
+        pass
+    browser.quit()
+    return 0
+
+
+def main(argv: Optional[list] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m cli", description="無 GUI 執行預約流程")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="依設定檔執行")
+    r.add_argument("config", help="設定檔（.toml 或 .json），範例見 config.example.toml")
+    r.add_argument("--text", action="store_true", help="stdout 改為純文字（預設 JSON lines）")
+    r.add_argument("--log", help="另外寫入輪替 JSONL 記錄檔")
+    r.add_argument("--trace-dir", default="logs", help="追蹤檔資料夾（空字串 = 不寫）")
+    r.set_defaults(fn=cmd_run)
+    lg = sub.add_parser("login", help="開啟登入頁，手動完成登入/驗證")
+    lg.add_argument("--profile-dir", default="uc_profile")
+    lg.set_defaults(fn=cmd_login)
+    args = ap.parse_args(argv)
+    return args.fn(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# clock_sync.py
+# 伺服器時鐘校正 + 高精度定時觸發：以 HTTP Date 標頭估計本機與伺服器的時差/RTT，粗睡後自旋在校正時刻觸發
+#
+#   python clock_sync.py https://resortbooking.metro.taipei/MT02.aspx
+#   python clock_sync.py http://127.0.0.1:8765/MT02.aspx   # 搭配 standin_server.py --clock-skew 1.3
+#
+# Date 只有 1 秒解析度；每次取樣得到「offset 落在哪個區間」的限制，多次取樣交集後可收斂到數十毫秒內。
+# 取樣時刻會刻意對準目前估計的秒邊界（二分法），讓每次取樣都盡量把區間砍半。
+
+import math
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from email.utils import parsedate_to_datetime
+from typing import Callable, NamedTuple, Optional
+
+LogFn = Callable[[str], None]
+
+PREWARM_S = 20.0      # 觸發前多久先開好目標頁（通過 CF、連線暖好）
+SPIN_S = 0.015        # 最後這段改為忙等，避開 sleep 的排程誤差
+
+class ClockEstimate(NamedTuple):
+    offset: float        # 伺服器時間 - 本機時間（秒）
+    uncertainty: float   # ± 秒（區間半寬）
+    rtt: float           # 中位數 RTT（秒）
+    samples: int
+
+    def describe(self) -> str:
+        return (f"伺服器時鐘偏移 {self.offset:+.3f} s（±{self.uncertainty*1000:.0f} ms，"
+                f"RTT {self.rtt*1000:.0f} ms，{self.samples} 次取樣）")
+
+
+def _date_sample(url: str, timeout: float):
+    """送一次 HEAD，回傳 (t_send, t_recv, server_epoch_seconds)；取不到 Date 回傳 None。"""
+    req = urllib.request.Request(url, method="HEAD", headers={"Cache-Control": "no-cache"})
+    t_send = time.time()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            date = resp.headers.get("Date")
+    except urllib.error.HTTPError as e:     # CF 403 等錯誤頁仍帶 Date
+        date = e.headers.get("Date") if e.headers else None
+    except Exception:
+        return None
+    t_recv = time.time()
+    if not date:
+        return None
+    try:
+        return t_send, t_recv, parsedate_to_datetime(date).timestamp()
+    except Exception:
+        return None
+
+def estimate_server_offset(url: str, samples: int = 6, timeout: float = 3.0,
+                           log: Optional[LogFn] = None) -> Optional[ClockEstimate]:
+    """
+    多次 HEAD 取 Date 標頭估計時差。每筆樣本限制 offset ∈ (D - t_recv, D + 1 - t_send)；
+    取交集後的中點為估計值。樣本互相矛盾（伺服器延遲）時退回各樣本中點的中位數。
+    """
+    lo, hi = -math.inf, math.inf
+    mids, rtts = [], []
+    for i in range(samples):
+        if i and rtts and math.isfinite(lo) and math.isfinite(hi):
+            # 對準目前估計的秒邊界送出（抵達伺服器時剛好跨秒），讓這筆樣本能把區間砍半
+            mid = (lo + hi) / 2
+            one_way = statistics.median(rtts) / 2
+            now = time.time()
+            target = math.ceil(now + mid + one_way + 0.05) - mid - one_way
+            time.sleep(max(0.0, target - time.time()))
+        s = _date_sample(url, timeout)
+        if not s:
+            continue
+        t_send, t_recv, d = s
+        rtts.append(t_recv - t_send)
+        mids.append(d + 0.5 - (t_send + t_recv) / 2)
+        lo, hi = max(lo, d - t_recv), min(hi, d + 1 - t_send)
+        if log:
+            log(f"  時鐘取樣 {i + 1}/{samples}：RTT {(t_recv - t_send)*1000:.0f} ms，區間 [{lo:+.3f}, {hi:+.3f}]")
+    if not rtts:
+        return None
+    rtt = statistics.median(rtts)
+    if lo <= hi:
+        return ClockEstimate((lo + hi) / 2, (hi - lo) / 2, rtt, len(rtts))
+    spread = (max(mids) - min(mids)) / 2 if len(mids) > 1 else 0.5
+    return ClockEstimate(statistics.median(mids), max(spread, 0.5), rtt, len(rtts))
+
+
+def sleep_until(target: float, stop_event: Optional[threading.Event] = None, spin_s: float = SPIN_S) -> Optional[float]:
+    """
+    睡到本機時間 target（time.time() 秒）：先用 Event.wait 粗睡，最後 spin_s 秒以 perf_counter 忙等。
+    回傳實際觸發誤差（秒，正值=晚到）；期間被 stop_event 中止則回傳 None。
+    """
+    while True:
+        remaining = target - time.time()
+        if remaining <= spin_s:
+            break
+        wait_s = min(remaining - spin_s, 0.5)
+        if stop_event is not None:
+            if stop_event.wait(wait_s):
+                return None
+        else:
+            time.sleep(wait_s)
+    # 牆鐘只讀一次，之後全用單調時鐘，避免 NTP 調整造成跳動
+    deadline = time.perf_counter() + (target - time.time())
+    while time.perf_counter() < deadline:
+        pass
+    return time.time() - target
+
+
+class TimedStart:
+    """
+    「在指定時間啟動」排程：校正伺服器時鐘 → 提前 PREWARM_S 暖頁 → 在伺服器時間 start_ts 讓第一個請求抵達。
+    start_ts 以本機時區的牆鐘表示「伺服器上的」開始時刻（即 GUI 輸入的 HH:MM:SS）。
+    """
+
+    def __init__(self, start_ts: float, probe_url: str, log: LogFn = print, samples: int = 6):
+        self.start_ts = start_ts
+        self.probe_url = probe_url
+        self.log = log
+        self.samples = samples
+        self.estimate: Optional[ClockEstimate] = None
+
+    def calibrate(self) -> Optional[ClockEstimate]:
+        self.estimate = estimate_server_offset(self.probe_url, samples=self.samples)
+        if self.estimate:
+            self.log(f"⏱️ {self.estimate.describe()}")
+        else:
+            self.log("⚠️ 無法取得伺服器 Date 標頭，改用本機時鐘。")
+        return self.estimate
+
+    @property
+    def fire_at(self) -> float:
+        """本機觸發時刻：換算成本機時間，再提前單程延遲（RTT/2）讓請求剛好在開始時刻抵達。"""
+        if not self.estimate:
+            return self.start_ts
+        return self.start_ts - self.estimate.offset - self.estimate.rtt / 2
+
+    def wait(self, stop_event: Optional[threading.Event] = None,
+             prewarm: Optional[Callable[[], None]] = None) -> bool:
+        """等到觸發時刻；prewarm 會在觸發前 PREWARM_S 秒呼叫一次。回傳 False 表示被中止。"""
+        if prewarm is not None and self.fire_at - time.time() > PREWARM_S:
+            if sleep_until(self.fire_at - PREWARM_S, stop_event) is None:
+                return False
+            prewarm()
+        err = sleep_until(self.fire_at, stop_event)
+        if err is None:
+            return False
+        self.log(f"🚀 已於校正時刻觸發（觸發誤差 {err*1000:+.2f} ms）")
+        return True
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法：python clock_sync.py 網址 [取樣次數]"); sys.exit(2)
+    est = estimate_server_offset(sys.argv[1], samples=int(sys.argv[2]) if len(sys.argv) > 2 else 6, log=print)
+    print(est.describe() if est else "取不到 Date 標頭")
+    if est:
+        # 示範：在下一個伺服器整秒 +2 秒觸發，量測實際誤差
+        target_server = math.floor(time.time() + est.offset) + 2
+        err = sleep_until(target_server - est.offset)
+        print(f"於伺服器整秒 {target_server:.0f} 觸發，本機誤差 {err*1000:+.3f} ms")
@@ -0,0 +1,584 @@
+# core.py
+# 與 GUI 無關的輪詢核心：在 asyncio 事件迴圈上編排「載入 → 等待就緒 → 點擊」（單分頁/多分頁），
+# 所有會阻塞的 WebDriver 呼叫都丟到單一執行緒的 executor（同一個 driver 不能並行操作）。
+# stop() 可從任何執行緒呼叫：設停止旗標並取消 asyncio 任務（立即）；進行中的頁內等待最多 EVENT_SLICE_S 秒後返回，
+# close(quit_browser=True) 則先關閉瀏覽器讓它立即失敗返回。結束時記錄「停止→取消」與「停止→閒置（瀏覽器呼叫都已返回）」兩段延遲。
+# 多分頁模式每個分頁是一個狀態機（Tab：loading / gated / ready / clicked / stale），背景分頁經 devtools.DevTools
+# 直接查詢與重新整理，只有要點擊（或驗證卡太久）時才切換過去。
+#
+#   core = BookingCore(browser, RunConfig(dates=["2025/10/01"], d2_list=[4], from_t="19:00"), log=sink)
+#   threading.Thread(target=lambda: asyncio.run(core.run())).start()
+#   ...; core.stop(); core.close()          # close() 以 BrowserManager.quit 關閉瀏覽器並等待閒置
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from budget import PAGE_MAX_S, Budget
+from clock_sync import PREWARM_S, TimedStart
+from logsink import emit
+from metrics import TabHealth, Thresholds, browser_rss_mb, sample_tab
+from recorder import Recorder, record
+from scheduler import UrlScheduler
+from slots import SlotFilter
+from tracing import TRACE_KEEP, Tracer, prune_traces, span
+
+LogFn = Callable[..., None]
+
+
+class RunConfig:
+    """
+    一次執行的設定（GUI 與其他入口共用）。
+      dates          : 日期字串（2025/10/03、2025-10-03 皆可；也可含逗號分隔的多個）
+      d2_list        : 大時段（slots.D2_BLOCKS 的鍵）
+      from_t / to_t  : HH:MM 篩選（None/空字串 = 不限）
+      courts         : 限定場地代號，例如 "AB"（空 = 全部）
+      interval       : 刷新間隔（秒）
+      max_wait_min   : 執行預算（分），見 budget.py
+      start_at       : "HH:MM:SS" 以伺服器時鐘定時啟動；None = 立即
+      lean_load      : 精簡載入（擋字型/影音/追蹤，見 browser_cf.LEAN_BLOCKED_URLS）
+      long_run       : 長時間模式：每 metrics_every_s 秒取樣分頁記憶體，超過 heap_mb / dom_nodes 就回收分頁；
+                       整個 Chrome 的 RSS 超過 rss_per_tab_mb × 分頁數（需 psutil）時回收剛取樣的分頁
+      stale_sec      : 多分頁模式沒有點擊時，多久重新整理一次
+      background_probe : 多分頁模式以 DevTools 查詢背景分頁，只在要點擊時切換（連不上時退回逐一切換）
+      record         : 錄製頁面表格/CF 狀態/點擊結果到 trace_dir（recorder.py，供 replay.py 重播）；None 看 BOOKING_RECORD=1
+    """
+
+    def __init__(self, dates: List[str], d2_list: List[int], from_t: Optional[str] = None,
+                 to_t: Optional[str] = None, courts: str = "", interval: float = 2.0,
+                 max_wait_min: float = 8.0, cf_fail_retries: int = 3, single_tab: bool = True,
+                 warmup: bool = True, dialog_hook: bool = False, start_at: Optional[str] = None,
+                 lean_load: bool = False, long_run: bool = False, heap_mb: float = 256.0,
+                 dom_nodes: int = 60000, rss_per_tab_mb: Optional[float] = None, metrics_every_s: float = 60.0,
+                 stale_sec: float = 25.0, background_probe: bool = True, record: Optional[bool] = None):
+        self.dates = list(dates)
+        self.d2_list = list(d2_list)
+        self.from_t = from_t
+        self.to_t = to_t
+        self.courts = courts.upper()
+        self.interval = interval
+        self.max_wait_min = max_wait_min
+        self.cf_fail_retries = cf_fail_retries
+        self.single_tab = single_tab
+        self.warmup = warmup
+        self.dialog_hook = dialog_hook
+        self.start_at = start_at
+        self.lean_load = lean_load
+        self.long_run = long_run
+        self.heap_mb = heap_mb
+        self.dom_nodes = dom_nodes
+        self.rss_per_tab_mb = rss_per_tab_mb
+        self.metrics_every_s = metrics_every_s
+        self.stale_sec = stale_sec
+        self.background_probe = background_probe
+        self.record = (os.environ.get("BOOKING_RECORD", "") == "1") if record is None else record
+
+
+# 多分頁的分頁狀態
+LOADING, GATED, READY, CLICKED, STALE = "loading", "gated", "ready", "clicked", "stale"
+BG_WAIT_S = 20.0       # 背景分頁停在載入/驗證頁超過這麼久，就切過去以前景等待（含模擬人類操作、失敗回彈）
+
+
+class Tab:
+    """
+    多分頁模式的一個分頁：loading →（gated）→ ready → clicked；表格久沒變或驗證失敗 → stale → 重新整理 → loading。
+    分頁回收時 handle 改變，其餘狀態沿用。
+    """
+    __slots__ = ("handle", "url", "state", "since", "last_check", "load_ms", "fails")
+
+    def __init__(self, handle: str, url: str, state: str = LOADING, load_ms: Optional[float] = None):
+        self.handle = handle
+        self.url = url
+        self.state = state
+        self.since = time.monotonic()
+        self.last_check = time.time()
+        self.load_ms = load_ms
+        self.fails = 0                 # 背景看到連續驗證失敗的次數
+
+    @property
+    def ready(self) -> bool:
+        return self.state in (READY, CLICKED)
+
+    def age(self) -> float:
+        return time.monotonic() - self.since
+
+
+def probe_state(r: dict) -> str:
+    """devtools 背景探測結果 → 分頁狀態。"""
+    if r.get("state") == "fail":
+        return STALE
+    if r.get("state") == "gate":
+        return GATED
+    return READY if r.get("table") else LOADING
+
+
+class BookingCore:
+    """
+    browser   : browser_cf.BrowserManager（需 ensure_launched / enable_dialog_hook / set_lean_load / quit）
+    log       : log_fn；若有 set_context（LogSink）會附上 round/url/tab 欄位
+    stop_flag : 可由外部共用的停止旗標（例如 GUI 在核心建立前就按了停止）
+    """
+
+    def __init__(self, browser, cfg: RunConfig, log: LogFn = print,
+                 stop_flag: Optional[threading.Event] = None, trace_dir: Optional[str] = "logs"):
+        self.browser = browser
+        self.cfg = cfg
+        self.log = log
+        self.stop_flag = stop_flag or threading.Event()
+        self.trace_dir = trace_dir
+        self.total_clicks = 0
+        self.switches_avoided = 0      # 多分頁：背景查詢省下的切換次數
+        self.timings = {}              # stop_cancel / stop_idle（ms）
+        self.hook = False              # 頁內對話框攔截器（CDP 註冊只對單一分頁有效，新分頁要各自註冊）
+        self.lean = False              # 精簡載入（同上，新分頁要各自設定）
+        self.health: Optional[TabHealth] = None
+        if cfg.long_run:
+            self.health = TabHealth(Thresholds(cfg.heap_mb, cfg.dom_nodes, cfg.rss_per_tab_mb, cfg.metrics_every_s))
+        self._ctx = getattr(log, "set_context", None) or (lambda **kw: None)
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="driver")
+        self._inflight: Optional[Future] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._t_stop: Optional[float] = None
+        self._idle = threading.Event()
+        self._idle.set()
+
+    # ---- 控制（任何執行緒） ----
+    def stop(self) -> None:
+        if self._t_stop is None:
+            self._t_stop = time.perf_counter()
+        self.stop_flag.set()
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None and not task.done():
+            loop.call_soon_threadsafe(task.cancel)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """等到 run() 結束且沒有進行中的瀏覽器呼叫。"""
+        return self._idle.wait(timeout)
+
+    def close(self, quit_browser: bool = True, timeout: float = 5.0) -> None:
+        """
+        停止並關閉 driver 執行緒。quit_browser 時先關閉瀏覽器（BrowserManager.quit）：
+        卡在頁內等待的 execute_async_script 會隨之失敗返回，不必等到 EVENT_SLICE_S 的切片結束。
+        """
+        self.stop()
+        if quit_browser and self.browser is not None:
+            self.browser.quit()
+        if not self.wait_idle(timeout):
+            self.log(f"⚠️ {timeout:.0f} 秒內未閒置。")
+        self._pool.shutdown(wait=False)
+
+    # ---- executor ----
+    async def _call(self, fn, *args, **kw):
+        """在 driver 執行緒執行阻塞呼叫（帶著目前的 contextvars，span 才會記到同一個 Tracer）。"""
+        ctx = contextvars.copy_context()
+        fut = self._pool.submit(ctx.run, functools.partial(fn, *args, **kw))
+        self._inflight = fut
+        return await asyncio.wrap_future(fut)
+
+    async def _sleep(self, run: Budget, seconds: float) -> bool:
+        s = run.cap(seconds)
+        if s > 0:
+            await asyncio.sleep(s)
+        return not run.expired
+
+    # ---- 主流程 ----
+    async def run(self) -> int:
+        """執行到預算用完或被停止；回傳總點擊數。"""
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        self._idle.clear()
+        if self.stop_flag.is_set():          # 建立前就被要求停止
+            self.stop()
+        stamp = f"{datetime.now():%Y%m%d-%H%M%S}"
+        path = os.path.join(self.trace_dir, f"trace-{stamp}.jsonl") if self.trace_dir else None
+        if path:
+            prune_traces(self.trace_dir, keep=max(0, TRACE_KEEP - 1))    # 加上這次共 TRACE_KEEP 份
+        tracer = Tracer(path).start()
+        rec = None
+        if self.cfg.record:
+            cfg = self.cfg
+            rec = Recorder(os.path.join(self.trace_dir or "logs", f"rec-{stamp}.jsonl.gz")).start(
+                dates=cfg.dates, d2=cfg.d2_list, from_t=cfg.from_t, to_t=cfg.to_t, courts=cfg.courts,
+                single_tab=cfg.single_tab, dialog_hook=cfg.dialog_hook, lean_load=cfg.lean_load)
+        try:
+            await self._run()
+        except asyncio.CancelledError:
+            if self._t_stop is not None:
+                self.timings["stop_cancel"] = (time.perf_counter() - self._t_stop) * 1000
+        except Exception as e:
+            self.log(f"程式錯誤：{e}")
+        finally:
+            if self._inflight is not None and not self._inflight.done():
+                try: await asyncio.wrap_future(self._inflight)      # 等進行中的瀏覽器呼叫返回
+                except BaseException: pass
+            if self._t_stop is not None:
+                self.timings["stop_idle"] = (time.perf_counter() - self._t_stop) * 1000
+                emit(self.log, f"⏹️ 停止→取消 {self.timings.get('stop_cancel', 0):.0f} ms，"
+                               f"停止→閒置 {self.timings['stop_idle']:.0f} ms", phase="stop",
+                     elapsed_ms=round(self.timings["stop_idle"]))
+            tracer.stop()
+            if rec is not None:
+                rec.stop()
+                self.log(rec.describe() + f"（python replay.py {rec.path} 重播）")
+            self._ctx(round=None, url=None, tab=None)
+            for line in tracer.summary_lines():
+                self.log(line)
+            self.log("任務結束。")
+            self._idle.set()
+        return self.total_clicks
+
+    async def _run(self) -> None:
+        cfg, log = self.cfg, self.log
+        drv = await self._call(self.browser.ensure_launched, log=log)
+        from browser_cf import HOME_URL, navigate, page_load_strategy, wait_until_ready_with_cf
+        from booking import PAGE_FPS, SLOT_INDEX, parse_dates, parse_time_hhmm, build_urls
+        PAGE_FPS.scans = PAGE_FPS.skipped = 0
+        SLOT_INDEX.reset()
+
+        dates = parse_dates(" ".join(cfg.dates))
+        if not dates: log("請輸入至少一個日期。"); return
+        if not cfg.d2_list: log("請至少勾選一個大時段（D2）。"); return
+        from_t = parse_time_hhmm(cfg.from_t) if (cfg.from_t or "").strip() else None
+        to_t = parse_time_hhmm(cfg.to_t) if (cfg.to_t or "").strip() else None
+        flt = SlotFilter.compile(from_t, to_t, "A" in cfg.courts, "B" in cfg.courts, "C" in cfg.courts)
+        hook = self.hook = cfg.dialog_hook and await self._call(self.browser.enable_dialog_hook, log=log)
+        self.lean = await self._call(self.browser.set_lean_load, cfg.lean_load, log=log)
+        log(f"🚦 頁面載入策略 {page_load_strategy(drv)}：導航後立即交給就緒檢查（看表格與按鈕）。")
+
+        urls = build_urls(dates, cfg.d2_list, flt)
+        full = len(dates) * len(cfg.d2_list)
+        if len(urls) < full:
+            log(f"✂️ 略過重複日期與時間篩選不可能符合的大時段：每輪少載入 {full - len(urls)}/{full} 頁。")
+        if not urls: log("HH:MM 篩選與勾選的大時段沒有交集，沒有要載入的頁面。"); return
+        log(f"目標頁面 {len(urls)} 個（篩選：{flt.describe()}）：")
+        for u in urls: log(f"  {u}")
+
+        # 定時啟動：以伺服器時鐘為準，觸發前先暖好目標頁
+        warmed = False
+        release_at = None       # 開放時刻（monotonic）：排程器在這前後不退避
+        if cfg.start_at:
+            now = datetime.now()
+            try: hh, mm, ss = map(int, cfg.start_at.split(":"))
+            except Exception: log("指定時間格式錯誤，請用 HH:MM:SS"); return
+            start_dt = now.replace(hour=hh, minute=mm, second=ss, microsecond=0)
+            if start_dt <= now: start_dt += timedelta(days=1)
+            log(f"等待至 {start_dt:%Y-%m-%d %H:%M:%S}（伺服器時鐘）開始…")
+            timed = TimedStart(start_dt.timestamp(), probe_url=urls[0], log=log)
+            await self._call(timed.calibrate)
+
+            def _prewarm():
+                nonlocal warmed
+                log(f"🔥 觸發前 {PREWARM_S:.0f} 秒先開啟目標頁暖身…")
+                pre = Budget(PREWARM_S, stop=self.stop_flag)
+                if cfg.warmup:
+                    navigate(drv, HOME_URL)
+                    wait_until_ready_with_cf(drv, target_url=HOME_URL, max_wait=PREWARM_S / 2, max_fail_retries=cfg.cf_fail_retries, log=log, bounce_on_fail=False, budget=pre)
+                navigate(drv, urls[0])
+                wait_until_ready_with_cf(drv, target_url=urls[0], max_wait=PREWARM_S / 2, max_fail_retries=cfg.cf_fail_retries, log=log, bounce_on_fail=True, budget=pre)
+                warmed = True
+
+            if not await self._call(timed.wait, self.stop_flag, prewarm=_prewarm):
+                return
+            release_at = time.monotonic() + (timed.fire_at - time.time())
+
+        # 整個執行共用一份預算：暖身、載入、等待、回彈、重試都從這裡扣；每頁分到 剩餘時間÷本回合剩餘頁數（上限 PAGE_MAX_S）
+        run = Budget(cfg.max_wait_min * 60, stop=self.stop_flag)
+        log(f"⏳ 執行預算 {cfg.max_wait_min:g} 分鐘；每頁最多 {PAGE_MAX_S:.0f} 秒，依剩餘時間平均分配。")
+        try:
+            if cfg.single_tab:
+                await self._single_tab(drv, urls, flt, hook, run, warmed, release_at)
+            else:
+                await self._multi_tab(drv, urls, flt, hook, run)
+        finally:
+            from browser_cf import LOAD_STATS
+            for line in LOAD_STATS.summary_lines(): log(line)
+            for line in (self.health.summary_lines() if self.health else []): log(line)
+
+    async def _check_health(self, drv, h: str, url: str, pb: Budget, load_ms: Optional[float],
+                            target=None) -> Optional[Tuple[str, bool]]:
+        """
+        長時間模式：取樣分頁（寫入日誌），超過門檻就回收；回傳 (新 handle, 是否就緒)，沒有回收回傳 None。
+        target：背景分頁的 DevTools.target(h)（不需切換即可取樣）；None = 取樣目前分頁。
+        """
+        from browser_cf import wait_until_ready_with_cf
+        from booking import PAGE_FPS
+        health = self.health
+        if health is None or not health.due(h):
+            return None
+        m = await self._call(sample_tab, target or drv)
+        if m is None:
+            return None
+        rss = await self._call(browser_rss_mb, drv)
+        tabs = 1
+        if rss is not None and health.th.rss_per_tab_mb is not None:
+            tabs = await self._call(lambda: len(drv.window_handles))    # RSS 是整個瀏覽器的，門檻依分頁數放大
+        reason = health.record(h, m, rss, load_ms, tabs)
+        emit(self.log, f"  🧠 heap {m['heap_mb']:.0f} MB、DOM 節點 {m['nodes']}"
+                       + (f"、Chrome RSS {rss:.0f} MB" if rss is not None else "")
+                       + (f"、載入 {load_ms:.0f} ms" if load_ms is not None else ""),
+             phase="metrics", tab=h, rss_mb=rss, load_ms=None if load_ms is None else round(load_ms), **m)
+        if reason is None:
+            return None
+        self.log(f"  ♻️ 回收分頁（{reason}）：以新分頁重開同一網址…")
+        with span("recycle", reason=reason):
+            new = await self._call(_reopen_tab, drv, h, url, self.hook, self.lean)
+            ok = await self._call(wait_until_ready_with_cf, drv, target_url=url, max_wait=PAGE_MAX_S, max_fail_retries=self.cfg.cf_fail_retries, log=self.log, bounce_on_fail=True, budget=pb)
+        health.moved(h, new)
+        PAGE_FPS.move(h, new)
+        return new, ok
+
+    async def _single_tab(self, drv, urls, flt, hook, run: Budget, warmed: bool,
+                          release_at: Optional[float] = None) -> None:
+        from browser_cf import HOME_URL, navigate, page_weight, wait_until_ready_with_cf
+        from booking import PAGE_FPS, SLOT_INDEX, click_all_bookings_on_page
+        cfg, log = self.cfg, self.log
+        # 可先暖身一次（定時啟動已在觸發前暖過就略過）
+        if cfg.warmup and not warmed:
+            await self._call(navigate, drv, HOME_URL)
+            await self._call(wait_until_ready_with_cf, drv, target_url=HOME_URL, max_wait=180, max_fail_retries=cfg.cf_fail_retries, log=log, bounce_on_fail=False, budget=run)
+            await self._sleep(run, 0.4)
+
+        round_id = 0
+        sched = UrlScheduler(urls, base_s=cfg.interval, release_at=release_at)
+        while not run.expired:
+            due = sched.due()
+            if not due:
+                await self._sleep(run, min(sched.wait_s(), 1.0))
+                continue
+            round_id += 1
+            self._ctx(round=round_id, url=None)
+            log(f"=== 單分頁輪詢第 {round_id} 回合：載入 {len(due)}/{len(urls)} 頁 ===")
+            with span("round", round=round_id, pages=len(due)):
+                for i, url in enumerate(due):
+                    if run.expired: break
+                    self._ctx(url=url)
+                    page = {}
+                    pb = run.share(len(due) - i)
+                    t_page = time.perf_counter()
+                    with span("page", url=url) as sp:
+                        with span("load"):
+                            await self._call(navigate, drv, url)
+                        ok = await self._call(wait_until_ready_with_cf, drv, target_url=url, max_wait=PAGE_MAX_S, max_fail_retries=cfg.cf_fail_retries, log=log, bounce_on_fail=True, budget=pb)
+                        load_ms = (time.perf_counter() - t_page) * 1000
+                        if not ok:
+                            sp.set(result="not_ready")
+                            sched.record(url, load_ms, ready=False)
+                            log(f"  此頁仍未就緒，跳過（{sched.period(url):.1f} 秒後再試）。")
+                            continue
+                        await self._call(page_weight, drv, self.lean, log)
+
+                        clicked = await self._call(click_all_bookings_on_page, drv, flt, log_fn=log, max_click=999, cf_fail_retries=cfg.cf_fail_retries, dialog_hook=hook, stats=page, page_key=url, budget=pb)
+                        sp.set(clicked=clicked)
+                        if self.health is not None:
+                            h = await self._call(lambda: drv.current_window_handle)
+                            await self._check_health(drv, h, url, pb, load_ms)
+                    sched.record(url, load_ms, ready=True, **page)
+                    self.total_clicks += clicked
+            if round_id % 10 == 0:
+                log(f"📅 重訪週期（估計較固定輪詢少載入 {sched.saved_loads()} 次）：")
+                for line in sched.summary_lines(): log(line)
+            # 不另外 sleep：下一回合何時開始由排程器的到期時刻決定（見上方 sched.wait_s()）
+
+        log(f"完成。此次總點擊 {self.total_clicks} 筆；共載入 {sched.loads} 次，估計較固定輪詢少載入 {sched.saved_loads()} 次；"
+            f"表格沒變略過掃描 {PAGE_FPS.skipped} 次；避免重複點擊 {SLOT_INDEX.dup_avoided} 次。")
+        for line in sched.summary_lines(): log(line)
+
+    def _move(self, tab: Tab, state: str) -> None:
+        if state != tab.state:
+            emit(self.log, f"  🔀 分頁 {tab.handle[-6:]}：{tab.state} → {state}", phase="tab_state", tab=tab.handle, state=state, prev=tab.state)
+            tab.state, tab.since = state, time.monotonic()
+
+    def _recycled(self, tab: Tab, rec: Tuple[str, bool]) -> None:
+        """回收後新分頁接手舊分頁的狀態（網址、上次檢查時刻），就緒與否以重開後的結果為準。"""
+        tab.handle, ok = rec
+        self._ctx(tab=tab.handle)
+        self._move(tab, READY if ok else LOADING)
+
+    async def _multi_tab(self, drv, urls, flt, hook, run: Budget) -> None:
+        from browser_cf import navigate, page_weight, wait_until_ready_with_cf
+        from booking import PAGE_FPS, SLOT_INDEX
+        cfg, log = self.cfg, self.log
+        devtools = getattr(self.browser, "devtools", None)
+        dt = await self._call(devtools, log) if cfg.background_probe and devtools else None
+        if dt is not None:
+            log("🛰️ 背景分頁以 DevTools 查詢，只在要點擊時切換。")
+        # 多分頁（保守刷新）；有 DevTools 時只有第一頁在前景等待（取得 CF 通行），其餘分頁交給背景狀態機
+        tabs: List[Tab] = []
+        for idx, url in enumerate(urls):
+            if run.expired: return
+            pb = run.share(len(urls) - idx)
+            with span("page", url=url):
+                with span("load"):
+                    if idx > 0:
+                        await self._call(_new_tab, drv, hook, self.lean)
+                    await self._call(navigate, drv, url)
+                t_load = time.perf_counter()
+                h = await self._call(lambda: drv.current_window_handle)
+                if dt is not None and idx > 0:
+                    tabs.append(Tab(h, url))
+                    continue
+                ok = await self._call(wait_until_ready_with_cf, drv, target_url=url, max_wait=PAGE_MAX_S, max_fail_retries=cfg.cf_fail_retries, log=log, bounce_on_fail=True, budget=pb)
+            tabs.append(Tab(h, url, READY if ok else LOADING, (time.perf_counter() - t_load) * 1000))
+            if not ok: log("此分頁等待驗證/載入逾時，稍後輪詢再試。")
+            else: await self._call(page_weight, drv, self.lean, log)
+
+        round_id = 0
+        while not run.expired:
+            round_id += 1
+            self._ctx(round=round_id, tab=None)
+            log(f"=== 多分頁輪詢第 {round_id} 回合 ===")
+            t_round = time.perf_counter()
+            switches = 0
+            with span("round", round=round_id):
+                for i, tab in enumerate(tabs):
+                    if run.expired: break
+                    pb = run.share(len(tabs) - i)
+                    self._ctx(tab=tab.handle)
+                    with span("page", url=tab.url, tab=tab.handle) as sp:
+                        need = "visit"
+                        if dt is not None:
+                            rec = await self._check_health(drv, tab.handle, tab.url, pb, tab.load_ms, target=dt.target(tab.handle))
+                            if rec is not None:
+                                switches += 1
+                                self._recycled(tab, rec)
+                            need = await self._probe_bg(dt, tab, flt)
+                        if need:
+                            switches += 1
+                            await self._visit_tab(drv, tab, flt, hook, pb, need)
+                        sp.set(state=tab.state, switched=bool(need))
+            wall = (time.perf_counter() - t_round) * 1000
+            avoided = max(0, len(tabs) - switches) if dt is not None else 0
+            self.switches_avoided += avoided
+            emit(log, f"⏱️ 第 {round_id} 回合 {wall:.0f} ms：切換分頁 {switches} 次"
+                      + (f"，背景查詢省下 {avoided} 次" if dt is not None else ""),
+                 phase="round", elapsed_ms=round(wall), switches=switches, avoided=avoided)
+            await self._sleep(run, cfg.interval)
+
+        log(f"完成。此次總點擊 {self.total_clicks} 筆；表格沒變略過掃描 {PAGE_FPS.skipped}/{PAGE_FPS.scans + PAGE_FPS.skipped} 次；"
+            f"避免重複點擊 {SLOT_INDEX.dup_avoided} 次；背景查詢省下切換 {self.switches_avoided} 次。")
+
+    async def _probe_bg(self, dt, tab: Tab, flt) -> Optional[str]:
+        """
+        不切換、以 DevTools 查詢分頁並推進狀態；需要切過去處理時回傳原因，否則 None：
+          click = 有還沒點過的符合格；gate = 載入/驗證超過 BG_WAIT_S；fail = 驗證失敗超過重試次數；visit = 查不到分頁
+        """
+        from booking import PAGE_FPS, SLOT_INDEX, record_snapshot, snapshot_from
+        cfg = self.cfg
+        t0 = time.perf_counter()
+        with span("probe", background=True):
+            r = await self._call(dt.probe_tab, tab.handle, (*flt.js_args(), PAGE_FPS.prev_fp(tab.handle)))
+        ms = round((time.perf_counter() - t0) * 1000, 1)
+        if r is None:
+            record("probe", tab=tab.handle, url=tab.url, state=None, ms=ms)
+            return "visit"
+        state = probe_state(r)
+        record("probe", tab=tab.handle, url=tab.url, state=state, ms=ms, fp=r.get("fp"), same=bool(r.get("same")),
+               total=r.get("total"), matched=len(r.get("slots") or []))
+        if state == STALE:
+            tab.fails += 1
+            if tab.fails > cfg.cf_fail_retries:
+                self._move(tab, STALE)
+                return "fail"
+            self._move(tab, STALE)
+            return await self._reload_bg(dt, tab)
+        if state != READY:
+            self._move(tab, state)
+            return "gate" if tab.age() > BG_WAIT_S else None
+        tab.fails = 0
+        if not tab.ready:
+            tab.load_ms = tab.age() * 1000      # 背景載入：精確度到回合間隔
+        snap = snapshot_from(r)
+        if snap.same:
+            PAGE_FPS.skipped += 1
+        else:
+            PAGE_FPS.scans += 1
+            fresh = SLOT_INDEX.unclicked([s for s, _ in snap.slots])
+            record_snapshot(tab.handle, snap, len(fresh), self.log)
+            if fresh:
+                self._move(tab, READY)
+                return "click"
+        if tab.state != CLICKED:
+            self._move(tab, READY)
+        if time.time() - tab.last_check > cfg.stale_sec:
+            self._move(tab, STALE)
+            return await self._reload_bg(dt, tab)
+        return None
+
+    async def _reload_bg(self, dt, tab: Tab) -> Optional[str]:
+        with span("load", stale=True, background=True):
+            ok = await self._call(dt.reload, tab.handle)
+        record("reload", tab=tab.handle, url=tab.url, ok=ok)
+        tab.last_check = time.time()
+        if not ok:
+            return "visit"
+        self._move(tab, LOADING)
+        return None
+
+    async def _visit_tab(self, drv, tab: Tab, flt, hook, pb: Budget, why: str) -> None:
+        """切到分頁處理：必要時前景等待就緒 → 點擊；沒有 DevTools（why=visit）時也在這裡做逾時重新整理。"""
+        from browser_cf import navigate, page_weight, wait_until_ready_with_cf
+        from booking import click_all_bookings_on_page
+        cfg, log = self.cfg, self.log
+        with span("switch", why=why):
+            try: await self._call(drv.switch_to.window, tab.handle)
+            except Exception: return
+
+        rec = await self._check_health(drv, tab.handle, tab.url, pb, tab.load_ms)
+        if rec is not None:
+            self._recycled(tab, rec)
+
+        now_ts = time.time()
+        if why != "click" and not tab.ready:
+            ok = await self._call(wait_until_ready_with_cf, drv, target_url=tab.url, max_wait=PAGE_MAX_S, max_fail_retries=cfg.cf_fail_retries, log=log, bounce_on_fail=True, budget=pb)
+            tab.last_check = now_ts
+            tab.fails = 0
+            self._move(tab, READY if ok else LOADING)
+            if not ok: log("  仍未通過驗證/載入，留待下輪。"); return
+
+        clicked = await self._call(click_all_bookings_on_page, drv, flt, log_fn=log, max_click=999, dialog_hook=hook, page_key=tab.handle, budget=pb)
+        if clicked > 0:
+            self.total_clicks += clicked
+            tab.last_check = now_ts
+            self._move(tab, CLICKED)
+            return
+
+        if why == "visit" and now_ts - tab.last_check > cfg.stale_sec:
+            self._move(tab, STALE)
+            t_load = time.perf_counter()
+            with span("load", stale=True):
+                try: await self._call(navigate, drv)
+                except Exception: pass
+            ok = await self._call(wait_until_ready_with_cf, drv, target_url=tab.url, max_wait=PAGE_MAX_S, max_fail_retries=cfg.cf_fail_retries, log=log, bounce_on_fail=True, budget=pb)
+            tab.last_check = time.time()
+            tab.load_ms = (time.perf_counter() - t_load) * 1000
+            self._move(tab, READY if ok else LOADING)
+            if ok: await self._call(page_weight, drv, self.lean, log)
+
+
+def _new_tab(drv, hook: bool, lean: bool = False) -> str:
+    """
+    開新分頁並切過去；CDP 的 addScriptToEvaluateOnNewDocument 與 Network.setBlockedURLs 只對下指令的那個分頁有效，
+    攔截器與精簡載入要在新分頁導航前再套一次。回傳新 handle。
+    """
+    from browser_cf import install_dialog_hook, set_lean_load
+    drv.switch_to.new_window('tab')
+    if hook: install_dialog_hook(drv)
+    if lean: set_lean_load(drv, True)
+    return drv.current_window_handle
+
+def _reopen_tab(drv, old: str, url: str, hook: bool = False, lean: bool = False) -> str:
+    """先開新分頁再關掉舊分頁（瀏覽器不會一度沒有視窗），新分頁載入同一網址；回傳新 handle。"""
+    from browser_cf import navigate
+    new = _new_tab(drv, hook, lean)
+    drv.switch_to.window(old)
+    drv.close()
+    drv.switch_to.window(new)
+    navigate(drv, url)
+    return new
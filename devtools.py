@@ -0,0 +1,138 @@
+# devtools.py
+# 不切換視窗查詢背景分頁：經由 Chrome remote debugging（/json/list + 各分頁的 websocket），
+# 對指定分頁 Runtime.evaluate 一次「CF 探測 + 可預約格快照」（同 browser_cf._CF_PROBE_JS、booking._MATCH_JS），
+# 或以 Page.reload 重新整理。chromedriver 的 window handle 就是 DevTools target id，兩邊可直接對應。
+#
+#   dt = DevTools.attach(drv)                 # 取不到 debuggerAddress 或沒有 websocket-client 時回傳 None
+#   r = dt.probe_tab(handle, (*flt.js_args(), prev_fp))
+#   # → {state, table, buttons, url, fp, same, total, slots: [[None, 時間, 場地, a, b]], all: [...]}
+
+import itertools
+import json
+import urllib.request
+from typing import Any, Dict, Optional
+
+try:
+    import websocket               # websocket-client（selenium 的相依套件）
+except ImportError:
+    websocket = None
+
+from booking import _MATCH_JS
+from browser_cf import _CF_PROBE_JS
+
+# 快照中的 WebElement 無法跨 websocket 傳回，換成 null（點擊時才切到該分頁重新快照）
+_TAB_PROBE_EXPR = """(function () {
+  const probe = (function () {%s})();
+  const snap = (function () {%s}).apply(null, %%s);
+  if (snap.slots) snap.slots = snap.slots.map((s) => [null].concat(s.slice(1)));
+  return Object.assign(snap, probe);
+})()""" % (_CF_PROBE_JS, _MATCH_JS)
+
+
+class DevToolsError(Exception):
+    pass
+
+
+class _Target:
+    """給 metrics.sample_tab 用：把 execute_cdp_cmd 導到指定分頁。"""
+
+    def __init__(self, dt: "DevTools", handle: str):
+        self._dt = dt
+        self._handle = handle
+
+    def execute_cdp_cmd(self, cmd: str, params: dict) -> dict:
+        return self._dt.send(self._handle, cmd, params)
+
+
+class DevTools:
+    """一個 remote debugging 位址；每個分頁各開一條 websocket（首次使用時連線，之後重用）。"""
+
+    def __init__(self, address: str, timeout: float = 5.0):
+        self.address = address
+        self.timeout = timeout
+        self._ws: Dict[str, Any] = {}
+        self._ids = itertools.count(1)
+        self.calls = 0
+
+    @classmethod
+    def attach(cls, driver) -> Optional["DevTools"]:
+        caps = getattr(driver, "capabilities", None) or {}
+        addr = (caps.get("goog:chromeOptions") or {}).get("debuggerAddress")
+        if not addr or websocket is None:
+            return None
+        dt = cls(addr)
+        try:
+            dt.targets()
+        except Exception:
+            return None
+        return dt
+
+    def targets(self) -> Dict[str, dict]:
+        """目前的分頁（type=page）：target id（大寫）→ /json/list 的項目。"""
+        with urllib.request.urlopen(f"http://{self.address}/json/list", timeout=self.timeout) as r:
+            items = json.loads(r.read().decode("utf-8"))
+        return {t["id"].upper(): t for t in items if t.get("type") == "page"}
+
+    def _conn(self, handle: str):
+        key = handle.upper()
+        ws = self._ws.get(key)
+        if ws is None:
+            t = self.targets().get(key)
+            if not t or not t.get("webSocketDebuggerUrl"):
+                raise DevToolsError(f"找不到分頁 {handle}")
+            ws = websocket.create_connection(t["webSocketDebuggerUrl"], timeout=self.timeout, suppress_origin=True)
+            self._ws[key] = ws
+        return ws
+
+    def send(self, handle: str, method: str, params: Optional[dict] = None) -> dict:
+        """對分頁送一個 CDP 命令並等它的回應（略過其間的事件）；連線失效時丟掉快取，下次重連。"""
+        self.calls += 1
+        try:
+            ws = self._conn(handle)
+            mid = next(self._ids)
+            ws.send(json.dumps({"id": mid, "method": method, "params": params or {}}))
+            while True:
+                msg = json.loads(ws.recv())
+                if msg.get("id") == mid:
+                    break
+        except DevToolsError:
+            raise
+        except Exception as e:
+            self._drop(handle)
+            raise DevToolsError(str(e)) from e
+        if "error" in msg:
+            raise DevToolsError(msg["error"].get("message", "CDP error"))
+        return msg.get("result") or {}
+
+    def evaluate(self, handle: str, expression: str) -> Any:
+        r = self.send(handle, "Runtime.evaluate", {"expression": expression, "returnByValue": True})
+        if r.get("exceptionDetails"):
+            raise DevToolsError(r["exceptionDetails"].get("text", "evaluate failed"))
+        return (r.get("result") or {}).get("value")
+
+    def probe_tab(self, handle: str, js_args) -> Optional[dict]:
+        """背景分頁的 CF 狀態 + 可預約格快照（js_args = (*SlotFilter.js_args(), prev_fp)）；失敗回傳 None。"""
+        try:
+            return self.evaluate(handle, _TAB_PROBE_EXPR % json.dumps(list(js_args)))
+        except DevToolsError:
+            return None
+
+    def reload(self, handle: str) -> bool:
+        try:
+            self.send(handle, "Page.reload", {"ignoreCache": False})
+            return True
+        except DevToolsError:
+            return False
+
+    def target(self, handle: str) -> _Target:
+        return _Target(self, handle)
+
+    def _drop(self, handle: str) -> None:
+        ws = self._ws.pop(handle.upper(), None)
+        if ws is not None:
+            try: ws.close()
+            except Exception: pass
+
+    def close(self) -> None:
+        for h in list(self._ws):
+            self._drop(h)
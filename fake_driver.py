@@ -0,0 +1,409 @@
+# fake_driver.py
+# 記憶體內的假 WebDriver：不開瀏覽器，用 standin_server 的頁面與預約規則回應 booking / browser_cf 用到的操作
+# （browser_cf.Driver）。每次呼叫可加固定延遲並計數，用來量測流程本身的開銷與每頁 WebDriver 往返次數。
+#
+#   st = SiteState(release_at=0, occupied_rate=0.3, cf_fail_rate=0.1)
+#   drv = FakeDriver(st, latency_ms=2)
+#   drv.get(build_urls(["2025/10/01"], [4])[0])
+#   click_all_bookings_on_page(drv, SlotFilter.compile("19:00", None))
+#   print(drv.round_trips, drv.calls)
+#
+# 頁內 JS 不會真的執行：依腳本常數（booking._MATCH_JS、browser_cf._READY_WAIT_JS …）辨識後以 Python 模擬結果，
+# 其餘腳本（stealth、dismiss_cf_banner、_HUMAN_JS）只算一次往返。表格由 slots.py 的 Python 參考實作解析。
+# 因此以 FakeDriver 跑的檢查（tests/test_flow.py）只涵蓋 Python 端流程與往返次數，不涵蓋頁內腳本本身；
+# 腳本改壞了這些檢查照樣會過。頁內腳本與這裡的模擬是否一致由 tests/test_browser_js.py 以真的 Chrome 驗證（沒有 Chrome 時略過）。
+
+import itertools
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from selenium.common.exceptions import (JavascriptException, NoAlertPresentException,
+                                        StaleElementReferenceException, UnexpectedAlertPresentException,
+                                        WebDriverException)
+
+import booking
+import browser_cf
+import recorder
+from slots import STEP3_RE, Slot, SlotFilter, extract_tables, iter_slots, url_params
+from standin_server import SiteState, page_booking
+
+
+class FakeElement:
+    """預約表裡的一顆〔預定場地〕圖片。"""
+
+    def __init__(self, driver: "FakeDriver", page: "_Page", slot: Slot):
+        self._driver = driver
+        self._page = page
+        self.slot = slot
+        self.available = slot.available
+
+    def click(self) -> None:
+        drv, page = self._driver, self._page
+        drv._rt("click")
+        if drv._tab() is not page:
+            raise StaleElementReferenceException("element is not attached to the page document")
+        if page.alert is not None:
+            raise UnexpectedAlertPresentException(alert_text=page.alert.text)
+        if not self.available:
+            return
+        if page.hook:       # 頁內攔截器：confirm 直接接受，結果寫進佇列
+            page.push("confirm", _Alert.CONFIRM_TEXT, self)
+            self._submit()
+        else:
+            page.alert = _Alert(self)
+
+    def _submit(self) -> None:
+        """confirm 按下確定 → 伺服器回應 → SweetAlert2（state.book 回傳 None = 沒有回應）。"""
+        r = self._driver.state.book(self.slot.a, self.slot.b)
+        if r is None:
+            return
+        if r["ok"]:
+            self.available = False
+        text = f"{r['title']} {r['text']}"
+        if self._page.hook:
+            self._page.push("swal", text, self)
+        else:
+            self._page.swal.append(text)
+
+
+class _Alert:
+    CONFIRM_TEXT = "確定要預約此場地嗎？"
+
+    def __init__(self, el: FakeElement):
+        self.el = el
+        self.text = self.CONFIRM_TEXT
+
+    def accept(self) -> None:
+        self.el._driver._rt("alert_accept")
+        self.el._page.alert = None
+        self.el._submit()
+
+    def dismiss(self) -> None:
+        self.el._driver._rt("alert_dismiss")
+        self.el._page.alert = None
+
+
+class _Page:
+    def __init__(self, url: str, kind: str = "other", hook: bool = False):
+        self.url = url
+        self.kind = kind            # booking / gate / fail / other
+        self.gate_until = 0.0
+        self.elements: List[FakeElement] = []
+        self.hook = hook
+        self.click_tok = None
+        self.alert: Optional[_Alert] = None
+        self.swal: List[str] = []
+        self.dialogs: List[dict] = []
+        self.pending: List[Optional[str]] = []
+        self.html = ""                  # 預約表 HTML（recorder._TABLES_JS 的回應）
+        self.heap_mb = 20.0             # Performance.getMetrics 回報的 JS heap：同一分頁每次導航 +HEAP_GROWTH_MB
+
+    def push(self, kind: str, text: str, el: FakeElement) -> None:
+        """同 _DIALOG_HOOK_JS：confirm 記下場地，結果對話框依序對應回去。"""
+        sid = f"{el.slot.a},{el.slot.b}"
+        if kind == "confirm":
+            self.pending.append(sid)
+        else:
+            sid = self.pending.pop(0) if self.pending else None
+        cls = ("cf_fail" if re.search(r"驗證失敗|重新驗證|verification failed", text, re.I)
+               else "error" if re.search(r"失敗|錯誤|已被預約|額滿|error", text, re.I) else "ok")
+        self.dialogs.append({"kind": kind, "text": text, "cls": cls, "slot": sid,
+                             "t": int(time.time() * 1000), "url": self.url})
+
+    def probe(self) -> dict:
+        state = {"gate": "gate", "fail": "fail"}.get(self.kind, "none")
+        return {"state": state, "table": self.kind == "booking",
+                "buttons": any(e.available for e in self.elements)}
+
+
+class _SwitchTo:
+    def __init__(self, driver: "FakeDriver"):
+        self._d = driver
+
+    @property
+    def alert(self) -> _Alert:
+        self._d._rt("alert")
+        a = self._d._tab().alert
+        if a is None:
+            raise NoAlertPresentException("no such alert")
+        return a
+
+    def window(self, handle: str) -> None:
+        self._d._rt("switch_window")
+        if handle not in self._d._tabs:
+            raise KeyError(handle)
+        self._d._current = handle
+
+    def new_window(self, type_hint: Optional[str] = None) -> None:
+        self._d._rt("new_window")
+        h = f"tab-{next(self._d._ids)}"
+        self._d._tabs[h] = _Page("about:blank")      # 新分頁沒有 addScriptToEvaluateOnNewDocument 註冊
+        self._d._current = h
+
+
+class FakeDriver:
+    """
+    latency_ms     : 每次 WebDriver 呼叫的固定延遲（模擬 chromedriver 往返）
+    nav_latency_ms : get()/refresh() 額外的載入時間
+    page_load      : capabilities 的 pageLoadStrategy（假頁面一次就載完，只影響 browser_cf.navigate 的分支）
+    calls          : 各種呼叫的次數（Counter）；round_trips 為總和
+    分頁的 JS heap 隨導航次數成長（HEAP_GROWTH_MB），關掉重開才歸零，用來驗證長時間模式的分頁回收。
+    execute_script / execute_async_script 不執行傳入的 JS，只依腳本常數回傳 Python 模擬值（見檔頭說明）。
+    quit() 會中斷進行中的 _READY_WAIT_JS 等待（同真的瀏覽器被關掉時，卡在 execute_async_script 的呼叫立即失敗）。
+    """
+    HEAP_GROWTH_MB = 8.0
+
+    def __init__(self, state: Optional[SiteState] = None, latency_ms: float = 0.0, nav_latency_ms: float = 0.0,
+                 page_load: str = "normal"):
+        self.state = state or SiteState(release_at=0.0)
+        self.capabilities = {"pageLoadStrategy": page_load}
+        self.latency_s = latency_ms / 1000.0
+        self.nav_latency_s = nav_latency_ms / 1000.0
+        self.calls: Counter = Counter()
+        self.switch_to = _SwitchTo(self)
+        self.cleared = False              # 已通過 CF（cf_clearance）
+        self._hooked: set = set()         # 已以 CDP 註冊攔截器的分頁（註冊只對單一分頁有效）
+        self.blocked: Dict[str, List[str]] = {}   # 分頁 → Network.setBlockedURLs 的清單（同樣只對單一分頁有效）
+        self._closed = threading.Event()
+        self._ids = itertools.count(1)
+        self._tabs: Dict[str, _Page] = {"tab-0": _Page("about:blank")}
+        self._current = "tab-0"
+        self._scripts = {
+            booking._MATCH_JS: self._js_match,
+            booking._PRE_CLICK_JS: self._js_pre_click,
+            booking._OUTCOME_JS: self._js_outcome,
+            browser_cf._CF_PROBE_JS: lambda page, args: page.probe(),
+            browser_cf._DIALOG_HOOK_JS: self._js_hook,
+            recorder._TABLES_JS: lambda page, args: {"url": page.url, "html": page.html},
+        }
+        self._async_scripts = {
+            browser_cf._READY_WAIT_JS: self._js_ready_wait,
+            browser_cf._DIALOG_DRAIN_JS: self._js_drain,
+        }
+
+    # ---- 計數 ----
+    @property
+    def round_trips(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_counts(self) -> None:
+        self.calls.clear()
+
+    def _rt(self, name: str) -> None:
+        self.calls[name] += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def _tab(self) -> _Page:
+        return self._page(self._current)
+
+    def _page(self, handle: str) -> _Page:
+        page = self._tabs[handle]
+        if page.kind == "gate" and time.time() >= page.gate_until:
+            self.cleared = True           # 驗證通過 → 導向原頁面
+            page = self._tabs[handle] = self._build(page.url, handle, allow_gate=False)
+        return page
+
+    # ---- 導航 ----
+    def _build(self, url: str, handle: str, allow_gate: bool = True) -> _Page:
+        st, hook = self.state, handle in self._hooked
+        if allow_gate and st.gate_ms and (not self.cleared or st.roll(st.gate_rate)):
+            page = _Page(url, "gate", hook)
+            page.gate_until = time.time() + st.gate_ms / 1000.0
+            return page
+        if st.roll(st.block_rate):
+            return _Page(url, "fail", hook)
+        date, d2 = url_params(url)
+        if "booking_place" not in url or not date:
+            return _Page(url, "other", hook)
+        return self._booking_page(url, page_booking(st, date, d2 or 0), hook)
+
+    def _booking_page(self, url: str, html: str, hook: bool = False) -> _Page:
+        date, d2 = url_params(url)
+        page = _Page(url, "booking", hook)
+        page.html = html
+        page.elements = [FakeElement(self, page, s) for s, _ in iter_slots(extract_tables(html), date, d2) if s.available]
+        return page
+
+    def _navigate(self, url: str, handle: Optional[str] = None) -> None:
+        handle = handle or self._current
+        if self.nav_latency_s:
+            time.sleep(self.nav_latency_s)
+        heap = self._tabs[handle].heap_mb
+        page = self._tabs[handle] = self._build(url, handle)
+        page.heap_mb = heap + self.HEAP_GROWTH_MB
+
+    def get(self, url: str) -> None:
+        self._rt("get")
+        self._navigate(url)
+
+    def refresh(self) -> None:
+        self._rt("refresh")
+        self._navigate(self._tabs[self._current].url)
+
+    @property
+    def current_url(self) -> str:
+        self._rt("current_url")
+        return self._tab().url
+
+    @property
+    def current_window_handle(self) -> str:
+        self._rt("current_window_handle")
+        return self._current
+
+    @property
+    def window_handles(self) -> List[str]:
+        self._rt("window_handles")
+        return list(self._tabs)
+
+    def implicitly_wait(self, s: float) -> None:
+        self._rt("implicitly_wait")
+
+    def set_page_load_timeout(self, s: float) -> None:
+        self._rt("set_page_load_timeout")
+
+    def close(self) -> None:
+        """關閉目前分頁（之後需 switch_to.window 到其他分頁）。"""
+        self._rt("close")
+        del self._tabs[self._current]
+
+    def quit(self) -> None:
+        self._closed.set()
+        self._rt("quit")
+        self._tabs.clear()
+
+    # ---- 腳本 ----
+    def execute_script(self, script: str, *args):
+        self._rt("execute_script")
+        page = self._tab()
+        if page.alert is not None:
+            # 同 Chrome 預設 unhandledPromptBehavior：關掉（取消）對話框並回報
+            text = page.alert.text
+            page.alert = None
+            raise UnexpectedAlertPresentException(alert_text=text)
+        fn = self._scripts.get(script)
+        return fn(page, args) if fn else None
+
+    def execute_async_script(self, script: str, *args):
+        self._rt("execute_async_script")
+        fn = self._async_scripts.get(script)
+        return fn(self._tab(), args) if fn else None
+
+    def execute_cdp_cmd(self, cmd: str, params: dict):
+        self._rt("execute_cdp_cmd")
+        if cmd == "Page.addScriptToEvaluateOnNewDocument" and params.get("source") == browser_cf._DIALOG_HOOK_JS:
+            self._hooked.add(self._current)
+        if cmd == "Network.setBlockedURLs":
+            self.blocked[self._current] = list(params.get("urls") or [])
+        if cmd == "Performance.getMetrics":
+            return self._metrics(self._tab())
+        return {}
+
+    @staticmethod
+    def _metrics(page: _Page) -> dict:
+        return {"metrics": [{"name": "JSHeapUsedSize", "value": page.heap_mb * 1024 * 1024},
+                            {"name": "JSHeapTotalSize", "value": page.heap_mb * 1.5 * 1024 * 1024},
+                            {"name": "Nodes", "value": 400 + 30 * len(page.elements)},
+                            {"name": "Documents", "value": 1}]}
+
+    def find_elements(self, by: str, value: str) -> list:
+        self._rt("find_elements")
+        m = STEP3_RE.search(value or "")
+        if not m:
+            return []
+        return [e for e in self._tab().elements if e.available and (e.slot.a, e.slot.b) == m.groups()]
+
+    def _js_match(self, page: _Page, args) -> dict:
+        flt = SlotFilter(args[0], args[1], frozenset(args[2] or ""))
+        prev_fp = args[3] if len(args) > 3 else None
+        avail = [e for e in page.elements if e.available]
+        fp = f"{len(page.elements)}:{hash(tuple((e.slot.a, e.slot.b) for e in avail)) & 0xffffffff:x}"
+        closed = "未開放" in page.html
+        if prev_fp and fp == prev_fp:
+            return {"url": page.url, "fp": fp, "same": True, "closed": closed}
+        return {"url": page.url, "fp": fp, "same": False, "closed": closed, "total": len(avail),
+                "slots": [[e, e.slot.time, e.slot.court, e.slot.a, e.slot.b] for e in avail if flt.matches(e.slot)],
+                "all": [[e.slot.time, e.slot.court, e.slot.a, e.slot.b] for e in avail]}
+
+    def _js_pre_click(self, page: _Page, args) -> None:
+        page.click_tok = args[1]
+
+    def _js_outcome(self, page: _Page, args) -> dict:
+        if page.swal:
+            return {"dialog": "swal", "text": page.swal.pop(0), "nav": False}
+        return {"dialog": None, "text": "", "nav": page.click_tok != args[0]}
+
+    def _js_hook(self, page: _Page, args) -> None:
+        page.hook = True
+
+    def _js_ready_wait(self, page: _Page, args) -> dict:
+        timeout_s = (args[0] if args else 0) / 1000.0
+        r = page.probe()
+        if r["buttons"] or r["state"] == "fail":
+            return dict(r, how="immediate", waited_ms=0)
+        if page.kind == "gate":
+            wait_s = min(timeout_s, max(0.0, page.gate_until - time.time()))
+            if self._closed.wait(wait_s):
+                raise WebDriverException("chrome not reachable")
+            if time.time() >= page.gate_until:
+                self._tab()
+                raise JavascriptException("javascript error: document unloaded while waiting for result")
+            return dict(r, how="timeout", waited_ms=wait_s * 1000)
+        if self._closed.wait(timeout_s):    # 表格不會自己變化：等到逾時
+            raise WebDriverException("chrome not reachable")
+        return dict(page.probe(), how="timeout", waited_ms=timeout_s * 1000)
+
+    def _js_drain(self, page: _Page, args) -> dict:
+        out = {"dialogs": page.dialogs, "unresolved": list(page.pending), "hook": page.hook}
+        page.dialogs, page.pending = [], []
+        return out
+
+
+
+class FakeDevTools:
+    """
+    devtools.DevTools 的替身：不切換 FakeDriver 的目前分頁，直接查詢/重新整理指定分頁。
+    calls 與 FakeDriver.calls 分開計數（真的環境裡走的是另一條 websocket，不佔 chromedriver 往返）。
+    """
+
+    def __init__(self, driver: FakeDriver):
+        self._d = driver
+        self.calls: Counter = Counter()
+
+    def probe_tab(self, handle: str, js_args) -> Optional[dict]:
+        self.calls["probe_tab"] += 1
+        if handle not in self._d._tabs:
+            return None
+        page = self._d._page(handle)
+        snap = self._d._js_match(page, list(js_args))
+        if snap.get("slots"):
+            snap["slots"] = [[None] + s[1:] for s in snap["slots"]]
+        return dict(snap, **page.probe())
+
+    def reload(self, handle: str) -> bool:
+        self.calls["reload"] += 1
+        if handle not in self._d._tabs:
+            return False
+        self._d._navigate(self._d._tabs[handle].url, handle)
+        return True
+
+    def target(self, handle: str) -> "_FakeTarget":
+        return _FakeTarget(self, handle)
+
+    def close(self) -> None:
+        pass
+
+
+class _FakeTarget:
+    def __init__(self, dt: FakeDevTools, handle: str):
+        self._dt = dt
+        self._handle = handle
+
+    def execute_cdp_cmd(self, cmd: str, params: dict) -> dict:
+        self._dt.calls[cmd] += 1
+        if cmd == "Performance.getMetrics" and self._handle in self._dt._d._tabs:
+            return FakeDriver._metrics(self._dt._d._tabs[self._handle])
+        return {}
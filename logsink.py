@@ -0,0 +1,131 @@
+# logsink.py
+# 非阻塞日誌：工作執行緒只把紀錄丟進佇列（近乎零成本），Tk 執行緒以 after() 批次取出寫入畫面；
+# 畫面只保留最近 max_lines 行，另可選擇輪替的 JSONL 檔案（含 round/url/phase/elapsed_ms 等結構化欄位）。
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+class LogRecord:
+    __slots__ = ("ts", "msg", "fields")
+
+    def __init__(self, ts: float, msg: str, fields: dict):
+        self.ts = ts
+        self.msg = msg
+        self.fields = fields
+
+    def line(self) -> str:
+        return f"[{datetime.fromtimestamp(self.ts):%H:%M:%S}] {self.msg}"
+
+    def to_json(self) -> str:
+        d = {"ts": round(self.ts, 3), "msg": self.msg}
+        d.update(self.fields)
+        return json.dumps(d, ensure_ascii=False, default=str)
+
+
+class LogSink:
+    """
+    可直接當 log_fn 使用：sink("訊息", phase="ready", elapsed_ms=123)。
+    set_context(round=3, url=...) 設定的欄位會併入之後的每一筆紀錄。
+    """
+    structured = True   # emit() 以此判斷可否傳結構化欄位
+
+    def __init__(self, max_lines: int = 2000, batch: int = 500):
+        self.max_lines = max_lines
+        self.batch = batch
+        self._q: "queue.SimpleQueue[LogRecord]" = queue.SimpleQueue()
+        self._ctx: dict = {}
+        self._ctx_lock = threading.Lock()
+        self._file: Optional[logging.Logger] = None
+        self._listeners: List[Callable[[LogRecord], None]] = []
+
+    # ---- 生產端（任何執行緒） ----
+    def __call__(self, msg: str, **fields) -> None:
+        if self._ctx:
+            with self._ctx_lock:
+                merged = dict(self._ctx)
+            merged.update(fields)
+            fields = merged
+        self._q.put(LogRecord(time.time(), msg, fields))
+
+    def set_context(self, **fields) -> None:
+        """更新（值為 None 則移除）附加在每筆紀錄上的欄位。"""
+        with self._ctx_lock:
+            for k, v in fields.items():
+                if v is None: self._ctx.pop(k, None)
+                else: self._ctx[k] = v
+
+    def clear_context(self) -> None:
+        with self._ctx_lock:
+            self._ctx.clear()
+
+    # ---- 消費端 ----
+    def open_file(self, path: str, max_bytes: int = 5 * 1024 * 1024, backups: int = 3) -> None:
+        """另外寫入輪替 JSONL 檔（超過 max_bytes 輪替，保留 backups 份）。"""
+        if self._file is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        lg = logging.getLogger(f"booking.sink.{id(self)}")
+        lg.propagate = False
+        lg.setLevel(logging.INFO)
+        h = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        h.setFormatter(logging.Formatter("%(message)s"))
+        lg.addHandler(h)
+        self._file = lg
+
+    def close_file(self) -> None:
+        if self._file is not None:
+            for h in list(self._file.handlers):
+                h.close(); self._file.removeHandler(h)
+            self._file = None
+
+    def add_listener(self, fn: Callable[[LogRecord], None]) -> None:
+        """每筆紀錄在 pump() 時額外交給 fn（例如 stdout 串流）。"""
+        self._listeners.append(fn)
+
+    def pump(self, limit: Optional[int] = None) -> List[LogRecord]:
+        """取出目前佇列中的紀錄（最多 limit 筆），寫入檔案/listener 後回傳。"""
+        out: List[LogRecord] = []
+        limit = self.batch if limit is None else limit
+        try:
+            while len(out) < limit:
+                out.append(self._q.get_nowait())
+        except queue.Empty:
+            pass
+        for rec in out:
+            if self._file is not None:
+                self._file.info(rec.to_json())
+            for fn in self._listeners:
+                try: fn(rec)
+                except Exception: pass
+        return out
+
+    def attach_tk(self, root, text_widget, interval_ms: int = 100) -> None:
+        """在 Tk 執行緒以 after() 定期批次寫入 text_widget，只保留最近 max_lines 行。"""
+        def _drain():
+            recs = self.pump()
+            if recs:
+                text_widget.insert("end", "".join(r.line() + "\n" for r in recs))
+                excess = int(text_widget.index("end-1c").split(".")[0]) - 1 - self.max_lines
+                if excess > 0:
+                    text_widget.delete("1.0", f"{excess + 1}.0")
+                text_widget.see("end")
+            # 佇列還有存貨就立刻再排一次，否則照常間隔
+            root.after(1 if len(recs) >= self.batch else interval_ms, _drain)
+        root.after(interval_ms, _drain)
+
+
+def emit(log: Optional[Callable[..., None]], msg: str, **fields) -> None:
+    """送出紀錄；log 支援結構化欄位（LogSink）才帶 fields，否則（如 print）只傳文字。"""
+    if log is None:
+        return
+    if getattr(log, "structured", False):
+        log(msg, **fields)
+    else:
+        log(msg)
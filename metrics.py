@@ -0,0 +1,109 @@
+# metrics.py
+# 長時間執行：以 CDP Performance.getMetrics 取樣每個分頁的 JS heap、DOM 節點數（有裝 psutil 時另加整個 Chrome 的 RSS，
+# RSS 是整個瀏覽器的總和，門檻以「每分頁上限 × 目前分頁數」比較），
+# 超過門檻的分頁由 core 關掉重開（同網址，tab_ready/tab_last_check 等狀態沿用）。
+# 每次取樣都以 phase="metrics" 寫進執行日誌，可對照同一分頁的重新載入耗時，判斷延遲變慢是否來自記憶體。
+#
+#   health = TabHealth(Thresholds(heap_mb=256, nodes=60000))
+#   m = sample_tab(drv)                       # 需先切到該分頁
+#   reason = health.record(handle, m, rss, load_ms=..., tabs=len(handles))   # 非 None = 該回收
+
+import time
+from typing import Dict, List, Optional
+
+try:
+    import psutil                  # 可選：量測 Chrome 行程 RSS
+except ImportError:
+    psutil = None
+
+MB = 1024 * 1024
+
+
+class Thresholds:
+    """
+    heap_mb  : 分頁 JSHeapUsedSize 上限（MB）
+    nodes    : 分頁 DOM 節點數上限
+    rss_per_tab_mb : 每個分頁可分到的 Chrome RSS（MB，需 psutil；None = 不檢查）；
+                     整個 Chrome（瀏覽器 + 子行程）的 RSS 超過 此值 × 目前分頁數 才回收
+    every_s  : 同一分頁兩次取樣的最短間隔（秒）
+    """
+
+    def __init__(self, heap_mb: float = 256.0, nodes: int = 60000, rss_per_tab_mb: Optional[float] = None,
+                 every_s: float = 60.0):
+        self.heap_mb = heap_mb
+        self.nodes = nodes
+        self.rss_per_tab_mb = rss_per_tab_mb
+        self.every_s = every_s
+
+
+def sample_tab(driver) -> Optional[dict]:
+    """目前分頁的效能指標：heap_mb / heap_total_mb / nodes / documents / listeners（不支援 CDP 時回傳 None）。"""
+    try:
+        driver.execute_cdp_cmd("Performance.enable", {})      # 已啟用時為 no-op
+        raw = driver.execute_cdp_cmd("Performance.getMetrics", {}) or {}
+    except Exception:
+        return None
+    m = {x.get("name"): x.get("value") for x in raw.get("metrics") or []}
+    if "JSHeapUsedSize" not in m:
+        return None
+    return {"heap_mb": round(m["JSHeapUsedSize"] / MB, 1),
+            "heap_total_mb": round(m.get("JSHeapTotalSize", 0) / MB, 1),
+            "nodes": int(m.get("Nodes", 0)),
+            "documents": int(m.get("Documents", 0)),
+            "listeners": int(m.get("JSEventListeners", 0))}
+
+def browser_rss_mb(driver) -> Optional[float]:
+    """Chrome 主行程與所有子行程（renderer/GPU…）的 RSS 總和；沒有 psutil 或取不到 PID 時回傳 None。"""
+    pid = getattr(driver, "browser_pid", None)
+    if psutil is None or not pid:
+        return None
+    try:
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+        return round(sum(p.memory_info().rss for p in procs if p.is_running()) / MB, 1)
+    except Exception:
+        return None
+
+
+class TabHealth:
+    """每個分頁的取樣時間序列與回收判斷。"""
+
+    def __init__(self, th: Optional[Thresholds] = None):
+        self.th = th or Thresholds()
+        self.last: Dict[str, float] = {}          # handle → 上次取樣時刻（monotonic）
+        self.series: Dict[str, List[dict]] = {}   # handle → [取樣]
+        self.recycled = 0
+
+    def due(self, handle: str) -> bool:
+        return time.monotonic() - self.last.get(handle, -1e9) >= self.th.every_s
+
+    def record(self, handle: str, m: dict, rss_mb: Optional[float] = None,
+               load_ms: Optional[float] = None, tabs: int = 1) -> Optional[str]:
+        """記下一筆取樣（m 為 sample_tab 的結果，rss_mb 為整個 Chrome 的 RSS，tabs 為目前分頁數）；超過門檻回傳原因文字，否則 None。"""
+        self.last[handle] = time.monotonic()
+        self.series.setdefault(handle, []).append(dict(m, rss_mb=rss_mb, load_ms=load_ms, t=time.time()))
+        th = self.th
+        if m["heap_mb"] > th.heap_mb:
+            return f"JS heap {m['heap_mb']:.0f} MB > {th.heap_mb:.0f} MB"
+        if m["nodes"] > th.nodes:
+            return f"DOM 節點 {m['nodes']} > {th.nodes}"
+        if th.rss_per_tab_mb is not None and rss_mb is not None and rss_mb > th.rss_per_tab_mb * max(1, tabs):
+            return f"Chrome RSS {rss_mb:.0f} MB > {th.rss_per_tab_mb:.0f} MB × {max(1, tabs)} 分頁"
+        return None
+
+    def moved(self, old: str, new: str) -> None:
+        """分頁回收後以新 handle 接續時間序列（取樣計時重新開始）。"""
+        self.series[new] = self.series.pop(old, [])
+        self.last.pop(old, None)
+        self.recycled += 1
+
+    def summary_lines(self) -> List[str]:
+        out = []
+        for h, xs in self.series.items():
+            if not xs: continue
+            first, last = xs[0], xs[-1]
+            out.append(f"  {h[-8:]}：heap {first['heap_mb']:.0f}→{last['heap_mb']:.0f} MB，"
+                       f"節點 {first['nodes']}→{last['nodes']}（{len(xs)} 次取樣）")
+        if out:
+            out.insert(0, f"🧠 分頁記憶體（回收 {self.recycled} 次）：")
+        return out
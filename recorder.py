@@ -0,0 +1,108 @@
+# recorder.py
+# 可選的執行錄製（RunConfig.record / BOOKING_RECORD=1）：每次就緒判斷記下 CF 狀態與耗時，每次掃描記下頁面的預約表 HTML，
+# 每次點擊記下結果（對話框分類/文字），寫成 gzip 壓縮的 JSONL（logs/rec-*.jsonl.gz）。
+# replay.py 把錄到的頁面全速重新餵給解析、篩選與點擊決策，同一份真實輸入可比較不同版本。
+#
+#   rec = Recorder("logs/rec-20251003-235955.jsonl.gz").start(flt={...})
+#   record("ready", url=url, ok=True, state="gate", ms=812)      # 沒有啟用中的 Recorder 時為 no-op
+#   rec.stop()
+#   for r in load("logs/rec-....jsonl.gz"): ...
+#
+# 紀錄種類：run（開頭，執行設定）/ ready / probe、reload（多分頁模式以 DevTools 查詢/重新載入背景分頁，只有狀態與指紋，
+# 不含 HTML）/ page（n 為頁序號）/ click / dialog；page 之後的紀錄帶 page=n。
+# 錄製時每頁在點擊前多一次往返（取表格 HTML），正式搶位時建議關閉。
+
+import contextvars
+import gzip
+import json
+import os
+import threading
+import time
+from typing import Iterator, Optional
+
+_current: "contextvars.ContextVar[Optional[Recorder]]" = contextvars.ContextVar("booking_recorder", default=None)
+
+# 只取最外層、含圖片的表格（預約表），其餘版面不錄
+_TABLES_JS = r"""
+const out = [];
+for (const t of document.querySelectorAll('table')) {
+  if (t.parentElement && t.parentElement.closest('table')) continue;
+  if (t.querySelector('img')) out.push(t.outerHTML);
+}
+return {url: location.href, html: out.join('\n')};
+"""
+
+
+class Recorder:
+    def __init__(self, path: str, level: int = 6):
+        self.path = path
+        self.level = level
+        self.page_no = 0
+        self.counts = {}
+        self._fh = None
+        self._token = None
+        self._lock = threading.Lock()
+
+    def start(self, **meta) -> "Recorder":
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._fh = gzip.open(self.path, "wt", encoding="utf-8", compresslevel=self.level)
+        self._token = _current.set(self)
+        self.write("run", **meta)
+        return self
+
+    def write(self, kind: str, **fields) -> None:
+        with self._lock:
+            if self._fh is None:
+                return
+            if kind == "page":
+                self.page_no += 1
+                fields["n"] = self.page_no
+            elif kind != "run" and self.page_no:
+                fields.setdefault("page", self.page_no)
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            d = {"kind": kind, "t": round(time.time(), 3)}
+            d.update(fields)
+            self._fh.write(json.dumps(d, ensure_ascii=False, default=str) + "\n")
+
+    def stop(self) -> None:
+        if self._token is not None:
+            try: _current.reset(self._token)
+            except ValueError: _current.set(None)      # 在不同的 context 結束
+            self._token = None
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    def describe(self) -> str:
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return (f"🎞️ 已錄製 {self.counts.get('page', 0)} 頁、{self.counts.get('click', 0)} 次點擊、"
+                f"{self.counts.get('ready', 0)} 次就緒判斷（{size / 1024:.0f} KB）→ {self.path}")
+
+
+def recording() -> bool:
+    return _current.get() is not None
+
+def record(kind: str, **fields) -> None:
+    """目前 context 有啟用中的 Recorder 才寫入。"""
+    rec = _current.get()
+    if rec is not None:
+        rec.write(kind, **fields)
+
+def capture_page(driver, key: Optional[str], **fields) -> None:
+    """記下目前頁面的預約表 HTML（一次往返）與呼叫端給的快照欄位（fp/total/matched…）。"""
+    rec = _current.get()
+    if rec is None:
+        return
+    try:
+        r = driver.execute_script(_TABLES_JS) or {}
+    except Exception:
+        r = {}
+    rec.write("page", key=key, url=r.get("url"), html=r.get("html") or "", **fields)
+
+def load(path: str) -> Iterator[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
@@ -0,0 +1,187 @@
+# replay.py
+# 離線重播 recorder.py 錄下的執行：每頁表格 HTML 全速重新餵給解析（slots）、篩選（SlotFilter）與點擊決策
+# （booking.click_all_bookings_on_page 跑在 ReplayDriver 上，點擊結果照錄製當時的回應），
+# 輸出各階段耗時、每頁往返次數，以及點擊決策與錄製時是否一致；同一份真實輸入可比較不同版本。
+#
+#   python replay.py logs/rec-20251003-235955.jsonl.gz
+#   python replay.py logs/rec-....jsonl.gz --from 19:00 --to 21:00 --courts AB --hook --json
+#   python replay.py logs/rec-....jsonl.gz --strict        # 決策與錄製不一致時結束碼 1（回歸檢查）
+#
+# 就緒判斷（CF 狀態/等待時間）與多分頁的背景查詢（probe/reload）只彙整錄製結果，不重播：等待取決於真實網站的時間。
+#
+# 限制：重播不執行頁內 JS。ReplayDriver 繼承 FakeDriver，按鈕比對（booking._MATCH_JS）由 slots.py 的 Python 參考實作代替，
+# 所以這裡量到的是 Python 端的解析與點擊決策；_MATCH_JS 與 slots.py 是否一致由 tests/test_browser_js.py 以真的 Chrome 驗證。
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from booking import PAGE_FPS, SLOT_INDEX, click_all_bookings_on_page, parse_time_hhmm
+from browser_cf import install_dialog_hook
+from fake_driver import FakeDriver
+from recorder import load
+from slots import SlotFilter, parse_booking_html
+
+_quiet = lambda s, **kw: None
+_OUTCOME = {
+    "cf_fail": {"ok": False, "title": "驗證失敗", "text": "請重新驗證後再試一次"},
+    "error": {"ok": False, "title": "預約失敗", "text": "此場地已被預約"},
+    "sent": None,           # 錄製時沒等到伺服器回應：重播也不出結果對話框
+    "none": None,
+}
+
+
+class ReplayState:
+    """點擊結果照錄製：同一場地依序回傳錄到的結果（沒錄到的當作成功），並記下重播時點了哪些場地。"""
+
+    def __init__(self):
+        self.outcomes: Dict[tuple, List[str]] = {}
+        self.clicked: List[tuple] = []
+
+    def load(self, clicks: List[dict]) -> None:
+        self.outcomes = defaultdict(list)
+        for c in clicks:
+            self.outcomes[tuple(c["slot"][2:4])].append(c.get("status") or "ok")
+        self.clicked = []
+
+    def book(self, a: str, b: str) -> Optional[dict]:
+        self.clicked.append((a, b))
+        q = self.outcomes.get((a, b))
+        status = q.pop(0) if q else "ok"
+        return _OUTCOME.get(status, {"ok": True, "title": "預約成功", "text": ""})
+
+
+class ReplayDriver(FakeDriver):
+    """FakeDriver 的目前分頁換成錄到的表格 HTML；不導航、沒有延遲。"""
+
+    def __init__(self):
+        super().__init__(ReplayState())
+
+    def show(self, url: str, html: str) -> None:
+        self._tabs[self._current] = self._booking_page(url, html, self._current in self._hooked)
+
+
+def _filter(meta: dict, from_t: Optional[str], to_t: Optional[str], courts: Optional[str]) -> SlotFilter:
+    f = from_t if from_t is not None else (meta.get("from_t") or "")
+    t = to_t if to_t is not None else (meta.get("to_t") or "")
+    c = (courts if courts is not None else (meta.get("courts") or "")).upper()
+    return SlotFilter.compile(parse_time_hhmm(f) if f.strip() else None, parse_time_hhmm(t) if t.strip() else None,
+                              "A" in c, "B" in c, "C" in c)
+
+def replay(path: str, from_t: Optional[str] = None, to_t: Optional[str] = None, courts: Optional[str] = None,
+           hook: Optional[bool] = None) -> dict:
+    """重播一份錄製檔，回傳統計（數字欄位可直接比較版本）。"""
+    recs = list(load(path))
+    meta = next((r for r in recs if r["kind"] == "run"), {})
+    flt = _filter(meta, from_t, to_t, courts)
+    hook = bool(meta.get("dialog_hook")) if hook is None else hook
+    clicks = defaultdict(list)
+    for r in recs:
+        if r["kind"] == "click":
+            clicks[r.get("page")].append(r)
+
+    drv = ReplayDriver()
+    if hook:
+        install_dialog_hook(drv)
+    SLOT_INDEX.reset()
+    PAGE_FPS.pages.clear(); PAGE_FPS.scans = PAGE_FPS.skipped = 0
+    last: Dict[str, tuple] = {}            # key → (url, html)：表格未變（same）的紀錄沿用上次
+    out = dict(pages=0, same=0, missing=0, slots=0, matched=0, parse_ms=0.0, click_ms=0.0, round_trips=0,
+               clicks=0, agree=0, differ=0, rec_clicks=0, replay_clicks=0, diffs=[])
+    for r in recs:
+        if r["kind"] != "page":
+            continue
+        key = r.get("key")
+        url, html = last.get(key, (None, None)) if r.get("same") else (r.get("url") or "", r.get("html"))
+        if html is None:
+            out["missing"] += 1
+            continue
+        last[key] = (url, html)
+        out["pages"] += 1
+        out["same"] += bool(r.get("same"))
+
+        t0 = time.perf_counter()
+        slots = parse_booking_html(html, url=url)
+        out["parse_ms"] += (time.perf_counter() - t0) * 1000
+        out["slots"] += len(slots)
+        out["matched"] += sum(1 for s in slots if s.available and flt.matches(s))
+
+        drv.state.load(clicks.get(r["n"], []))
+        drv.show(url, html)
+        drv.reset_counts()
+        t0 = time.perf_counter()
+        out["clicks"] += click_all_bookings_on_page(drv, flt, log_fn=_quiet, dialog_hook=hook, page_key=key)
+        out["click_ms"] += (time.perf_counter() - t0) * 1000
+        out["round_trips"] += drv.round_trips
+
+        want = {tuple(c["slot"][2:4]) for c in clicks.get(r["n"], [])}
+        got = set(drv.state.clicked)
+        out["rec_clicks"] += len(want); out["replay_clicks"] += len(got)
+        if want == got:
+            out["agree"] += 1
+        else:
+            out["differ"] += 1
+            out["diffs"].append({"page": r["n"], "url": url, "recorded_only": sorted(want - got),
+                                 "replay_only": sorted(got - want)})
+
+    ready = [r for r in recs if r["kind"] == "ready"]
+    ms = sorted(r.get("ms") or 0 for r in ready)
+    out["ready"] = dict(n=len(ready), ok=sum(1 for r in ready if r.get("ok")),
+                        p50_ms=statistics.median(ms) if ms else 0, max_ms=ms[-1] if ms else 0,
+                        states={s: sum(1 for r in ready if r.get("state") == s) for s in {r.get("state") for r in ready}})
+    probes = [r for r in recs if r["kind"] == "probe"]
+    out["probes"] = dict(n=len(probes), reloads=sum(1 for r in recs if r["kind"] == "reload"),
+                         same=sum(1 for r in probes if r.get("same")),
+                         states={s: sum(1 for r in probes if r.get("state") == s) for s in {r.get("state") for r in probes}})
+    out.update(path=path, filter=flt.describe(), hook=hook)
+    return out
+
+def summary_lines(res: dict) -> List[str]:
+    n = max(1, res["pages"])
+    rd = res["ready"]
+    lines = [
+        f"重播 {res['path']}：{res['pages']} 頁（其中表格未變 {res['same']} 頁"
+        + (f"、缺 HTML {res['missing']} 頁" if res["missing"] else "") + f"），篩選 {res['filter']}，"
+        + ("整批（攔截器）" if res["hook"] else "逐顆") + "點擊",
+        f"  解析（slots）：{res['parse_ms'] / n:.2f} ms/頁，共 {res['slots']} 格、符合篩選 {res['matched']} 格",
+        f"  點擊決策（click_all_bookings_on_page）：{res['click_ms'] / n:.2f} ms/頁、往返 {res['round_trips'] / n:.1f} 次/頁、點擊 {res['clicks']} 次",
+        f"  與錄製比較：一致 {res['agree']} 頁、不同 {res['differ']} 頁（錄製點 {res['rec_clicks']} 顆、重播點 {res['replay_clicks']} 顆）",
+    ]
+    for d in res["diffs"][:10]:
+        lines.append(f"    第 {d['page']} 頁 {d['url']}：只有錄製 {d['recorded_only']}，只有重播 {d['replay_only']}")
+    if rd["n"]:
+        lines.append(f"  就緒判斷（錄製）：{rd['n']} 次、成功 {rd['ok']} 次；p50 {rd['p50_ms']:.0f} ms、最長 {rd['max_ms']:.0f} ms；"
+                     + "、".join(f"{k} {v}" for k, v in sorted(rd["states"].items(), key=lambda kv: str(kv[0]))))
+    pr = res["probes"]
+    if pr["n"]:
+        lines.append(f"  背景查詢（錄製）：{pr['n']} 次、表格未變 {pr['same']} 次、重新載入 {pr['reloads']} 次；"
+                     + "、".join(f"{k} {v}" for k, v in sorted(pr["states"].items(), key=lambda kv: str(kv[0]))))
+    return lines
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="離線重播錄製檔（recorder.py）")
+    ap.add_argument("path", nargs="+", help="logs/rec-*.jsonl.gz")
+    ap.add_argument("--from", dest="from_t", help="覆寫篩選起（HH:MM）")
+    ap.add_argument("--to", dest="to_t", help="覆寫篩選迄（HH:MM）")
+    ap.add_argument("--courts", help="覆寫限定場地，例如 AB")
+    ap.add_argument("--hook", action="store_true", default=None, help="以整批（頁內攔截器）模式重播")
+    ap.add_argument("--json", action="store_true", help="每份錄製輸出一行 JSON")
+    ap.add_argument("--strict", action="store_true", help="決策與錄製不一致時結束碼 1")
+    args = ap.parse_args(argv)
+    differ = 0
+    for p in args.path:
+        res = replay(p, args.from_t, args.to_t, args.courts, args.hook)
+        differ += res["differ"]
+        if args.json:
+            print(json.dumps(res, ensure_ascii=False, default=str))
+        else:
+            for line in summary_lines(res): print(line)
+    return 1 if args.strict and differ else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
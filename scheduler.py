@@ -0,0 +1,141 @@
+# scheduler.py
+# 單分頁輪詢的自適應排程：每個網址記錄載入耗時、上次變化、出現符合場地的頻率、是否已被我們訂完，
+# 依優先序決定這一輪要重新載入哪些頁；內容沒變的頁面逐步拉長重訪週期，把載入次數留給有機會的頁面。
+#
+#   sched = UrlScheduler(urls, base_s=interval)
+#   for url in sched.due(): ...; sched.record(url, load_ms=..., ready=ok, total=..., matched=..., clicked=..., unresolved=...)
+#   stop_flag.wait(sched.wait_s())      # 沒有到期的頁面時，睡到最早到期的那一頁
+#
+# 開放時刻附近不退避：頁面顯示尚未開放（closed）時固定用 base_s；給了 release_at 時，
+# 開放前 HOT_LEAD_S 秒到開放後 HOT_TAIL_S 秒之間所有頁面都用 base_s，開放前的退避也不會跨過這段時間。
+
+import time
+from typing import Dict, List, Optional, Sequence
+
+from slots import url_params
+
+HOT_LEAD_S = 10.0       # 開放前多少秒起不退避
+HOT_TAIL_S = 60.0       # 開放後多少秒內不退避
+
+
+class UrlStats:
+    __slots__ = ("url", "loads", "load_ms", "last_change", "signature", "unchanged", "hits",
+                 "done", "period", "next_due")
+
+    def __init__(self, url: str, base_s: float):
+        self.url = url
+        self.loads = 0
+        self.load_ms = 0.0            # 最近一次 get + 等待就緒的毫秒數
+        self.last_change = None       # 最近一次內容改變的時刻（monotonic）
+        self.signature = None         # (就緒, 可預約數, 符合數)；與上次相同 = 沒變
+        self.unchanged = 0            # 連續沒變的次數
+        self.hits = 0                 # 出現符合場地的次數
+        self.done = False             # 符合的場地都已被我們點完
+        self.period = base_s          # 目前的重訪週期（秒）
+        self.next_due = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.loads if self.loads else 1.0     # 沒載入過的頁面視為最有希望
+
+
+class UrlScheduler:
+    """
+    base_s   : 最短重訪週期（GUI 的刷新間隔）
+    max_s    : 沒變化的頁面最多拉長到的週期
+    backoff  : 每多一次沒變化，週期乘上的倍數
+    release_at : 開放時刻（time.monotonic()）；None = 不知道
+    顯示尚未開放或在開放時刻前後的頁面固定用 base_s；其餘已被我們訂完的頁面直接用 max_s（仍會偶爾回來看有沒有人退訂），
+    有符合場地的頁面用 base_s。
+    """
+
+    def __init__(self, urls: Sequence[str], base_s: float = 1.0, max_s: Optional[float] = None,
+                 backoff: float = 1.6, release_at: Optional[float] = None):
+        self.base_s = max(0.0, base_s)
+        self.max_s = max(self.base_s * 8, 10.0) if max_s is None else max_s
+        self.backoff = backoff
+        self.release_at = release_at
+        self.stats: Dict[str, UrlStats] = {u: UrlStats(u, self.base_s) for u in dict.fromkeys(urls)}
+        self.loads = 0
+        self._t_start = time.monotonic()
+
+    def _priority(self, st: UrlStats):
+        # 未訂完 > 出現符合的頻率高 > 最近有變化 > 載入快
+        recent = -(st.last_change or 0.0)
+        return (st.done, -st.hit_rate, recent, st.load_ms)
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """目前已到期的網址（依優先序）；沒有則回傳空清單，可用 wait_s() 決定要睡多久。"""
+        now = time.monotonic() if now is None else now
+        ready = [st for st in self.stats.values() if st.next_due <= now]
+        ready.sort(key=self._priority)
+        return [st.url for st in ready]
+
+    def wait_s(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(0.0, min(st.next_due for st in self.stats.values()) - now) if self.stats else 0.0
+
+    def hot(self, now: Optional[float] = None) -> bool:
+        """是否在開放時刻前後的不退避區間內。"""
+        if self.release_at is None:
+            return False
+        now = time.monotonic() if now is None else now
+        return self.release_at - HOT_LEAD_S <= now <= self.release_at + HOT_TAIL_S
+
+    def record(self, url: str, load_ms: float, ready: bool, total: int = 0, matched: int = 0,
+               clicked: int = 0, closed: bool = False, now: Optional[float] = None, unresolved: int = 0) -> float:
+        """
+        記錄一次載入結果，回傳此頁新的重訪週期（秒）。closed = 頁面顯示尚未開放。
+        clicked 只算伺服器有回應的點擊；unresolved（送出後逾時沒有結果）不算訂完，此頁照 base_s 回來重試。
+        """
+        now = time.monotonic() if now is None else now
+        st = self.stats[url]
+        self.loads += 1
+        st.loads += 1
+        st.load_ms = load_ms
+        sig = (ready, total, matched)
+        if sig != st.signature:
+            st.signature, st.unchanged, st.last_change = sig, 0, now
+        else:
+            st.unchanged += 1
+        if matched:
+            st.hits += 1
+        st.done = clicked > 0 and not unresolved and clicked >= matched
+        if closed or self.hot(now):     # 開放前後與尚未開放時一律不退避，即使上次已訂完
+            st.period = self.base_s
+        elif st.done:
+            st.period = self.max_s
+        elif matched:
+            st.period = self.base_s
+        else:
+            st.period = min(self.max_s, (self.base_s or 1.0) * self.backoff ** st.unchanged)
+        st.next_due = now + st.period
+        if self.release_at is not None and now < self.release_at - HOT_LEAD_S:
+            st.next_due = min(st.next_due, max(now + self.base_s, self.release_at - HOT_LEAD_S))
+        return st.period
+
+    def period(self, url: str) -> float:
+        """此網址目前的重訪週期（秒）。"""
+        return self.stats[url].period
+
+    def saved_loads(self) -> int:
+        """
+        估計與舊版固定輪詢相比省下的載入次數：舊版一輪 = 每頁各載入一次（以目前各頁載入耗時計）+ 刷新間隔，
+        同樣的時間內會載入 輪數 × 頁數 次。
+        """
+        round_s = sum(st.load_ms for st in self.stats.values()) / 1000 + self.base_s
+        if round_s <= 0:
+            return 0
+        elapsed = time.monotonic() - self._t_start
+        return max(0, int(elapsed / round_s * len(self.stats)) - self.loads)
+
+    def summary_lines(self) -> List[str]:
+        out = []
+        for st in sorted(self.stats.values(), key=self._priority):
+            date, d2 = url_params(st.url)
+            label = f"{date} D2={d2}" if date else st.url
+            ago = f"{time.monotonic() - st.last_change:.0f} s 前" if st.last_change is not None else "—"
+            flag = "（已訂完）" if st.done else ""
+            out.append(f"  {label:<18} 週期 {st.period:5.1f} s，載入 {st.loads} 次，"
+                       f"符合率 {st.hit_rate:.0%}，上次變化 {ago}，載入 {st.load_ms:.0f} ms{flag}")
+        return out
@@ -0,0 +1,279 @@
+# slots.py
+# 預約表（MT02.aspx booking_place）離線解析：HTML → Slot 清單；不依賴 Selenium，可批次剖析存檔頁面
+#
+# 解析分兩段：
+#   1) extract_tables()：HTML → 表格列（Row），只保留含預約圖片的表格
+#   2) iter_slots()    ：表格列 → Slot（時間 rowspan 帶入、場地、Step3Action、可否預約）
+# 時間/場地篩選編譯成 SlotFilter（分鐘整數 + 精確場地代號）。
+# booking.py 的即時點擊流程在頁內執行同規則的 JS（_MATCH_JS），只把符合的按鈕傳回；本檔為離線/對照用的 Python 實作。
+
+import html
+import re
+import sys
+import time
+from typing import FrozenSet, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+
+TIME_RE  = re.compile(r'([01]?\d|2[0-3]):[0-5]\d')
+STEP3_RE = re.compile(r"Step3Action\((\d+)\s*,\s*(\d+)\)")
+# 場地代號：前後不接其他英文字母的單一大寫字母（「羽球A場」→ A；「NT$」「BADMINTON」不算）
+COURT_LETTER_RE = re.compile(r'(?<![A-Za-z])([A-Z])(?![A-Za-z])')
+
+# D2 大時段 → 起訖整點 [start, end)；GUI 標籤、網址剪枝、替身站共用這一張表
+D2_BLOCKS = {1: (9, 12), 2: (12, 15), 3: (15, 18), 4: (18, 22)}
+
+def d2_label(d2: int) -> str:
+    start, end = D2_BLOCKS[d2]
+    return f"{start:02d}-{end:02d}"
+
+class Slot(NamedTuple):
+    date: Optional[str]      # YYYY/MM/DD（網址 D 參數）
+    d2: Optional[int]        # 大時段 1~4（網址 D2 參數）
+    time: Optional[str]      # 起始時間 HH:MM；解析不到為 None
+    court: str               # 場地文字（例如「羽球A」）
+    a: Optional[str]         # Step3Action(a,b) 參數
+    b: Optional[str]
+    available: bool          # 藍色可預約鈕（place01 / name=PlaceBtn 且有 Step3Action）
+
+class Cell(NamedTuple):
+    text: str
+    rowspan: int
+    has_img: bool
+
+# 表格列：(cells, imgs)；img 為 (onclick, name, src)
+Row = Tuple[Sequence[Cell], Sequence[tuple]]
+
+
+# --------- 規則（booking._MATCH_JS 為同規則的頁內版本，兩邊需一起修改） ---------
+def is_slot_img(onclick: str, name: str, src: str) -> bool:
+    """操作欄的場地圖片（不論可否預約）；用來挑出預約表格。"""
+    return ("Step3Action" in onclick) or name == "PlaceBtn" or ("place0" in src.lower())
+
+def is_bookable_img(onclick: str, name: str, src: str) -> bool:
+    """藍色可預約鈕：onclick 含 Step3Action，且 name=PlaceBtn 或 src 含 place01。"""
+    return ("Step3Action" in onclick) and (name == "PlaceBtn" or "place01" in src.lower())
+
+def court_letter(label: str) -> Optional[str]:
+    m = COURT_LETTER_RE.search(label or "")
+    return m.group(1) if m else None
+
+def time_minutes(hhmm: Optional[str]) -> Optional[int]:
+    """'HH:MM' → 當日分鐘數；None/格式不符回傳 None。"""
+    if not hhmm:
+        return None
+    m = TIME_RE.search(hhmm)
+    if not m:
+        return None
+    hh, mm = m.group(0).split(":")
+    return int(hh) * 60 + int(mm)
+
+def row_court(cells: Sequence[Cell]) -> str:
+    # 優先找包含「羽球」或場地代號的格（且不是圖片的操作欄），否則取第 2 格
+    for c in cells:
+        if c.has_img:
+            continue
+        t = c.text
+        if ('羽球' in t) or court_letter(t):
+            return t
+    if len(cells) >= 2:
+        return cells[1].text
+    return ""
+
+def url_params(url: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+    """從 MT02.aspx 網址取出 (D, D2)。"""
+    if not url:
+        return None, None
+    q = parse_qs(urlparse(url).query)
+    date = (q.get("D") or [None])[0]
+    d2 = (q.get("D2") or [None])[0]
+    return date, (int(d2) if d2 and d2.isdigit() else None)
+
+class SlotFilter(NamedTuple):
+    """
+    每次執行只編譯一次的篩選條件：
+      from_min/to_min : 起始時間範圍（當日分鐘數，含端點；None = 不限）
+      courts          : 允許的場地代號（空 = 全部）
+    解析不到時間的格視為通過；有指定場地時，解析不到場地代號的格不通過。
+    """
+    from_min: Optional[int] = None
+    to_min: Optional[int] = None
+    courts: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def compile(cls, from_t: Optional[str], to_t: Optional[str],
+                want_A: bool = False, want_B: bool = False, want_C: bool = False) -> "SlotFilter":
+        courts = frozenset(c for c, on in (("A", want_A), ("B", want_B), ("C", want_C)) if on)
+        return cls(time_minutes(from_t), time_minutes(to_t), courts)
+
+    def matches(self, slot: "Slot") -> bool:
+        m = time_minutes(slot.time)
+        if m is not None:
+            if self.from_min is not None and m < self.from_min: return False
+            if self.to_min is not None and m > self.to_min: return False
+        if self.courts:
+            return court_letter(slot.court) in self.courts
+        return True
+
+    def overlaps_d2(self, d2: int) -> bool:
+        """此大時段是否可能有起始時間落在 from_min~to_min 的格子（表外的 D2 一律保留）。"""
+        if d2 not in D2_BLOCKS:
+            return True
+        start, end = D2_BLOCKS[d2]
+        first, last = start * 60, end * 60 - 1        # 起始時間落在 [start, end)
+        if self.from_min is not None and last < self.from_min: return False
+        if self.to_min is not None and first > self.to_min: return False
+        return True
+
+    def js_args(self) -> list:
+        """頁內 JS 版本的參數：[from_min, to_min, 'ABC']。"""
+        return [self.from_min, self.to_min, "".join(sorted(self.courts))]
+
+    def describe(self) -> str:
+        fmt = lambda m: f"{m // 60:02d}:{m % 60:02d}"
+        t = (f"{fmt(self.from_min) if self.from_min is not None else '…'}~"
+             f"{fmt(self.to_min) if self.to_min is not None else '…'}")
+        return f"時間 {t}、場地 {'/'.join(sorted(self.courts)) or '全部'}"
+
+def iter_slots(tables: Sequence[Sequence[Row]], date: Optional[str] = None,
+               d2: Optional[int] = None) -> Iterator[Tuple[Slot, tuple]]:
+    """
+    逐表逐列產生 (Slot, img)；img 為原始圖片 tuple (onclick, name, src)。
+    時間：本列第一格有時間就用；否則沿用上方時間格的 rowspan 範圍。
+    """
+    for rows in tables:
+        carry, carry_left = None, 0
+        for cells, imgs in rows:
+            if not cells:
+                continue
+            t = None
+            m = TIME_RE.search(cells[0].text)
+            if m:
+                t = carry = m.group(0)
+                carry_left = max(cells[0].rowspan - 1, 0)
+            elif carry_left > 0:
+                t = carry
+                carry_left -= 1
+            if not imgs:
+                continue
+            court = row_court(cells)
+            for img in imgs:
+                onclick, name, src = img[0], img[1], img[2]
+                ms = STEP3_RE.search(onclick)
+                yield (Slot(date, d2, t, court,
+                            ms.group(1) if ms else None, ms.group(2) if ms else None,
+                            is_bookable_img(onclick, name, src)), img)
+
+
+# --------- HTML → 表格列（regex 掃描，比 html.parser 快一個數量級） ---------
+_SKIP_RE  = re.compile(r'<(script|style)\b.*?</\1\s*>|<!--.*?-->', re.I | re.S)
+_TAG_RE   = re.compile(r'<(/?)(table|tr|td|th|img)\b([^>]*)>', re.I)
+_ATTR_RE  = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+_STRIP_RE = re.compile(r'<[^>]*>')
+
+def _attrs(s: str) -> dict:
+    out = {}
+    for m in _ATTR_RE.finditer(s):
+        v = m.group(2) if m.group(2) is not None else (m.group(3) if m.group(3) is not None else m.group(4))
+        out[m.group(1).lower()] = html.unescape(v)
+    return out
+
+def _cell_text(src: str) -> str:
+    return " ".join(html.unescape(_STRIP_RE.sub("", src)).split())
+
+class _Table:
+    __slots__ = ("rows", "has_slot_img", "cells", "imgs", "cell_start", "cell_rowspan", "cell_img")
+
+    def __init__(self):
+        self.rows: List[Row] = []
+        self.has_slot_img = False
+        self.cells = None   # 目前列（None = 不在列中）
+        self.imgs = None
+        self.cell_start = -1
+        self.cell_rowspan = 1
+        self.cell_img = False
+
+    def close_cell(self, src: str, end: int):
+        if self.cell_start >= 0 and self.cells is not None:
+            self.cells.append(Cell(_cell_text(src[self.cell_start:end]), self.cell_rowspan, self.cell_img))
+        self.cell_start = -1
+
+    def close_row(self, src: str, end: int):
+        self.close_cell(src, end)
+        if self.cells is not None:
+            self.rows.append((self.cells, self.imgs))
+        self.cells = self.imgs = None
+
+def extract_tables(page_html: str) -> List[List[Row]]:
+    """HTML → 含場地圖片的表格（依開始位置排序），每表為 Row 清單。"""
+    src = _SKIP_RE.sub(lambda m: " " * len(m.group(0)), page_html)
+    stack: List[_Table] = []
+    found: List[_Table] = []
+    for m in _TAG_RE.finditer(src):
+        closing, tag = m.group(1), m.group(2).lower()
+        if tag == "table":
+            if closing:
+                if stack:
+                    stack.pop().close_row(src, m.start())
+            else:
+                t = _Table(); stack.append(t); found.append(t)
+            continue
+        if not stack:
+            continue
+        top = stack[-1]
+        if tag == "tr":
+            top.close_row(src, m.start())
+            if not closing:
+                top.cells, top.imgs = [], []
+        elif tag in ("td", "th"):
+            top.close_cell(src, m.start())
+            if not closing:
+                if top.cells is None:       # 省略 <tr> 的寬鬆 HTML
+                    top.cells, top.imgs = [], []
+                rs = _attrs(m.group(3)).get("rowspan", "1")
+                top.cell_start = m.end()
+                top.cell_rowspan = int(rs) if rs.isdigit() and int(rs) > 0 else 1
+                top.cell_img = False
+        elif tag == "img":
+            for t in stack:                 # 外層儲存格也算「含圖片」（與 DOM querySelector 一致）
+                if t.cell_start >= 0:
+                    t.cell_img = True
+            a = _attrs(m.group(3))
+            onclick, name, isrc = a.get("onclick", ""), a.get("name", ""), a.get("src", "")
+            if top.imgs is not None and is_slot_img(onclick, name, isrc):
+                top.imgs.append((onclick, name, isrc))
+                top.has_slot_img = True
+    while stack:
+        stack.pop().close_row(src, len(src))
+    return [t.rows for t in found if t.has_slot_img]
+
+def parse_booking_html(page_html: str, date: Optional[str] = None, d2: Optional[int] = None,
+                       url: Optional[str] = None) -> List[Slot]:
+    """MT02.aspx 預約表 HTML（driver.page_source 或存檔）→ Slot 清單；date/d2 未給時取自 url。"""
+    if url and (date is None or d2 is None):
+        u_date, u_d2 = url_params(url)
+        date = u_date if date is None else date
+        d2 = u_d2 if d2 is None else d2
+    return [s for s, _ in iter_slots(extract_tables(page_html), date, d2)]
+
+def parse_booking_file(path: str, **kw) -> List[Slot]:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return parse_booking_html(f.read(), **kw)
+
+
+if __name__ == "__main__":
+    # 批次剖析存檔頁面：python slots.py saved/*.html
+    paths = sys.argv[1:]
+    if not paths:
+        print("用法：python slots.py 頁面1.html [頁面2.html ...]"); sys.exit(2)
+    pages = []
+    for p in paths:
+        with open(p, encoding="utf-8", errors="replace") as f:
+            pages.append((p, f.read()))
+    t0 = time.perf_counter()
+    results = [(p, parse_booking_html(h)) for p, h in pages]
+    dt = time.perf_counter() - t0
+    for p, slots in results:
+        avail = [s for s in slots if s.available]
+        print(f"{p}: {len(slots)} 格，可預約 {len(avail)}："
+              + ", ".join(f"{s.time or '?'} {s.court or '?'}" for s in avail))
+    print(f"共 {len(pages)} 頁，{dt*1000:.1f} ms（{len(pages)/dt if dt > 0 else 0:.0f} 頁/秒）")
@@ -0,0 +1,328 @@
+# standin_server.py
+# 本機 MT02.aspx 替身：模擬登入頁、首頁、D/D2 預約表、Step3Action 確認/SweetAlert2、CF 驗證中/封鎖頁、我的訂單
+#
+#   python standin_server.py --port 8765 --release-in 30 --gate-ms 1500
+#   BOOKING_SITE=http://127.0.0.1:8765 python app.py
+#
+# 只用標準函式庫；頁面結構刻意貼近正式站，讓 wait_until_ready_with_cf / click_all_bookings_on_page 不需修改即可跑。
+
+import argparse
+import base64
+import html
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from slots import D2_BLOCKS
+
+# D2 大時段 → 每小時一列（18-22 為 4 小時）；對照表在 slots.D2_BLOCKS
+D2_HOURS = {d2: range(start, end) for d2, (start, end) in D2_BLOCKS.items()}
+COURTS = ("A", "B", "C")
+
+# 1x1 透明 PNG（place01/place02/calendar 共用，只需讓 <img> 正常載入）
+_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+
+
+class SiteState:
+    """替身站的可調參數與預約狀態（多執行緒共用）。"""
+
+    def __init__(self, release_at: float, gate_ms: int = 0, gate_rate: float = 0.0,
+                 block_rate: float = 0.0, cf_fail_rate: float = 0.0, occupied_rate: float = 0.3,
+                 latency_ms: int = 0, seed: int = 0, clock_skew: float = 0.0):
+        self.release_at = release_at      # 以「伺服器時鐘」表示
+        self.clock_skew = clock_skew      # 伺服器時鐘 - 本機時鐘（秒），模擬兩邊時鐘不同步
+        self.gate_ms = gate_ms
+        self.gate_rate = gate_rate
+        self.block_rate = block_rate
+        self.cf_fail_rate = cf_fail_rate
+        self.occupied_rate = occupied_rate
+        self.latency_ms = latency_ms
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.booked: Set[Tuple[str, str]] = set()       # 我們訂到的 (A, B)
+        self.orders: Dict[Tuple[str, str], str] = {}    # (A, B) → 說明
+
+    def now(self) -> float:
+        return time.time() + self.clock_skew
+
+    def released(self) -> bool:
+        return self.now() >= self.release_at
+
+    def occupied_by_others(self, a: str, b: str) -> bool:
+        return random.Random(f"{self.seed}:{a}:{b}").random() < self.occupied_rate
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return rate > 0 and self.rng.random() < rate
+
+    def book(self, a: str, b: str) -> dict:
+        """Step3Action 的伺服器端：回傳 {ok, title, text}（SweetAlert2 顯示內容）。"""
+        if self.roll(self.cf_fail_rate):
+            return {"ok": False, "title": "驗證失敗", "text": "請重新驗證後再試一次"}
+        with self.lock:
+            if not self.released() or (a, b) in self.booked or self.occupied_by_others(a, b):
+                return {"ok": False, "title": "預約失敗", "text": "此場地已被預約"}
+            self.booked.add((a, b))
+            hour, court = int(a) // 1000, COURTS[(int(a) % 1000) - 1]
+            self.orders[(a, b)] = f"{b[:4]}/{b[4:6]}/{b[6:]} {hour:02d}:00 羽球{court}場"
+        return {"ok": True, "title": "預約成功", "text": self.orders[(a, b)]}
+
+
+def slot_ids(date: str, hour: int, court_idx: int) -> Tuple[str, str]:
+    """Step3Action(a,b)：a = 時段*1000+場地序，b = 日期 yyyymmdd。"""
+    return str(hour * 1000 + court_idx + 1), date.replace("/", "").replace("-", "")
+
+
+# --------- 頁面 ---------
+_SWAL_JS = r"""
+function swalFire(title, text) {
+  const c = document.createElement('div');
+  c.className = 'swal2-container swal2-center swal2-backdrop-show';
+  c.style.cssText = 'position:fixed;inset:0;background:rgba(0,0,0,.4);display:flex;align-items:center;justify-content:center;z-index:1060';
+  c.innerHTML = '<div class="swal2-popup swal2-modal swal2-show" style="background:#fff;padding:20px;min-width:320px">'
+    + '<h2 class="swal2-title"></h2><div class="swal2-html-container"></div>'
+    + '<div class="swal2-actions"><button type="button" class="swal2-confirm swal2-styled">確定</button></div></div>';
+  c.querySelector('.swal2-title').textContent = title;
+  c.querySelector('.swal2-html-container').textContent = text;
+  c.querySelector('.swal2-confirm').onclick = () => c.remove();
+  document.body.appendChild(c);
+}
+function Step3Action(a, b) {
+  if (!confirm('確定要預約此場地嗎？')) return;
+  fetch('MT02.aspx?module=net_booking&files=booking_place&StepFlag=3&A=' + a + '&B=' + b, {method: 'POST', credentials: 'same-origin'})
+    .then((r) => r.json())
+    .then((j) => {
+      if (j.ok) {
+        const img = document.querySelector('img[onclick="Step3Action(' + a + ',' + b + ')"]');
+        if (img) { img.src = 'img/place02.png'; img.removeAttribute('name'); img.removeAttribute('onclick'); }
+      }
+      swalFire(j.title, j.text);
+    })
+    .catch(() => swalFire('錯誤', '連線失敗，請稍後再試'));
+}
+"""
+
+def _layout(title: str, body: str, extra_head: str = "") -> str:
+    return f"""<!DOCTYPE html>
+<html lang="zh-TW"><head><meta charset="UTF-8"><title>{html.escape(title)}</title>{extra_head}</head>
+<body>
+<table width="100%" class="layout"><tr>
+<td class="menu" width="180"><ul>
+<li><a href="MT02.aspx?module=net_booking&amp;files=booking_place&amp;PT=1">場地預約</a></li>
+<li><a href="MT02.aspx?module=member&amp;files=orderx_mt">我的訂單</a></li>
+<li><a href="MT02.aspx?module=login_page&amp;files=login">會員登入</a></li>
+</ul></td>
+<td class="content">
+{body}
+</td></tr></table>
+</body></html>
+"""
+
+def page_gate(state: SiteState) -> str:
+    return f"""<!DOCTYPE html>
+<html lang="en-US"><head><meta charset="UTF-8"><title>Just a moment...</title></head>
+<body>
+<div class="main-wrapper" role="main"><div class="main-content">
+<h2 id="challenge-running">Checking your browser before accessing the site.</h2>
+<div id="challenge-stage"><div class="challenge-platform">請稍候…</div></div>
+</div></div>
+<script>
+setTimeout(function () {{ document.cookie = 'cf_clearance=standin; path=/'; location.reload(); }}, {int(state.gate_ms)});
+</script>
+</body></html>
+"""
+
+def page_block() -> str:
+    return """<!DOCTYPE html>
+<html lang="en-US"><head><meta charset="UTF-8"><title>Access denied</title></head>
+<body><div id="cf-error-details" class="cf-error-details-wrapper">
+<h1><span class="cf-error-type">Error</span> <span class="cf-error-code">1020</span></h1>
+<h2 class="cf-subheadline">Access denied</h2>
+<p>Cloudflare Ray ID: <strong>standin</strong></p>
+</div></body></html>
+"""
+
+def page_login() -> str:
+    body = """<h2>會員登入</h2>
+<form method="post" action="MT02.aspx?module=login_page&amp;files=login">
+<table><tr><td>帳號</td><td><input name="uid"></td></tr>
+<tr><td>密碼</td><td><input name="pwd" type="password"></td></tr></table>
+<button type="submit">登入</button></form>"""
+    return _layout("會員登入", body)
+
+def page_home() -> str:
+    today = datetime.now().date()
+    cells = []
+    for i in range(14):
+        d = (today + timedelta(days=i)).strftime("%Y/%m/%d")
+        cells.append(f'<td>{d}<br><img src="img/calendar.png" '
+                     f'onclick="location.href=\'MT02.aspx?module=net_booking&amp;files=booking_place&amp;StepFlag=2&amp;PT=1&amp;D={d}&amp;D2=4\'"></td>')
+    rows = "".join(f"<tr>{''.join(cells[i:i + 7])}</tr>" for i in range(0, len(cells), 7))
+    return _layout("場地預約", f'<h2>場地預約</h2><table class="calendar" border="1">{rows}</table>')
+
+def page_booking(state: SiteState, date: str, d2: int) -> str:
+    hours = D2_HOURS.get(d2, range(0))
+    released = state.released()
+    rows = []
+    for h in hours:
+        for ci, c in enumerate(COURTS):
+            a, b = slot_ids(date, h, ci)
+            tcell = f'<td rowspan="{len(COURTS)}" class="time">{h:02d}:00~{h + 1:02d}:00</td>' if ci == 0 else ""
+            with state.lock:
+                ours = (a, b) in state.booked
+            if released and not ours and not state.occupied_by_others(a, b):
+                img = (f'<img name="PlaceBtn" src="img/place01.png" style="cursor:pointer" '
+                       f'onclick="Step3Action({a},{b})">')
+            else:
+                img = '<img src="img/place02.png" title="已預約">' if released else '<img src="img/place00.png" title="尚未開放">'
+            rows.append(f"<tr>{tcell}<td>羽球{c}場</td><td>NT$ 400</td><td>{img}</td></tr>")
+    if not rows:
+        rows.append('<tr><td colspan="4">查無場地</td></tr>')
+    opens = datetime.fromtimestamp(state.release_at).strftime("%H:%M:%S")
+    body = (f"<h2>場地預約 {html.escape(date)}（D2={d2}）</h2>"
+            f"<p>{'已開放預約' if released else f'尚未開放，預計 {opens} 開放'}</p>"
+            f'<table class="booking" border="1"><tr><th>時段</th><th>場地</th><th>費用</th><th>操作</th></tr>'
+            + "".join(rows) + "</table>")
+    return _layout("場地預約", body, f"<script>{_SWAL_JS}</script>")
+
+def page_orders(state: SiteState) -> str:
+    with state.lock:
+        items = sorted(state.orders.items())
+    rows = "".join(f"<tr><td>{i + 1}</td><td>{html.escape(v)}</td><td>{a},{b}</td></tr>"
+                   for i, ((a, b), v) in enumerate(items)) or '<tr><td colspan="3">尚無訂單</td></tr>'
+    return _layout("我的訂單", f'<h2>我的訂單</h2><table class="orders" border="1">'
+                               f"<tr><th>#</th><th>場地</th><th>代碼</th></tr>{rows}</table>")
+
+
+# --------- HTTP ---------
+class Handler(BaseHTTPRequestHandler):
+    state: SiteState = None  # 由 make_server 設定
+    server_version = "StandinMT02/1.0"
+
+    def date_time_string(self, timestamp=None):
+        # Date 標頭走伺服器時鐘（含 --clock-skew），供 clock_sync 校正
+        return super().date_time_string(self.state.now() if timestamp is None else timestamp)
+
+    def log_message(self, fmt, *args):
+        print(f"[{datetime.now():%H:%M:%S}] {self.address_string()} {fmt % args}")
+
+    def _send(self, code: int, body: bytes, ctype: str):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _html(self, text: str, code: int = 200):
+        self._send(code, text.encode("utf-8"), "text/html; charset=utf-8")
+
+    def _json(self, obj: dict):
+        self._send(200, json.dumps(obj, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+    def _cleared(self) -> bool:
+        return "cf_clearance=" in (self.headers.get("Cookie") or "")
+
+    def do_GET(self):
+        self._route()
+
+    def do_POST(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        if n: self.rfile.read(n)
+        self._route()
+
+    def _route(self):
+        st = self.state
+        u = urlparse(self.path)
+        if u.path.startswith("/img/"):
+            return self._send(200, _PNG, "image/png")
+        if u.path == "/favicon.ico":
+            return self._send(404, b"", "text/plain")
+        if u.path not in ("/", "/MT02.aspx"):
+            return self._html("<h1>404</h1>", 404)
+        if st.latency_ms:
+            time.sleep(st.latency_ms / 1000.0)
+
+        q = {k: v[0] for k, v in parse_qs(u.query).items()}
+        module, files = q.get("module", ""), q.get("files", "")
+
+        # CF 模擬：未過驗證先給 gate；另可依機率插入 gate / 1020
+        if st.gate_ms and (not self._cleared() or st.roll(st.gate_rate)):
+            return self._html(page_gate(st), 403)
+        if st.roll(st.block_rate):
+            return self._html(page_block(), 403)
+
+        if module == "login_page":
+            return self._html(page_login())
+        if module == "member":
+            return self._html(page_orders(st))
+        if module == "net_booking" and files == "booking_place":
+            if q.get("StepFlag") == "3":
+                return self._step3(q.get("A", ""), q.get("B", ""))
+            if q.get("D"):
+                d2 = int(q["D2"]) if q.get("D2", "").isdigit() else 0
+                return self._html(page_booking(st, q["D"], d2))
+            return self._html(page_home())
+        return self._html(page_home())
+
+    def _step3(self, a: str, b: str):
+        self._json(self.state.book(a, b))
+
+
+def make_server(state: SiteState, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    handler = type("BoundHandler", (Handler,), {"state": state})
+    return ThreadingHTTPServer((host, port), handler)
+
+def _parse_release(args) -> float:
+    server_now = time.time() + args.clock_skew
+    if args.release:
+        hh, mm, ss = map(int, args.release.split(":"))
+        now = datetime.fromtimestamp(server_now)
+        dt = now.replace(hour=hh, minute=mm, second=ss, microsecond=0)
+        if dt < now - timedelta(hours=12): dt += timedelta(days=1)
+        return dt.timestamp()
+    return server_now + args.release_in
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="本機 MT02.aspx 替身伺服器")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--release", help="開放預約時刻 HH:MM:SS（伺服器時鐘）")
+    ap.add_argument("--release-in", type=float, default=0.0, help="幾秒後開放（未給 --release 時使用）")
+    ap.add_argument("--gate-ms", type=int, default=0, help="模擬 CF『Checking your browser』停留毫秒；0=不模擬")
+    ap.add_argument("--gate-rate", type=float, default=0.0, help="已通過驗證後仍再次出現 gate 的機率")
+    ap.add_argument("--block-rate", type=float, default=0.0, help="回應 1020/Access denied 的機率")
+    ap.add_argument("--cf-fail-rate", type=float, default=0.0, help="Step3Action 回應『驗證失敗』的機率")
+    ap.add_argument("--occupied-rate", type=float, default=0.3, help="開放後已被他人預約的比例")
+    ap.add_argument("--latency-ms", type=int, default=0, help="每個頁面/預約請求的伺服器延遲")
+    ap.add_argument("--clock-skew", type=float, default=0.0, help="伺服器時鐘比本機快幾秒（可為負），測試 clock_sync 校正")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    state = SiteState(_parse_release(args), gate_ms=args.gate_ms, gate_rate=args.gate_rate,
+                      block_rate=args.block_rate, cf_fail_rate=args.cf_fail_rate,
+                      occupied_rate=args.occupied_rate, latency_ms=args.latency_ms, seed=args.seed,
+                      clock_skew=args.clock_skew)
+    srv = make_server(state, args.host, args.port)
+    root = f"http://{args.host}:{args.port}"
+    print(f"替身站已啟動：{root}/MT02.aspx")
+    print(f"開放時刻（伺服器時鐘）：{datetime.fromtimestamp(state.release_at):%Y-%m-%d %H:%M:%S}"
+          + (f"，伺服器時鐘偏移 {args.clock_skew:+.3f} s" if args.clock_skew else ""))
+    print(f"GUI 指向替身：BOOKING_SITE={root} python app.py（加 BOOKING_HEADLESS=1 可無頭）")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# tests/conftest.py
+# 共用 fixture：假站點擊後立即有結果，縮短「沒有對話框」時的等待；每個測試視為一次新的執行（清空跨回合索引）。
+
+import pytest
+
+from booking import CLICK_POLICY, PAGE_FPS, SLOT_INDEX
+
+
+@pytest.fixture(autouse=True)
+def fresh_run():
+    old = CLICK_POLICY.outcome_timeout
+    CLICK_POLICY.outcome_timeout = 0.2
+    SLOT_INDEX.reset()
+    PAGE_FPS.pages.clear()
+    PAGE_FPS.scans = PAGE_FPS.skipped = 0
+    yield
+    CLICK_POLICY.outcome_timeout = old
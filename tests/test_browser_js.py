@@ -0,0 +1,217 @@
+# tests/test_browser_js.py
+# 頁內 JS 的真瀏覽器檢查：FakeDriver 只以 Python 模擬各腳本的結果，這裡用無頭 Chrome 真的執行
+# _CF_PROBE_JS、_MATCH_JS、_READY_WAIT_JS、_PRE_CLICK_JS/_OUTCOME_JS 與 _DIALOG_HOOK_JS/_DIALOG_DRAIN_JS，
+# 頁面來自 standin_server（本機 HTTP）與 bench/pages 的存檔頁面，並確認 FakeDriver 的模擬與真的結果一致。
+#
+#   python -m pytest -q tests/test_browser_js.py        # 找不到 Chrome/chromedriver 時整個模組略過
+#   BOOKING_TEST_CHROME=/path/to/chrome python -m pytest -q tests/test_browser_js.py
+
+import glob
+import os
+import shutil
+import threading
+
+import pytest
+
+from booking import _MATCH_JS, BASE_URL, click_all_bookings_on_page, snapshot_page
+from browser_cf import (SITE_ROOT, _CF_PROBE_JS, _READY_WAIT_JS, drain_dialogs, get_cf_state_xpath,
+                        install_dialog_hook, probe_page)
+from fake_driver import FakeDriver
+from slots import SlotFilter, parse_booking_html
+from standin_server import SiteState, make_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAGES_DIR = os.path.join(os.path.dirname(HERE), "bench", "pages")
+CHROME_BINS = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+CHROME_PATHS = (r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+                r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+                "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome")
+quiet = lambda s: None
+
+
+def _chrome_binary():
+    env = os.environ.get("BOOKING_TEST_CHROME")
+    if env:
+        return env
+    for b in CHROME_BINS:
+        p = shutil.which(b)
+        if p:
+            return p
+    return next((p for p in CHROME_PATHS if os.path.exists(p)), None)
+
+pytestmark = pytest.mark.skipif(_chrome_binary() is None, reason="找不到 Chrome（可設 BOOKING_TEST_CHROME）")
+
+
+@pytest.fixture(scope="module")
+def drv():
+    from selenium import webdriver
+    opts = webdriver.ChromeOptions()
+    opts.binary_location = _chrome_binary()
+    for a in ("--headless=new", "--disable-gpu", "--no-sandbox", "--window-size=1280,900"):
+        opts.add_argument(a)
+    try:
+        d = webdriver.Chrome(options=opts)
+    except Exception as e:
+        pytest.skip(f"無法啟動 Chrome：{e}")
+    yield d
+    d.quit()
+
+@pytest.fixture(scope="module")
+def site():
+    """本機替身站（已開放、不模擬 CF）；回傳 (SiteState, 根網址)。"""
+    st = SiteState(release_at=0.0, occupied_rate=0.3, seed=7)
+    srv = make_server(st, port=0)
+    srv.RequestHandlerClass.log_message = lambda *a: None
+    th = threading.Thread(target=srv.serve_forever, daemon=True)
+    th.start()
+    yield st, f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+def _url(root: str, date: str, d2: int = 4) -> str:
+    return BASE_URL.replace(SITE_ROOT, root).format(date=date, d2=d2)
+
+
+# ---- CF 探測 ----
+EXPECTED_STATE = {"block.html": "fail", "gate.html": "gate", "success.html": "success", "normal.html": "none"}
+
+@pytest.mark.parametrize("name", sorted(EXPECTED_STATE))
+def test_cf_probe_matches_xpath(drv, name):
+    drv.get("file://" + os.path.join(PAGES_DIR, name))
+    r = drv.execute_script(_CF_PROBE_JS)
+    assert r["state"] == EXPECTED_STATE[name]
+    assert r["state"] == get_cf_state_xpath(drv), "單次 JS 探測與舊版逐條 XPath 判斷不同"
+    assert probe_page(drv)["state"] == r["state"]
+
+def test_saved_pages_present():
+    assert {os.path.basename(p) for p in glob.glob(os.path.join(PAGES_DIR, "*.html"))} >= set(EXPECTED_STATE)
+
+
+# ---- 快照（_MATCH_JS）與 FakeDriver 模擬一致 ----
+@pytest.mark.parametrize("flt", [SlotFilter.compile("19:00", "21:00", True, True, False), SlotFilter()],
+                         ids=["19-21_AB", "all"])
+def test_match_js_agrees_with_fake(drv, site, flt):
+    st, root = site
+    url = _url(root, "2025/11/01")
+    drv.get(url)
+    real = drv.execute_script(_MATCH_JS, *flt.js_args(), None)
+    fake = FakeDriver(st)
+    fake.get(BASE_URL.format(date="2025/11/01", d2=4))
+    sim = fake.execute_script(_MATCH_JS, *flt.js_args(), None)
+    assert real["total"] == sim["total"]
+    assert sorted(map(tuple, real["all"])) == sorted(map(tuple, sim["all"]))
+    assert sorted(tuple(s[1:]) for s in real["slots"]) == sorted(tuple(s[1:]) for s in sim["slots"])
+    assert all(s[0] is not None for s in real["slots"]), "WebElement 應隨同一次回應帶回"
+    again = drv.execute_script(_MATCH_JS, *flt.js_args(), real["fp"])
+    assert again["same"] and again["fp"] == real["fp"]
+
+
+# ---- 事件驅動就緒等待 ----
+def test_ready_wait_immediate(drv, site):
+    _, root = site
+    drv.get(_url(root, "2025/11/02"))
+    r = drv.execute_async_script(_READY_WAIT_JS, 2000)
+    assert r["how"] == "immediate" and r["buttons"] and r["table"]
+
+def test_ready_wait_fires_on_mutation(drv, site):
+    _, root = site
+    drv.get(_url(root, "2025/11/02"))
+    drv.execute_script("const t = document.querySelector('table.booking'), p = t.parentNode;"
+                       "t.remove(); setTimeout(() => p.appendChild(t), 200);")
+    r = drv.execute_async_script(_READY_WAIT_JS, 3000)
+    assert r["how"] == "event" and r["buttons"]
+    assert 150 <= r["waited_ms"] < 2000
+
+def test_ready_wait_times_out_without_table(drv):
+    drv.get("file://" + os.path.join(PAGES_DIR, "gate.html"))
+    r = drv.execute_async_script(_READY_WAIT_JS, 300)
+    assert r["how"] == "timeout" and r["state"] == "gate" and not r["buttons"]
+
+
+# ---- 點擊：逐顆（_PRE_CLICK_JS/_OUTCOME_JS）與頁內攔截器（_DIALOG_HOOK_JS/_DIALOG_DRAIN_JS） ----
+@pytest.mark.parametrize("hook,date", [(False, "2025/11/03"), (True, "2025/11/04")], ids=["one_by_one", "hooked"])
+def test_click_real_page(drv, site, hook, date):
+    st, root = site
+    flt = SlotFilter.compile("19:00", "20:00", True, True, False)
+    if hook:
+        assert install_dialog_hook(drv)
+    drv.get(_url(root, date))
+    want = {(s.a, s.b) for s, _ in snapshot_page(drv, flt).slots}
+    assert want, "替身頁應有符合的場地"
+    n = click_all_bookings_on_page(drv, flt, log_fn=quiet, dialog_hook=hook)
+    assert n == len(want)
+    assert want <= st.booked, "有符合的場地沒有訂到"
+    drv.refresh()
+    assert not ({(s.a, s.b) for s, _ in snapshot_page(drv, flt).slots} & want), "訂到的場地仍可點"
+
+def test_dialog_hook_drain(drv, site):
+    st, root = site
+    assert install_dialog_hook(drv)
+    drv.get(_url(root, "2025/11/05"))
+    (slot, img), *_ = snapshot_page(drv, SlotFilter()).slots
+    img.click()
+    r = drain_dialogs(drv, wait_s=3.0)
+    assert r["hook"] and not r["unresolved"]
+    kinds = [(d["kind"], d["slot"], d["cls"]) for d in r["dialogs"]]
+    assert kinds == [("confirm", f"{slot.a},{slot.b}", "ok"), ("swal", f"{slot.a},{slot.b}", "ok")]
+    assert (slot.a, slot.b) in st.booked
+
+
+# ---- 篩選規則一致性：頁內 _MATCH_JS vs. slots.py（parse_booking_html + SlotFilter.matches） ----
+# 兩邊是同一套規則的兩份實作（頁內版只把符合的按鈕傳回），規則修改時這組測試會抓出不一致。
+PARITY_FILTERS = {
+    "all": SlotFilter(),
+    "19-21_AB": SlotFilter.compile("19:00", "21:00", True, True, False),
+    "16-19_cross_d2": SlotFilter.compile("16:00", "19:00"),
+    "11-13_C_cross_d2": SlotFilter.compile("11:00", "13:00", False, False, True),
+    "from_20_B": SlotFilter.compile("20:00", None, False, True, False),
+    "to_09_AC": SlotFilter.compile(None, "09:00", True, False, True),
+    "exact_21": SlotFilter.compile("21:00", "21:00", True, True, True),
+}
+
+# 邊界情況：個位數小時與非整點、rowspan 沿用時間、只有代號的場地名、含空白的「羽球 C 場」、
+# 解析不到 id 的 Step3Action()、沒有時間也沒有場地代號的列、大寫副檔名、已預約格
+EDGE_PAGE = """<!DOCTYPE html><html><head><meta charset="UTF-8"><title>edge</title></head><body>
+<table class="layout"><tr><td><table class="booking" border="1">
+<tr><th>時段</th><th>場地</th><th>費用</th><th>操作</th></tr>
+<tr><td rowspan="2">7:30~8:30</td><td>A場</td><td>NT$ 300</td><td><img name="PlaceBtn" src="img/place01.png" onclick="Step3Action(7301,20251101)"></td></tr>
+<tr><td>B場</td><td>NT$ 300</td><td><img src="img/PLACE01.png" onclick="Step3Action(7302, 20251101)"></td></tr>
+<tr><td>12:00~13:00</td><td>羽球 C 場</td><td>NT$ 400</td><td><img name="PlaceBtn" src="img/place01.png" onclick="Step3Action()"></td></tr>
+<tr><td>場地</td><td>NT$ 400</td><td><img name="PlaceBtn" src="img/place01.png" onclick="Step3Action(9901,20251101)"></td></tr>
+<tr><td>13:00~14:00</td><td>羽球A場</td><td>NT$ 400</td><td><img src="img/place02.png" title="已預約"></td></tr>
+<tr><td>20:00~21:00</td><td>羽球B場</td><td>NT$ 400</td><td><img name="PlaceBtn" src="img/place01.png" onclick="Step3Action(20002,20251101)"></td></tr>
+<tr><td>21:00~22:00</td><td>羽球C場</td><td>NT$ 400</td><td><img name="PlaceBtn" src="img/place01.png" onclick="Step3Action(21003,20251101)"></td></tr>
+</table></td></tr></table></body></html>"""
+
+def _python_matches(html: str, url: str, flt: SlotFilter) -> list:
+    return sorted(((s.time, s.court, s.a, s.b) for s in parse_booking_html(html, url=url) if s.available and flt.matches(s)),
+                  key=repr)
+
+def _js_matches(drv, flt: SlotFilter) -> list:
+    r = drv.execute_script(_MATCH_JS, *flt.js_args(), None)
+    return sorted(((t, court, a, b) for _, t, court, a, b in r["slots"]), key=repr)
+
+def _parity_pages(drv, site, tmp_path):
+    """(網址, HTML)：替身站 D2=1~4（跨大時段）、bench/pages 的存檔預約頁、邊界情況頁。"""
+    _, root = site
+    for d2 in (1, 2, 3, 4):
+        url = _url(root, "2025/11/06", d2)
+        drv.get(url)
+        yield url, drv.page_source
+    for name in ("normal.html", "success.html"):
+        path = os.path.join(PAGES_DIR, name)
+        drv.get("file://" + path)
+        with open(path, encoding="utf-8") as f:
+            yield drv.current_url, f.read()
+    edge = tmp_path / "edge.html"
+    edge.write_text(EDGE_PAGE, encoding="utf-8")
+    drv.get(edge.as_uri())
+    yield drv.current_url, EDGE_PAGE
+
+def test_match_js_parity_with_slots(drv, site, tmp_path):
+    checked = 0
+    for url, html in _parity_pages(drv, site, tmp_path):
+        for name, flt in PARITY_FILTERS.items():
+            assert _js_matches(drv, flt) == _python_matches(html, url, flt), f"{url} 篩選 {name}：頁內與 slots.py 結果不同"
+            checked += 1
+    assert checked == 7 * len(PARITY_FILTERS)
@@ -0,0 +1,41 @@
+# tests/test_cli.py
+# cli.parse_config：設定檔的型別依 core.RunConfig 檢查，錯誤訊息要指出是哪一個鍵；範例設定檔要能讀。
+
+import os
+
+import pytest
+
+from cli import parse_config, read_config
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.example.toml")
+BASE = {"dates": ["2025/10/03"], "d2": [4]}
+
+
+def test_example_config_parses():
+    cfg, bopts = parse_config(read_config(EXAMPLE))
+    assert cfg.d2_list == [4] and cfg.courts == "AB" and cfg.interval == 2.0
+    assert cfg.single_tab
+
+def test_shorthands_and_numbers():
+    cfg, _ = parse_config({"run": dict(BASE, dates="2025/10/03", courts=["a", "b"], max_wait_min=8)})
+    assert cfg.dates == ["2025/10/03"] and cfg.courts == "AB" and cfg.max_wait_min == 8
+
+@pytest.mark.parametrize("section,key,value", [
+    ("run", "interval", "2"),
+    ("run", "d2", 4),
+    ("run", "d2", ["4"]),
+    ("run", "courts", 1),
+    ("run", "warmup", "yes"),
+    ("run", "cf_fail_retries", 2.5),
+    ("run", "heap_mb", True),
+    ("browser", "headless", 1),
+])
+def test_wrong_type_names_the_key(section, key, value):
+    d = {"run": dict(BASE)}
+    d.setdefault(section, {})[key] = value
+    with pytest.raises(ValueError, match=rf"{section}\.{key} 應為"):
+        parse_config(d)
+
+def test_unknown_key():
+    with pytest.raises(ValueError, match="run.intervall"):
+        parse_config({"run": dict(BASE, intervall=2)})
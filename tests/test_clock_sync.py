@@ -0,0 +1,52 @@
+# tests/test_clock_sync.py
+# clock_sync.py：對本機替身站（--clock-skew）估計時鐘偏移，以及 sleep_until / TimedStart 的觸發與中止。
+#
+#   python -m pytest -q tests/test_clock_sync.py
+
+import threading
+import time
+
+import pytest
+
+from clock_sync import ClockEstimate, TimedStart, estimate_server_offset, sleep_until
+from standin_server import SiteState, make_server
+
+SKEW_S = 1.37
+
+
+@pytest.fixture(scope="module")
+def skewed_site():
+    """時鐘比本機快 SKEW_S 秒的替身站；回傳根網址。"""
+    srv = make_server(SiteState(release_at=0.0, clock_skew=SKEW_S), port=0)
+    srv.RequestHandlerClass.log_message = lambda *a: None
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_estimate_server_offset(skewed_site):
+    est = estimate_server_offset(skewed_site + "/MT02.aspx", samples=5, timeout=2.0)
+    assert est is not None and est.samples == 5
+    assert abs(est.offset - SKEW_S) <= est.uncertainty + 0.05, est.describe()
+    assert est.uncertainty < 0.5, "對準秒邊界取樣後區間應已收斂"
+
+def test_estimate_unreachable_returns_none():
+    assert estimate_server_offset("http://127.0.0.1:9/MT02.aspx", samples=2, timeout=0.5) is None
+
+def test_sleep_until_fires_on_time():
+    err = sleep_until(time.time() + 0.1)
+    assert err is not None and 0 <= err < 0.005
+
+def test_sleep_until_stops_on_event():
+    ev = threading.Event()
+    threading.Timer(0.05, ev.set).start()
+    t0 = time.perf_counter()
+    assert sleep_until(time.time() + 5.0, ev) is None
+    assert time.perf_counter() - t0 < 1.0
+
+def test_timed_start_fires_ahead_by_offset_and_half_rtt():
+    ts = TimedStart(start_ts=1000.0, probe_url="", log=lambda s: None)
+    assert ts.fire_at == 1000.0
+    ts.estimate = ClockEstimate(offset=1.5, uncertainty=0.01, rtt=0.2, samples=3)
+    assert ts.fire_at == pytest.approx(1000.0 - 1.5 - 0.1)
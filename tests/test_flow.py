@@ -0,0 +1,271 @@
+# tests/test_flow.py
+# 不開瀏覽器的流程回歸測試：以 fake_driver.FakeDriver（記憶體內假 WebDriver）跑
+# wait_until_ready_with_cf、click_all_bookings_on_page、單分頁輪詢回合、core.BookingCore 的多分頁與停止、錄製→重播，
+# 檢查結果（訂到的場地、每頁往返次數上限、停止延遲），並回傳量到的數字（bench/bench_fake_driver.py 以此列印）。
+#
+#   python -m pytest -q tests/test_flow.py
+#
+# 注意：FakeDriver 不執行頁內 JS，這裡只驗證 Python 端的流程；頁內腳本由 tests/test_browser_js.py 以真的 Chrome 驗證。
+
+import asyncio
+import glob
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from booking import SLOT_INDEX, build_urls, click_all_bookings_on_page
+from budget import Budget
+from browser_cf import LEAN_BLOCKED_URLS, install_dialog_hook, set_lean_load, wait_until_ready_with_cf
+from core import BookingCore, RunConfig
+from fake_driver import FakeDevTools, FakeDriver
+from replay import replay
+from scheduler import UrlScheduler
+from slots import SlotFilter
+from standin_server import SiteState
+
+DATES = ["2025/10/01", "2025/10/02", "2025/10/03", "2025/10/04"]
+FLT = SlotFilter.compile("19:00", "21:00", True, True, False)
+LATENCIES = (0.0, 2.0)          # 每次 WebDriver 呼叫延遲 ms
+PAGES = 4
+quiet = lambda s: None
+
+
+def _expected(drv: FakeDriver) -> set:
+    """目前分頁上符合 FLT 且可預約的 (a, b)。"""
+    return {(e.slot.a, e.slot.b) for e in drv._tab().elements if e.available and FLT.matches(e.slot)}
+
+class _Browser:
+    """BookingCore 需要的 BrowserManager 介面，包住同一個 FakeDriver。"""
+    def __init__(self, drv, dt=None): self.drv, self.dt = drv, dt
+    def ensure_launched(self, log=print): return self.drv
+    def devtools(self, log=print): return self.dt
+    def enable_dialog_hook(self, log=print): return install_dialog_hook(self.drv)
+    def set_lean_load(self, on, log=print): return set_lean_load(self.drv, on) and on
+    def quit(self): self.drv.quit()
+
+
+# ---- 情境（斷言 + 回傳量測值） ----
+def run_wait(latency_ms: float) -> dict:
+    st = SiteState(release_at=0.0, gate_ms=60, seed=1)
+    drv = FakeDriver(st, latency_ms=latency_ms)
+    url = build_urls(DATES[:1], [4])[0]
+    drv.get(url)
+    drv.reset_counts()
+    t0 = time.perf_counter()
+    ok = wait_until_ready_with_cf(drv, target_url=url, max_wait=5, log=quiet, mode="event")
+    ms = (time.perf_counter() - t0) * 1000
+    assert ok, "驗證頁通過後應就緒"
+    assert ms < 60 + 250, f"就緒花了 {ms:.0f} ms（驗證頁只擋 60 ms）"
+    assert drv.round_trips <= 4, f"往返 {drv.round_trips} 次：{dict(drv.calls)}"
+    return dict(ms=ms, round_trips=drv.round_trips)
+
+def run_click(latency_ms: float, pages: int, hook: bool) -> dict:
+    st = SiteState(release_at=0.0, occupied_rate=0.3, seed=7)
+    drv = FakeDriver(st, latency_ms=latency_ms)
+    SLOT_INDEX.reset()              # 每個情境視為一次新的執行
+    if hook:
+        assert install_dialog_hook(drv)
+    per_page_ms, per_page_rt = [], []
+    for url in build_urls(DATES, [4])[:pages]:
+        drv.get(url)
+        want = _expected(drv)
+        drv.reset_counts()
+        t0 = time.perf_counter()
+        n = click_all_bookings_on_page(drv, FLT, log_fn=quiet, dialog_hook=hook)
+        per_page_ms.append((time.perf_counter() - t0) * 1000)
+        per_page_rt.append(drv.round_trips)
+        assert n == len(want), f"點擊 {n} 顆，應為 {len(want)}"
+        assert want <= st.booked, "有符合的場地沒有訂到"
+        # 往返上限：快照 1 次；逐顆模式每顆 捲動+點擊+alert+accept+結果 = 5；整批模式每顆 2 次 + 取回 1 次
+        limit = 1 + (2 * n + 1 if hook else 5 * n)
+        assert drv.round_trips <= limit, f"往返 {drv.round_trips} 次，超過上限 {limit}：{dict(drv.calls)}"
+    return dict(pages=len(per_page_ms), ms=sum(per_page_ms) / len(per_page_ms),
+                round_trips=sum(per_page_rt) / len(per_page_rt))
+
+def run_round(latency_ms: float, pages: int) -> dict:
+    """App.worker 單分頁模式的一個回合：逐頁 get → 等就緒 → 點擊。"""
+    st = SiteState(release_at=0.0, occupied_rate=0.5, cf_fail_rate=0.1, seed=3)
+    drv = FakeDriver(st, latency_ms=latency_ms)
+    urls = build_urls(DATES, [3, 4])[:pages]
+    SLOT_INDEX.reset()
+    t0 = time.perf_counter()
+    total = 0
+    for url in urls:
+        drv.get(url)
+        if wait_until_ready_with_cf(drv, target_url=url, max_wait=5, log=quiet):
+            total += click_all_bookings_on_page(drv, FLT, log_fn=quiet)
+    ms = (time.perf_counter() - t0) * 1000
+    assert total > 0, "整個回合沒有點到任何場地"
+    return dict(pages=len(urls), ms=ms, clicks=total, round_trips=drv.round_trips)
+
+def run_tabs(latency_ms: float, pages: int) -> dict:
+    """多分頁模式跑約 1 秒：逐一切換 vs. DevTools 背景查詢，兩者訂到的場地要相同、背景查詢的切換要更少。"""
+    dates = (DATES * pages)[:pages]
+    urls = build_urls(dates, [4])
+    out = {}
+    for bg in (False, True):
+        st = SiteState(release_at=0.0, occupied_rate=0.3, seed=11)
+        drv = FakeDriver(st, latency_ms=latency_ms)
+        want = set()
+        for url in urls:
+            drv.get(url)
+            want |= _expected(drv)
+        drv = FakeDriver(st, latency_ms=latency_ms)
+        cfg = RunConfig(dates, [4], "19:00", "21:00", courts="AB", interval=0.05, max_wait_min=1.0 / 60,
+                        single_tab=False, warmup=False, background_probe=bg)
+        core = BookingCore(_Browser(drv, FakeDevTools(drv) if bg else None), cfg, log=quiet, trace_dir=None)
+        asyncio.run(core.run())
+        assert want <= st.booked, f"{'背景查詢' if bg else '逐一切換'}：有符合的場地沒有訂到"
+        out[bg] = (core.total_clicks, drv.calls["switch_window"], core.switches_avoided)
+    (c0, s0, _), (c1, s1, saved) = out[False], out[True]
+    assert c0 == c1, f"點擊數不同：逐一切換 {c0}、背景查詢 {c1}"
+    assert s1 < s0, f"背景查詢切換 {s1} 次，未少於逐一切換 {s0} 次"
+    return dict(pages=len(urls), switches=s0, switches_bg=s1, avoided=saved, clicks=c1)
+
+def run_replay(latency_ms: float, hook: bool) -> dict:
+    """錄製一次單分頁執行（含驗證失敗回彈），再以 replay.py 全速重播：點擊決策要與錄製時一致。"""
+    with tempfile.TemporaryDirectory() as d:
+        st = SiteState(release_at=0.0, occupied_rate=0.3, cf_fail_rate=0.15, seed=4)
+        drv = FakeDriver(st, latency_ms=latency_ms)
+        cfg = RunConfig(DATES[:2], [4], "19:00", "21:00", courts="AB", interval=0.05, max_wait_min=0.5 / 60,
+                        warmup=False, dialog_hook=hook, record=True)
+        asyncio.run(BookingCore(_Browser(drv), cfg, log=quiet, trace_dir=d).run())
+        path, = glob.glob(os.path.join(d, "rec-*.jsonl.gz"))
+        res = replay(path)
+    assert res["pages"] > 0 and res["rec_clicks"] > 0, f"錄製內容不足：{res}"
+    assert res["differ"] == 0, f"重播決策與錄製不同：{res['diffs']}"
+    return res
+
+def run_stop(latency_ms: float) -> dict:
+    """core.BookingCore 卡在驗證頁等待時按停止：量測 停止→取消、停止→閒置，並確認瀏覽器有被關閉。"""
+    st = SiteState(release_at=0.0, gate_ms=60_000, seed=1)
+    drv = FakeDriver(st, latency_ms=latency_ms)
+    core = BookingCore(_Browser(drv), RunConfig(DATES[:2], [4], "19:00", "21:00", warmup=False),
+                       log=quiet, trace_dir=None)
+    th = threading.Thread(target=lambda: asyncio.run(core.run()))
+    th.start()
+    time.sleep(0.3)
+    core.close(quit_browser=True)
+    th.join(2.0)
+    cancel, idle = core.timings.get("stop_cancel", 0.0), core.timings["stop_idle"]
+    assert not th.is_alive(), "停止後核心仍在執行"
+    assert drv.calls["quit"] == 1, "沒有關閉瀏覽器"
+    assert cancel < 100, f"停止→取消 {cancel:.0f} ms"
+    assert idle < 150 + 2 * latency_ms, f"停止→閒置 {idle:.0f} ms"
+    return dict(cancel_ms=cancel, idle_ms=idle)
+
+
+# ---- pytest ----
+@pytest.mark.parametrize("latency_ms", LATENCIES)
+def test_wait_ready(latency_ms):
+    run_wait(latency_ms)
+
+@pytest.mark.parametrize("hook", [False, True], ids=["one_by_one", "hooked"])
+@pytest.mark.parametrize("latency_ms", LATENCIES)
+def test_click_page(latency_ms, hook):
+    run_click(latency_ms, PAGES, hook)
+
+@pytest.mark.parametrize("latency_ms", LATENCIES)
+def test_single_tab_round(latency_ms):
+    run_round(latency_ms, PAGES)
+
+@pytest.mark.parametrize("latency_ms", LATENCIES)
+def test_multi_tab_background_probe(latency_ms):
+    run_tabs(latency_ms, PAGES)
+
+def test_multi_tab_hooks_every_tab():
+    """CDP 設定只對單一分頁有效：多分頁模式新開的分頁與回收重開的分頁都要各自掛上攔截器、套用精簡載入。"""
+    urls = build_urls(DATES[:3], [4])
+    st = SiteState(release_at=0.0, occupied_rate=0.3, seed=11)
+    drv = FakeDriver(st)
+    want = set()
+    for url in urls:
+        drv.get(url)
+        want |= _expected(drv)
+    drv = FakeDriver(st)
+    cfg = RunConfig(DATES[:3], [4], "19:00", "21:00", courts="AB", interval=0.05, max_wait_min=1.0 / 60,
+                    single_tab=False, warmup=False, dialog_hook=True, lean_load=True, long_run=True, heap_mb=20.0,
+                    metrics_every_s=0.0)
+    asyncio.run(BookingCore(_Browser(drv), cfg, log=quiet, trace_dir=None).run())
+    assert drv.calls["close"] > 0, "heap 門檻應觸發分頁回收"
+    assert set(drv._tabs) <= drv._hooked, f"有分頁沒有攔截器：{set(drv._tabs) - drv._hooked}"
+    assert all(drv.blocked.get(h) == LEAN_BLOCKED_URLS for h in drv._tabs), f"有分頁沒有精簡載入：{drv.blocked}"
+    assert want <= st.booked
+
+@pytest.mark.parametrize("hook", [False, True], ids=["one_by_one", "hooked"])
+def test_record_replay(hook):
+    run_replay(0.0, hook)
+
+def test_record_background_probes():
+    """多分頁背景查詢也要錄到（probe / reload），replay 彙整次數；點擊決策照樣一致。"""
+    with tempfile.TemporaryDirectory() as d:
+        st = SiteState(release_at=0.0, occupied_rate=0.3, seed=11)
+        drv = FakeDriver(st)
+        cfg = RunConfig(DATES[:3], [4], "19:00", "21:00", courts="AB", interval=0.05, max_wait_min=1.0 / 60,
+                        single_tab=False, warmup=False, stale_sec=0.2, record=True)
+        asyncio.run(BookingCore(_Browser(drv, FakeDevTools(drv)), cfg, log=quiet, trace_dir=d).run())
+        path, = glob.glob(os.path.join(d, "rec-*.jsonl.gz"))
+        res = replay(path)
+    pr = res["probes"]
+    assert pr["n"] > 0 and pr["reloads"] > 0 and pr["states"].get("ready"), pr
+    assert res["differ"] == 0, res["diffs"]
+
+@pytest.mark.parametrize("latency_ms", LATENCIES)
+def test_stop_while_waiting(latency_ms):
+    run_stop(latency_ms)
+
+def test_wait_with_budget_does_not_repoll():
+    """帶著執行預算時，頁內等待仍以 EVENT_SLICE_S 為一片，不會每 0.1 秒重新掛上 execute_async_script。"""
+    drv = FakeDriver(SiteState(release_at=0.0, gate_ms=60_000, seed=1))
+    url = build_urls(DATES[:1], [4])[0]
+    drv.get(url)
+    drv.reset_counts()
+    assert not wait_until_ready_with_cf(drv, target_url=url, max_wait=1.0, log=quiet, mode="event",
+                                        budget=Budget(60))
+    assert drv.calls["execute_async_script"] <= 2, dict(drv.calls)       # 舊版每 0.1 秒一次 ≈ 10 次
+
+class _LossyState(SiteState):
+    """每個場地第一次送出都等不到伺服器回應（book 回傳 None），之後照常。"""
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.lost = set()
+
+    def book(self, a, b):
+        if (a, b) not in self.lost:
+            self.lost.add((a, b))
+            return None
+        return super().book(a, b)
+
+@pytest.mark.parametrize("hook", [False, True], ids=["one_by_one", "hooked"])
+def test_no_response_is_retried(hook):
+    """逾時沒有結果的場地不記進 SLOT_INDEX，同一頁再點一次要能訂到。"""
+    st = _LossyState(release_at=0.0, occupied_rate=0.3, seed=7)
+    drv = FakeDriver(st)
+    if hook:
+        assert install_dialog_hook(drv)
+    drv.get(build_urls(DATES[:1], [4])[0])
+    want = _expected(drv)
+    assert want
+    assert click_all_bookings_on_page(drv, FLT, log_fn=quiet, dialog_hook=hook) == len(want)
+    assert not st.booked and not SLOT_INDEX.state, "沒有回應的場地不應記為已點"
+    assert click_all_bookings_on_page(drv, FLT, log_fn=quiet, dialog_hook=hook) == len(want)
+    assert want <= st.booked
+
+@pytest.mark.parametrize("hook", [False, True], ids=["one_by_one", "hooked"])
+def test_no_response_is_not_done(hook):
+    """整批逾時沒有回應：stats 記為 unresolved，排程器不把此頁當成已訂完，照 base_s 回來重試。"""
+    st = _LossyState(release_at=0.0, occupied_rate=0.3, seed=7)
+    drv = FakeDriver(st)
+    if hook:
+        assert install_dialog_hook(drv)
+    url = build_urls(DATES[:1], [4])[0]
+    drv.get(url)
+    page = {}
+    n = click_all_bookings_on_page(drv, FLT, log_fn=quiet, dialog_hook=hook, stats=page, page_key=url)
+    assert n and page["clicked"] == 0 and page["unresolved"] == n, page
+    sched = UrlScheduler([url], base_s=0.5)
+    assert sched.record(url, 100.0, ready=True, now=0.0, **page) == 0.5
+    assert not sched.stats[url].done and sched.due(now=0.5) == [url]
@@ -0,0 +1,44 @@
+# tests/test_logsink.py
+# logsink.py：佇列式日誌的上下文欄位、pump 批次與 JSONL 檔，以及 emit 對一般 log 函式的降級。
+#
+#   python -m pytest -q tests/test_logsink.py
+
+import json
+
+from logsink import LogSink, emit
+
+
+def test_context_fields_merge_into_records():
+    sink = LogSink()
+    sink.set_context(round=3, url="u1")
+    sink("a", phase="ready")
+    sink.set_context(url=None)
+    sink("b", round=4)
+    a, b = sink.pump()
+    assert a.fields == {"round": 3, "url": "u1", "phase": "ready"}
+    assert b.fields == {"round": 4}, "呼叫時帶的欄位優先；值為 None 的上下文要移除"
+
+def test_pump_respects_batch_and_writes_jsonl(tmp_path):
+    path = tmp_path / "logs" / "run.jsonl"
+    sink = LogSink(batch=2)
+    sink.open_file(str(path))
+    seen = []
+    sink.add_listener(lambda rec: seen.append(rec.msg))
+    for i in range(3):
+        sink(f"m{i}", i=i)
+    assert [r.msg for r in sink.pump()] == ["m0", "m1"]
+    assert [r.msg for r in sink.pump()] == ["m2"]
+    assert sink.pump() == []
+    sink.close_file()
+    rows = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(r["msg"], r["i"]) for r in rows] == [("m0", 0), ("m1", 1), ("m2", 2)]
+    assert seen == ["m0", "m1", "m2"]
+
+def test_emit_passes_fields_only_to_structured_logs():
+    plain, sink = [], LogSink()
+    emit(plain.append, "x", phase="ready")
+    emit(sink, "y", phase="ready")
+    emit(None, "z")
+    assert plain == ["x"]
+    rec, = sink.pump()
+    assert (rec.msg, rec.fields) == ("y", {"phase": "ready"})
@@ -0,0 +1,25 @@
+# tests/test_metrics.py
+# metrics.TabHealth：heap / DOM 節點門檻，以及整個 Chrome 的 RSS 依分頁數放大後才回收。
+#
+#   python -m pytest -q tests/test_metrics.py
+
+from metrics import TabHealth, Thresholds
+
+SAMPLE = {"heap_mb": 40.0, "heap_total_mb": 60.0, "nodes": 900, "documents": 1, "listeners": 0}
+
+
+def test_heap_and_nodes_over_limit():
+    health = TabHealth(Thresholds(heap_mb=32.0, nodes=60000, every_s=0.0))
+    assert "JS heap" in health.record("tab-0", SAMPLE)
+    health = TabHealth(Thresholds(heap_mb=256.0, nodes=500, every_s=0.0))
+    assert "DOM 節點" in health.record("tab-0", SAMPLE)
+
+def test_browser_rss_scales_with_tabs():
+    """4 個分頁共用 1000 MB（每分頁上限 300 MB）：沒有一個分頁該回收；只剩 3 個分頁時才超過。"""
+    health = TabHealth(Thresholds(rss_per_tab_mb=300.0, every_s=0.0))
+    handles = [f"tab-{i}" for i in range(4)]
+    for _ in range(3):
+        for h in handles:
+            assert health.record(h, SAMPLE, rss_mb=1000.0, tabs=len(handles)) is None
+    assert health.recycled == 0
+    assert "Chrome RSS" in health.record("tab-0", SAMPLE, rss_mb=1000.0, tabs=3)
@@ -0,0 +1,42 @@
+# tests/test_scheduler.py
+# scheduler.UrlScheduler：沒變化的頁面退避、尚未開放的頁面與開放時刻前後不退避（已訂完的頁面也一樣）。
+
+from scheduler import HOT_LEAD_S, HOT_TAIL_S, UrlScheduler
+
+URLS = ["u1", "u2"]
+
+
+def _idle(sched: UrlScheduler, url: str, n: int, now: float, **kw) -> float:
+    """同一頁連續 n 次載入都沒變化，回傳最後的週期。"""
+    for _ in range(n):
+        period = sched.record(url, 100.0, ready=True, total=3, matched=0, now=now, **kw)
+    return period
+
+def test_unchanged_pages_back_off():
+    sched = UrlScheduler(URLS, base_s=2.0)
+    assert _idle(sched, "u1", 10, now=0.0) == sched.max_s > 2.0
+
+def test_matching_and_closed_pages_keep_base_period():
+    sched = UrlScheduler(URLS, base_s=2.0)
+    assert sched.record("u1", 100.0, ready=True, total=3, matched=2, now=0.0) == 2.0
+    assert _idle(sched, "u2", 10, now=0.0, closed=True) == 2.0
+
+def test_no_backoff_around_release():
+    sched = UrlScheduler(URLS, base_s=2.0, release_at=1000.0)
+    assert _idle(sched, "u1", 10, now=1000.0 - HOT_LEAD_S) == 2.0
+    assert _idle(sched, "u1", 10, now=1000.0 + HOT_TAIL_S) == 2.0
+    assert _idle(sched, "u1", 10, now=1000.0 + HOT_TAIL_S + 1) == sched.max_s
+
+def test_backoff_never_sleeps_past_release_window():
+    sched = UrlScheduler(URLS, base_s=2.0, release_at=1000.0)
+    now = 1000.0 - HOT_LEAD_S - 3.0
+    assert _idle(sched, "u1", 10, now=now) == sched.max_s
+    assert sched.stats["u1"].next_due == 1000.0 - HOT_LEAD_S
+    assert "u1" in sched.due(now=1000.0 - HOT_LEAD_S)
+
+def test_done_pages_keep_base_period_when_hot_or_closed():
+    sched = UrlScheduler(URLS, base_s=2.0, release_at=1000.0)
+    done = dict(total=3, matched=2, clicked=2)
+    assert sched.record("u1", 100.0, ready=True, now=1000.0, **done) == 2.0
+    assert sched.record("u2", 100.0, ready=True, now=0.0, closed=True, **done) == 2.0
+    assert sched.record("u1", 100.0, ready=True, now=1000.0 + HOT_TAIL_S + 1, **done) == sched.max_s
@@ -0,0 +1,31 @@
+# tests/test_slots.py
+# slots.py 的離線解析（不需要瀏覽器）：rowspan 沿用時間、場地文字、Step3Action 參數、可預約判斷、網址的 D/D2。
+#
+#   python -m pytest -q tests/test_slots.py
+
+from slots import Slot, parse_booking_html
+
+URL = "https://example.invalid/MT02.aspx?module=net_booking&files=booking_place&StepFlag=2&PT=1&D=2025/11/01&D2=4"
+
+# 19:00 時段以 rowspan 跨兩列（A 場可預約、B 場已預約），20:00 時段 A/C 場可預約
+SNAP_PAGE = """<!DOCTYPE html><html><head><meta charset="UTF-8"><title>snapshot</title></head><body>
+<table class="booking" border="1">
+<tr><th>時段</th><th>場地</th><th>費用</th><th>操作</th></tr>
+<tr><td rowspan="2">19:00~20:00</td><td>羽球A場</td><td>NT$ 400</td><td><img name="PlaceBtn" src="img/place01.png" onclick="Step3Action(19001,20251101)"></td></tr>
+<tr><td>羽球B場</td><td>NT$ 400</td><td><img src="img/place02.png" title="已預約"></td></tr>
+<tr><td>20:00~21:00</td><td>羽球A場</td><td>NT$ 400</td><td><img name="PlaceBtn" src="img/place01.png" onclick="Step3Action(20001,20251101)"></td></tr>
+<tr><td>20:00~21:00</td><td>羽球C場</td><td>NT$ 400</td><td><img name="PlaceBtn" src="img/place01.png" onclick="Step3Action(20003,20251101)"></td></tr>
+</table></body></html>"""
+
+
+def test_parse_rowspan_courts_and_ids():
+    assert parse_booking_html(SNAP_PAGE, url=URL) == [
+        Slot("2025/11/01", 4, "19:00", "羽球A場", "19001", "20251101", True),
+        Slot("2025/11/01", 4, "19:00", "羽球B場", None, None, False),
+        Slot("2025/11/01", 4, "20:00", "羽球A場", "20001", "20251101", True),
+        Slot("2025/11/01", 4, "20:00", "羽球C場", "20003", "20251101", True),
+    ]
+
+def test_tables_without_slot_images_are_ignored():
+    page = "<table><tr><td>19:00~20:00</td><td>羽球A場</td><td>NT$ 400</td></tr></table>"
+    assert parse_booking_html(page, url=URL) == []
@@ -0,0 +1,21 @@
+# tests/test_startup.py
+# 冷啟動：import app 時不應載入 selenium / undetected_chromedriver（由視窗畫出後的背景執行緒載入）。
+#
+#   python -m pytest -q tests/test_startup.py
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("selenium", "undetected_chromedriver", "browser_cf", "booking")
+
+
+def test_app_import_defers_browser_modules():
+    pytest.importorskip("tkinter")
+    code = f"import sys, app; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == "", f"import app 時已載入：{out.stdout.strip()}"
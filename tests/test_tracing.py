@@ -0,0 +1,61 @@
+# tests/test_tracing.py
+# tracing.py：巢狀 span 的深度/外層/網址沿用、JSONL 追蹤檔、彙整表，以及沒有 Tracer 時的空物件。
+#
+#   python -m pytest -q tests/test_tracing.py
+
+import json
+
+from tracing import Tracer, span, traced
+
+URL = "https://example.invalid/MT02.aspx?module=net_booking&files=booking_place&StepFlag=2&PT=1&D=2025/11/01&D2=4"
+
+
+def test_nested_spans_write_jsonl(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tr = Tracer(str(path)).start()
+    try:
+        with span("page", url=URL):
+            with span("load"):
+                pass
+            with span("click_page") as sp:
+                sp.set(result="ok")
+    finally:
+        tr.stop()
+    rows = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(r["name"], r["depth"], r["parent"]) for r in rows] == [
+        ("load", 1, "page"), ("click_page", 1, "page"), ("page", 0, None)]
+    assert all(r["url"] == URL for r in rows), "子階段應沿用外層網址"
+    assert rows[1]["result"] == "ok"
+    lines = tr.summary_lines()
+    assert lines[0].startswith("📊 各階段耗時") and any("2025/11/01 D2=4" in line for line in lines)
+
+def test_span_records_errors():
+    tr = Tracer().start()
+    try:
+        with span("confirm"):
+            raise ValueError
+    except ValueError:
+        pass
+    finally:
+        tr.stop()
+    assert len(tr.by_phase["confirm"]) == 1
+
+def test_no_tracer_is_a_no_op():
+    calls = []
+
+    @traced("snapshot")
+    def snap():
+        calls.append(1)
+        return "ok"
+
+    with span("page", url=URL) as sp:
+        sp.set(result="x")
+        assert snap() == "ok"
+    assert calls == [1]
+    tr = Tracer().start()
+    try:
+        snap()
+    finally:
+        tr.stop()
+    assert len(tr.by_phase["snapshot"]) == 1 and snap() == "ok"
+    assert len(tr.by_phase["snapshot"]) == 1, "stop() 之後不應再記錄"
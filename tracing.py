@@ -0,0 +1,189 @@
+# tracing.py
+# 輕量階段計時：可巢狀的 span（載入、CF 等待、快照、點擊、確認…），每次執行寫一份 JSONL 追蹤檔，
+# 結束時彙整各階段與各網址的 p50/p95/max。
+#
+#   tracer = Tracer("logs/trace-20250101-120000.jsonl"); tracer.start()
+#   with span("load", url=url): drv.get(url)
+#   tracer.stop(); for line in tracer.summary_lines(): log(line)
+#
+# 沒有啟用中的 Tracer 時，span() 只回傳共用的空物件，開銷可忽略。
+# 追蹤檔有上限：每份最多 TRACE_MAX_BYTES（超過就停寫，彙整照算），資料夾內只保留最近 TRACE_KEEP 份（prune_traces）。
+
+import contextvars
+import functools
+import glob
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from slots import url_params
+
+_current: "contextvars.ContextVar[Optional[Tracer]]" = contextvars.ContextVar("booking_tracer", default=None)
+
+# 彙整表列出的階段順序（其餘依名稱排在後面）
+PHASE_ORDER = ("round", "page", "switch", "load", "wait_ready", "cf_bounce", "click_page", "snapshot",
+               "click", "confirm", "click_batch", "drain", "recycle")
+
+TRACE_KEEP = int(os.environ.get("BOOKING_TRACE_KEEP") or 20)   # 保留最近幾份 trace-*.jsonl
+TRACE_MAX_BYTES = 20 * 1024 * 1024                             # 單份追蹤檔上限
+
+
+class Span:
+    __slots__ = ("tracer", "name", "fields", "t0", "ms", "depth", "parent")
+
+    def __init__(self, tracer: "Tracer", name: str, fields: dict):
+        self.tracer = tracer
+        self.name = name
+        self.fields = fields
+        self.ms = 0.0
+
+    def set(self, **fields) -> None:
+        """補上結果欄位（例如 result='cf_fail'），結束時一併寫出。"""
+        self.fields.update(fields)
+
+    def __enter__(self) -> "Span":
+        stack = self.tracer._stack
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        if stack and "url" not in self.fields and "url" in stack[-1].fields:
+            self.fields["url"] = stack[-1].fields["url"]     # 子階段沿用外層網址
+        stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, et, ev, tb) -> None:
+        self.ms = (time.perf_counter() - self.t0) * 1000
+        if et is not None:
+            self.fields.setdefault("error", et.__name__)
+        stack = self.tracer._stack
+        if stack and stack[-1] is self:
+            stack.pop()
+        self.tracer._record(self)
+
+
+class _NullSpan:
+    __slots__ = ()
+    def set(self, **fields) -> None: pass
+    def __enter__(self): return self
+    def __exit__(self, et, ev, tb): return None
+
+_NULL = _NullSpan()
+
+
+def span(name: str, **fields):
+    """目前執行緒有啟用中的 Tracer 才計時；否則回傳空物件。"""
+    tr = _current.get()
+    return Span(tr, name, fields) if tr is not None else _NULL
+
+def traced(name: str):
+    """函式版 span：整個呼叫算一個階段，回傳值若為字串/布林/數字會記成 result。"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            tr = _current.get()
+            if tr is None:
+                return fn(*a, **kw)
+            with Span(tr, name, {}) as sp:
+                out = fn(*a, **kw)
+                if isinstance(out, (str, bool, int, float)):
+                    sp.fields["result"] = out
+                return out
+        return wrapper
+    return deco
+
+
+def _pct(xs: List[float], q: float) -> float:
+    """最近秩百分位（xs 已排序）。"""
+    return xs[min(len(xs) - 1, max(0, math.ceil(q * len(xs)) - 1))]
+
+def _url_label(url: str) -> str:
+    date, d2 = url_params(url)
+    return f"{date} D2={d2}" if date else url
+
+class Tracer:
+    """一次執行的追蹤器：start() 後，同一執行緒內的 span 都會記錄並寫入 path（JSONL）。"""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = TRACE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.truncated = False
+        self._fh = None
+        self._stack: List[Span] = []
+        self._token = None
+        self._t_start = 0.0
+        self.by_phase: Dict[str, List[float]] = defaultdict(list)
+        self.by_url: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+
+    def start(self) -> "Tracer":
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._fh = open(self.path, "w", encoding="utf-8")
+        self._t_start = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def stop(self) -> None:
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _record(self, sp: Span) -> None:
+        self.by_phase[sp.name].append(sp.ms)
+        url = sp.fields.get("url")
+        if url:
+            self.by_url[(url, sp.name)].append(sp.ms)
+        if self._fh is not None:
+            rec = {"name": sp.name, "t_ms": round((sp.t0 - self._t_start) * 1000, 1), "ms": round(sp.ms, 1),
+                   "depth": sp.depth, "parent": sp.parent}
+            rec.update(sp.fields)
+            line = json.dumps(rec, ensure_ascii=False, default=str) + "\n"
+            self.written += len(line.encode("utf-8"))
+            if self.written > self.max_bytes:
+                self.truncated = True           # 超過上限：停寫檔案，記憶體內彙整照常
+                self._fh.close()
+                self._fh = None
+                return
+            self._fh.write(line)
+
+    def summary_lines(self) -> List[str]:
+        """各階段、各網址（整頁 page 與其載入/等待/點擊）的 p50/p95/max（ms）。"""
+        if not self.by_phase:
+            return []
+        def row(label, xs):
+            xs = sorted(xs)
+            return f"  {label:<28}{len(xs):>6}{_pct(xs, .5):>9.0f}{_pct(xs, .95):>9.0f}{xs[-1]:>9.0f}"
+        head = f"  {'':<28}{'次數':>4}{'p50':>9}{'p95':>9}{'max':>9}"
+        names = sorted(self.by_phase, key=lambda n: (PHASE_ORDER.index(n) if n in PHASE_ORDER else len(PHASE_ORDER), n))
+        out = ["📊 各階段耗時（ms）", head] + [row(n, self.by_phase[n]) for n in names]
+        urls = sorted({u for u, _ in self.by_url})
+        if urls:
+            out += ["📊 各網址耗時（ms）", head]
+            for u in urls:
+                for n in ("page", "load", "wait_ready", "click_page"):
+                    xs = self.by_url.get((u, n))
+                    if xs:
+                        out.append(row(_url_label(u) if n == "page" else f"  └ {n}", xs))
+        if self.path:
+            out.append(f"  追蹤檔：{self.path}"
+                       + (f"（超過 {self.max_bytes // (1024 * 1024)} MB，之後未寫入）" if self.truncated else ""))
+        return out
+
+
+def prune_traces(folder: str, keep: int = TRACE_KEEP) -> int:
+    """只保留 folder 內最近 keep 份 trace-*.jsonl（檔名含時間戳，依名稱排序）；回傳刪除份數。"""
+    files = sorted(glob.glob(os.path.join(folder, "trace-*.jsonl")))
+    n = 0
+    for p in files[:max(0, len(files) - keep)]:
+        try:
+            os.remove(p)
+            n += 1
+        except OSError:
+            pass
+    return n